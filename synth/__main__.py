@@ -34,8 +34,13 @@ import random   # Might want to replace this with something we control
 from datetime import datetime
 from common import ISO8601
 from common import importer
+from common import background_writer
 from events import Events
 import device_factory
+import shard
+import random_streams
+import checkpoint
+import profiler
 import zeromq_rx, zeromq_tx
 from directories import *
 # import faulthandler
@@ -46,6 +51,7 @@ g_get_sim_time = None   # TODO: Find a more elegant way for logging to discover
 g_slack_webhook = None
 g_instance_name = None
 g_asked_to_pause = False
+g_asked_to_toggle_profiler = False
 
 # Set up Python logger to report simulated time
 def in_simulated_time(self,secs=None):
@@ -252,11 +258,14 @@ def get_params():
     return params    
 
 def signal_catcher(signal_received, frame):
-    global g_asked_to_pause
+    global g_asked_to_pause, g_asked_to_toggle_profiler
     logging.info("Received signal "+str(signal_received))
     if signal_received == signal.SIGUSR1:
         logging.info("Pause requested")
         g_asked_to_pause = True
+    elif signal_received == signal.SIGUSR2:
+        logging.info("Profiler toggle requested")
+        g_asked_to_toggle_profiler = True   # Done by the main loop, since toggling joins a thread and writes files
     logging.info("FYI Python stack is:")
     tb = traceback.format_list(traceback.extract_stack())
     for L in tb:
@@ -271,6 +280,7 @@ def main():
     global g_get_sim_time
     global g_instance_name
     global g_asked_to_pause
+    global g_asked_to_toggle_profiler
     
     def incomingAsyncEvent(packet):    # CAUTION: Called asynchronously from the ZeroMQ rx thread
         logging.info("incoming async event "+str(packet))
@@ -297,6 +307,9 @@ def main():
 
     params = get_params()
     assert g_instance_name is not None, "Instance name has not been defined, but this is required for logfile naming"
+    shard.init(params)
+    background_writer.configure(params)
+    g_instance_name = shard.instance_name(g_instance_name)  # Each shard needs its own logfiles
     init_logging(params)
     logging.info("*** Synth starting at real time "+str(datetime.now())+" ***")
     logging.info("Parameters:\n"+json.dumps(params, sort_keys=True, indent=4, separators=(',', ': ')))
@@ -304,8 +317,14 @@ def main():
 
     install_signal_catcher()
 
+    if shard.is_coordinator():
+        ok = shard.coordinate(g_instance_name, params)
+        post_to_slack("Finished shards " + ["with errors", "OK"][ok])
+        sys.exit([1, 0][ok])
+
     Tstart = time.time()                # Human time
     Tstart_process = time.process_time()   # Time CPU usage
+    random_streams.init(params)
     random.seed(12345)  # Ensure reproduceability
 
     if not "client" in params:
@@ -318,10 +337,13 @@ def main():
         return
     engine = importer.get_class('engine', params['engine']['type'])(params['engine'], client.enter_interactive, event_count_callback)
     g_get_sim_time = engine.get_now_no_lock
+    shard.install(engine)
 
     if not "events" in params:
         logging.warning("No events defined")
     events = Events(client, engine, g_instance_name, params, params["events"])
+    checkpoint.init(params, g_instance_name, engine, client, events)
+    profiler.init(g_instance_name, params, engine, client)
 
     zeromq_rx.init(incomingAsyncEvent, emit_logging=True)
     zeromq_tx.init(emit_logging=True)
@@ -339,6 +361,10 @@ def main():
                 logging.info("Paused")
                 signal.pause()  # Suspend this process. Receiving any signal will then cause us to resume
                 logging.info("Resuming")
+            if g_asked_to_toggle_profiler:
+                g_asked_to_toggle_profiler = False
+                profiler.toggle()
+        checkpoint.save_at_end(params)
         device_factory.close()
     except:
         err_str = traceback.format_exc()  # Report any exception, but continue to clean-up anyway
@@ -346,9 +372,11 @@ def main():
         logging.error(err_str)
 
     logging.info("Simulation ends")
+    profiler.close()
     logging.info("Ending device logging ("+str(len(device_factory.g_devices))+" devices were emulated)")
     events.flush()
     client.close()
+    background_writer.close()
 
     logging.info("Elapsed real time: " + str(int(time.time()-Tstart))+" seconds.")
     logging.info("CPU time used: " + str(int(time.process_time()-Tstart_process))+" seconds.")
@@ -380,11 +408,4 @@ if __name__ == "__main__":
 
     check_install()
 
-    if False:    # Profile
-        import cProfile, pstats
-        cProfile.run('main()', 'profiling')
-        p = pstats.Stats('profiling')
-        p.sort_stats('cumulative').print_stats(30)
-        sys.exit(1)    # ALways return an error exit code when profiling, because profiling removes any exit code, so any self tests will pass incorrectly
-    else:
-        main()
+    main()  # To profile, add a "profile" section to the parameters (see profiler.py)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Benchmark
+=========
+Measures the throughput of Synth's core event loop (the sim engine, Events and device code) on synthetic scenarios,
+with output going to the null client so that no client I/O is measured.
+
+Run from the same directory as you'd run Synth::
+
+    python3 synth/benchmark.py [<scenario> ...] ['{"devices" : 1000, "ticks" : 1440}']
+
+If no scenarios are named, all are run. Each scenario creates <devices> devices which each tick once a minute
+for <ticks> minutes of simulated time. Scenarios are:
+
+    heartbeat       Devices which just send a heartbeat
+    variables       Devices with a mix of timefunction-driven variables
+    comms_buffer    Heartbeating devices with unreliable, buffered comms
+    explode         Heartbeating devices, with an explode_factor
+    queue           Just the engine's event queue: <devices> minimal devices each with one pending event, to measure
+                    the memory used per pending event (reported as "bytes_per_pending_event"), e.g. with {"devices" : 1000000}
+
+Each scenario runs in a fresh process, so that peak RSS and module state are its own. The results are printed as JSON::
+
+    {
+        "params" : { "devices" : ..., "ticks" : ..., "write_log" : ...},
+        "python" : "3.x.y",
+        "results" : {
+            "<scenario>" : {
+                "events" : number of device updates emitted to the client (after any explosion),
+                "events_per_sec" : events / run phase time,
+                "peak_rss_kb" : peak resident set size of the process,
+                "phases" : { "setup" : s, "run" : s, "close" : s },
+                "cpu_s" : CPU time used by the whole run
+            }, ...
+        }
+    }
+
+Other parameters:
+
+    "write_log" : true to also write the .evt file (as a normal run does) - it's off by default so that only the event loop is measured
+    "event_log_format" : "evt" or "binary" (see events.py), if write_log is true
+    "out" : filename to also write the JSON results into, e.g. to compare releases
+"""
+#
+# Copyright (c) 2019 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys, os
+import json
+import time
+import random
+import logging
+import platform
+import resource
+import subprocess
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # So we can be run from anywhere, as Synth's modules import each other top-level
+from common import ISO8601
+from common import importer
+from events import Events
+import device_factory
+
+DEFAULT_PARAMS = {
+    "devices" : 1000,
+    "ticks" : 1440,
+    "write_log" : False,
+    "event_log_format" : "evt",
+    "out" : None
+}
+
+START_TIME = "2020-01-01T00:00:00"
+TICK_S = 60
+EXPLODE_FACTOR = 10
+
+HEARTBEAT = { "heartbeat" : { "interval" : "PT1M" } }
+
+SCENARIOS = {
+    "queue" : {},   # Special-cased, see run_queue()
+    "heartbeat" : {
+        "functions" : HEARTBEAT
+    },
+    "variables" : {
+        "functions" : {
+            "variable" : [
+                { "name" : "temperature", "timefunction" : { "sinewave" : { "period" : "PT1H", "sample_period" : "PT1M", "randomise_phase_by" : "$id" } } },
+                { "name" : "kWh", "timefunction" : { "count" : { "interval" : "PT1M", "increment" : 0.1 } } },
+                { "name" : "occupied", "timefunction" : { "mix" : { "operator" : "and", "timefunctions" : [
+                    { "pulsewave" : { "interval" : "PT24H" } },
+                    { "sinewave" : { "period" : "PT12H", "sample_period" : "PT1M" } } ] } } }
+            ]
+        }
+    },
+    "comms_buffer" : {
+        "functions" : dict(HEARTBEAT, comms = { "reliability" : 0.5, "period" : "PT1H", "has_buffer" : True })
+    },
+    "explode" : {
+        "functions" : HEARTBEAT,
+        "explode_factor" : EXPLODE_FACTOR
+    }
+}
+
+class MinimalDevice():
+    __slots__ = ["engine"]
+    def tick(self, arg):
+        self.engine.register_event_in(TICK_S, self.tick, self, self)
+
+def run_queue(params):
+    """Measure the memory and time used by the engine's event queue alone"""
+    n = params["devices"]
+    engine = importer.get_class("engine", "sim")({ "start_time" : START_TIME, "end_time" : None }, None, None)
+    devices = [MinimalDevice() for i in range(n)]
+    for d in devices:
+        d.engine = engine
+    t0 = time.time()
+    cpu0 = time.process_time()
+    tracemalloc.start()
+    m0 = tracemalloc.get_traced_memory()[0]
+    for (i, d) in enumerate(devices):
+        engine.register_event_at(engine.get_now() + i % TICK_S, d.tick, d, d)
+    m1 = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t1 = time.time()
+    for i in range(n * params["ticks"]):
+        engine.next_event()
+    t2 = time.time()
+    run_s = t2 - t1
+    return {
+        "events" : n * params["ticks"],
+        "events_per_sec" : n * params["ticks"] / run_s if run_s > 0 else None,
+        "bytes_per_pending_event" : (m1 - m0) / n,
+        "peak_rss_kb" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "phases" : { "setup" : t1 - t0, "run" : run_s, "close" : 0.0 },
+        "cpu_s" : time.process_time() - cpu0
+    }
+
+def scenario_params(name, params):
+    """Build a complete set of Synth parameters for one benchmark scenario"""
+    spec = SCENARIOS[name]
+    start = ISO8601.to_epoch_seconds(START_TIME)
+    end = ISO8601.epoch_seconds_to_ISO8601(start + params["ticks"] * TICK_S)
+    result = {
+        "client" : { "type" : "null" },
+        "engine" : { "type" : "sim", "start_time" : START_TIME, "end_time" : end },
+        "write_log" : params["write_log"],
+        "event_log_format" : params["event_log_format"],
+        "events" : [ {
+            "repeats" : params["devices"],
+            "action" : { "create_device" : { "functions" : spec["functions"] } }
+        } ]
+    }
+    if "explode_factor" in spec:
+        result["explode_factor"] = spec["explode_factor"]
+    return result
+
+def run_one(name, params):
+    """Run one scenario in this process, returning its results"""
+    if name == "queue":
+        return run_queue(params)
+    synth_params = scenario_params(name, params)
+
+    t0 = time.time()
+    cpu0 = time.process_time()
+    random.seed(12345)
+    client = importer.get_class("client", "null")("benchmark_"+name, synth_params, synth_params["client"], None)
+    count = [0]
+    def update_device(device_id, t, properties):
+        count[0] += 1
+        return True
+    def update_device_exploded(batch):
+        count[0] += len(batch)
+    client.update_device = update_device    # Count everything that reaches the client
+    client.update_device_exploded = update_device_exploded
+    engine = importer.get_class("engine", "sim")(synth_params["engine"], client.enter_interactive, None)
+    events = Events(client, engine, "benchmark_"+name, synth_params, synth_params["events"])
+
+    t1 = time.time()
+    while engine.events_to_come():
+        engine.next_event()
+        client.tick(engine.get_now())
+
+    t2 = time.time()
+    device_factory.close()
+    events.flush()
+    client.close()
+    t3 = time.time()
+
+    run_s = t2 - t1
+    return {
+        "events" : count[0],
+        "events_per_sec" : count[0] / run_s if run_s > 0 else None,
+        "peak_rss_kb" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,   # Linux reports this in KB
+        "phases" : { "setup" : t1 - t0, "run" : run_s, "close" : t3 - t2 },
+        "cpu_s" : time.process_time() - cpu0
+    }
+
+def get_params(argv):
+    names = []
+    params = DEFAULT_PARAMS.copy()
+    for arg in argv:
+        if arg.startswith("{"):
+            params.update(json.loads(arg))
+        else:
+            assert arg in SCENARIOS, "Unknown scenario '"+arg+"', must be one of "+str(list(SCENARIOS.keys()))
+            names.append(arg)
+    if not names:
+        names = list(SCENARIOS.keys())
+    return (names, params)
+
+def main(argv):
+    (names, params) = get_params(argv)
+    results = {}
+    for name in names:
+        logging.info("Benchmarking "+name+" with "+str(params["devices"])+" devices x "+str(params["ticks"])+" ticks")
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--one", name, json.dumps(params)], stdout=subprocess.PIPE, check=True)
+        results[name] = json.loads(out.stdout.decode("utf-8").strip().split("\n")[-1])
+        logging.info("  {:,.0f} events/s".format(results[name]["events_per_sec"]))
+    report = json.dumps({ "params" : params, "python" : platform.python_version(), "results" : results }, indent=4, sort_keys=True)
+    print(report)
+    if params["out"] is not None:
+        open(params["out"], "wt").write(report)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    if len(sys.argv) > 1 and sys.argv[1] == "--one":
+        logging.getLogger().setLevel(logging.WARNING)   # Keep the engine's own logging out of the measurement
+        result = run_one(sys.argv[2], json.loads(sys.argv[3]))
+        print(json.dumps(result))
+    else:
+        main(sys.argv[1:])
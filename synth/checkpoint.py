@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Checkpoint
+==========
+Save the whole state of a simulation part-way through, and later resume from it, so that e.g. a long historical
+pre-roll needn't be re-run before every live run::
+
+    "checkpoint_at" : "2020-01-01T00:00:00",    # Save a checkpoint when the simulation reaches this time ("end" saves it when the simulation ends)
+    "checkpoint_file" : "pre_roll",             # (optional) Name of the checkpoint in ../synth_logs/ (default: <instance>.checkpoint)
+    "resume_from" : "pre_roll"                  # Start from this checkpoint, instead of from the start of the scenario
+
+To resume, run the same scenario again (so the same device types, events and client) with a later end_time, plus "resume_from".
+The checkpoint replaces all of the scenario's events, so the simulation carries on exactly where it left off, and its
+output is that of the original simulation from that point on.
+
+A checkpoint contains:
+    . The engine's queue of pending events
+    . All devices, including their timefunctions and private random number generators
+    . Models
+    . Class-level state of device, timefunction and model classes (e.g. Basic.myRandom, or Variable.device_indices)
+    . The state of the random module
+    . Queries, pipeline stages and the event count
+    . Whatever the client returns from get_checkpoint() (e.g. the filesystem client's events so far, for its CSV file)
+
+It's a pickle, except that the engine, the client, composite device classes and the functions defined inside Events
+(such as the update callback which every device holds) are stored by name, and on resuming are bound to those of the new simulation.
+
+Limitations:
+    . Sharded simulations can't be checkpointed, nor can worker pipeline stages
+    . Any other functions which are local to some other function can't be saved, so a checkpoint can't be taken
+      while such an event is pending (e.g. a model's delayed device creation). This gives an error rather than a bad checkpoint.
+"""
+#
+# Copyright (c) 2019 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import random
+import pickle
+import importlib
+import logging
+from common import conftime
+from common import importer
+from common import ISO8601
+from common import rng
+import device_factory
+import pipeline
+import shard
+from directories import *
+
+VERSION = 2
+CLASS_STATE_TYPES = (bool, int, float, str, list, dict, set, tuple, random.Random, rng.Stream)  # Class attributes of these types are saved
+
+g_events = None
+g_engine = None
+g_client = None
+g_filename = None
+
+class Pickler(pickle.Pickler):
+    def __init__(self, f, engine, client, events):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.engine = engine
+        self.client = client
+        self.callable_names = {id(fn) : name for (name, fn) in events.callables.items()}
+
+    def persistent_id(self, obj):
+        if obj is self.engine:
+            return "engine"
+        if obj is self.client:
+            return "client"
+        name = self.callable_names.get(id(obj))
+        if name is not None:
+            return ("callable", name)
+        if type(obj) is type and obj.__name__ == "compositeDeviceClass":
+            return ("class", obj.class_names)
+        return None
+
+class Unpickler(pickle.Unpickler):
+    def __init__(self, f, engine, client, events):
+        super().__init__(f)
+        self.engine = engine
+        self.client = client
+        self.events = events
+
+    def persistent_load(self, pid):
+        if pid == "engine":
+            return self.engine
+        if pid == "client":
+            return self.client
+        (kind, name) = pid
+        if kind == "callable":
+            return self.events.callables[name]
+        if kind == "class":
+            return device_factory.compose_class(name)
+        raise pickle.UnpicklingError("Unknown reference in checkpoint: "+repr(pid))
+
+def checkpoint_filename(params, instance_name):
+    return LOG_DIR + params.get("checkpoint_file", instance_name + ".checkpoint")
+
+def stateful_classes():
+    """All classes defined by loaded device, timefunction and model modules"""
+    modules = list(importer.modules.values()) + [sys.modules["devices.basic"]]
+    for mod in modules:
+        for obj in list(vars(mod).values()):
+            if type(obj) is type and obj.__module__ == mod.__name__:
+                yield obj
+
+def get_class_state():
+    state = {}
+    for cls in stateful_classes():
+        attrs = {}
+        for (name, value) in vars(cls).items():
+            if not (name.startswith("__") and name.endswith("__")) and isinstance(value, CLASS_STATE_TYPES):
+                attrs[name] = value
+        state[(cls.__module__, cls.__qualname__)] = attrs
+    return state
+
+def restore_class_state(state):
+    for ((module_name, class_name), attrs) in state.items():
+        cls = getattr(importlib.import_module(module_name), class_name)    # Its module may not have been loaded yet by this simulation
+        for (name, value) in attrs.items():
+            setattr(cls, name, value)
+
+def init(params, instance_name, engine, client, events):
+    """Call once the simulation is set up. Resumes from a checkpoint, and/or schedules one to be saved, as the parameters ask."""
+    global g_events, g_engine, g_client, g_filename
+    if "resume_from" not in params and "checkpoint_at" not in params:
+        return
+    assert not shard.is_shard(), "Sharded simulations can't be checkpointed"
+    assert hasattr(engine, "get_checkpoint"), "This engine doesn't support checkpoints"
+    g_events = events
+    g_engine = engine
+    g_client = client
+    g_filename = checkpoint_filename(params, instance_name)
+    if "resume_from" in params:
+        resume(LOG_DIR + params["resume_from"])
+    at = params.get("checkpoint_at", "end")
+    if "checkpoint_at" in params and at != "end":
+        engine.register_event_at(conftime.richTime(at), save_event, None, None)
+
+def save_at_end(params):
+    """Call when the simulation ends"""
+    if params.get("checkpoint_at", None) == "end":
+        save()
+
+def save_event(_):
+    save()
+
+def save(filename=None):
+    filename = filename or g_filename
+    for s in g_events.pipeline.stages:
+        assert not isinstance(s, pipeline.WorkerStage), "Worker pipeline stages can't be checkpointed"
+    state = {
+        "version" : VERSION,
+        "engine" : g_engine.get_checkpoint(),
+        "devices" : device_factory.get_checkpoint(),
+        "classes" : get_class_state(),
+        "random" : random.getstate(),
+        "events" : g_events.get_checkpoint(),
+        "client" : g_client.get_checkpoint() }
+    logging.info("Saving checkpoint at "+ISO8601.epoch_seconds_to_ISO8601(g_engine.get_now())+" ("+str(g_engine.num_pending())+" events pending) to "+filename)
+    try:
+        with open(filename + ".tmp", "wb") as f:
+            Pickler(f, g_engine, g_client, g_events).dump(state)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        os.remove(filename + ".tmp")
+        logging.error("Can't save checkpoint, as the simulation holds something which can't be saved (e.g. a pending event whose function is local to another function): "+str(e))
+        raise
+    os.replace(filename + ".tmp", filename)    # So a checkpoint is never left partially-written
+
+def resume(filename):
+    logging.info("Resuming from checkpoint "+filename)
+    with open(filename, "rb") as f:
+        state = Unpickler(f, g_engine, g_client, g_events).load()
+    assert state["version"] == VERSION, "Checkpoint "+filename+" is from an incompatible version of Synth"
+    g_engine.restore_checkpoint(state["engine"])
+    device_factory.restore_checkpoint(state["devices"])
+    restore_class_state(state["classes"])
+    random.setstate(state["random"])
+    g_events.restore_checkpoint(state["events"])
+    g_client.resume_from_checkpoint(state["client"])
+    logging.info("Resumed at "+ISO8601.epoch_seconds_to_ISO8601(g_engine.get_now())+" with "+str(device_factory.num_devices())+" devices and "+str(g_engine.num_pending())+" events pending")
@@ -84,7 +84,7 @@ class Aws(Client):
         self.createDeviceType(DEFAULT_TYPENAME)  # Ensure type exists (inefficient!)
         response = self.iotClient.create_thing(thingName=device_id, thingTypeName=DEFAULT_TYPENAME)
         arn = response['thingArn']
-        self.update_device(device_id, time, properties)
+        self.update_device(device_id, time, dict(properties))   # properties is the device's own (not a dict, see common/property_store.py)
         return arn
 
     def update_device(self, device_id, time, properties):
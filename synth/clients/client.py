@@ -10,14 +10,33 @@ class Client:
 
     @abstractmethod
     def add_device(self, device_id, time, properties):
-        """Add a device (if exists then overwrite) and update its properties."""
+        """Add a device (if exists then overwrite) and update its properties.
+           <properties> are the device's own, so read-only, and a Mapping rather than a dict (take a dict() of them if you need one)."""
         pass
 
+    def add_devices(self, devices):
+        """Add many devices at once. <devices> is a list of (device_id, time, properties), as for add_device(). Clients with a bulk API can override this."""
+        for (device_id, time, properties) in devices:
+            self.add_device(device_id, time, properties)
+
     @abstractmethod
     def update_device(self, device_id, time, properties):
         """Update an existing device's properties (for some clients it's an error to update a device before calling add_device()"""
         pass
 
+    def update_device_exploded(self, batch):
+        """Update every device in an ExplodedBatch (see common/exploded.py). Clients can override this to handle the batch in one go."""
+        for (device_id, properties) in batch:
+            self.update_device(device_id, batch.time, properties)
+
+    def get_checkpoint(self):
+        """Return any state (which can be pickled) needed to resume from a checkpoint, or None. See checkpoint.py"""
+        return None
+
+    def resume_from_checkpoint(self, state):
+        """Restore the state returned by get_checkpoint()"""
+        pass
+
     @abstractmethod
     def get_device(self):
         """Get parameters for one device."""
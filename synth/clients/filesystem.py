@@ -17,6 +17,7 @@ The client accepts the following parameters
         "max_events_per_file" : N,  # Maximum number of events to emit per output file
         "timestamp_prefix" : false,  # If true then prefix filename with ISO8601 timestamp (so filenames will sort by timestamp order)
         "messages_prefix" : false,  # If true then prefix filename with the number of points the file contains
+        "compress" : false,  # If true then gzip the .json files (named .json.gz)
     }
 
 There are no client event actions specific to the Filesystem client.
@@ -65,10 +66,11 @@ class Filesystem(Client):
         self.merge_posts = params.get("merge_posts", False)
         logging.info("write_csv is "+str(self.write_csv))
         messages_prefix = params.get("messages_prefix", False)
+        compress = params.get("compress", False)
         if "max_events_per_file" in self.params:
-            self.json_stream = json_writer.Stream(instance_name, ts_prefix = ts_prefix, messages_prefix=messages_prefix, merge = self.merge_posts, max_events_per_file = self.params["max_events_per_file"])
+            self.json_stream = json_writer.Stream(instance_name, ts_prefix = ts_prefix, messages_prefix=messages_prefix, merge = self.merge_posts, max_events_per_file = self.params["max_events_per_file"], compress = compress)
         else:
-            self.json_stream = json_writer.Stream(instance_name, ts_prefix = ts_prefix, messages_prefix=messages_prefix, merge = self.merge_posts)
+            self.json_stream = json_writer.Stream(instance_name, ts_prefix = ts_prefix, messages_prefix=messages_prefix, merge = self.merge_posts, compress = compress)
 
     def add_device(self, device_id, time, properties):
         # self.update_device(device_id, time, properties) - NO, this will cause duplicate creation events to be written to JSON file
@@ -82,6 +84,18 @@ class Filesystem(Client):
         self.json_stream.write_event(properties)
         return True
 
+    def update_device_exploded(self, batch):
+        if self.write_csv:
+            for (device_id, properties) in batch:
+                evt2csv.insert_properties(self.events, properties)
+        self.json_stream.write_exploded(batch)
+
+    def get_checkpoint(self):
+        return self.events     # Events so far, for the CSV file
+
+    def resume_from_checkpoint(self, state):
+        self.events = state
+
     def get_device(self):
         return None
 
@@ -41,6 +41,9 @@ class Null(Client):
     def update_device(self, device_id, time, properties):
         return True
 
+    def update_device_exploded(self, batch):
+        pass
+
     def get_device(self):
         return None
 
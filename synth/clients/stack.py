@@ -22,6 +22,10 @@ class Stack(Client):
         for client in self.clients:
             client.add_device(device_id, time, properties)
 
+    def add_devices(self, devices):
+        for client in self.clients:
+            client.add_devices(devices)
+
     def update_device(self, device_id, time, properties):
         for client in self.clients:
             client.update_device(device_id, time, properties)
@@ -0,0 +1,155 @@
+"""Background writer
+Does file output on one background thread, so that a slow disk doesn't stall the simulation.
+
+Writes to a File are batched on the calling thread and handed over in chunks of "batch_size" characters (or bytes).
+Everything handed over is done strictly in order, on the one thread, so e.g. a file is always closed after its last write.
+Other slow work, like moving a finished file, can be done the same way with submit().
+
+Back-pressure: at most "queue_size" chunks can be waiting. When the queue is full, the simulation waits for the disk
+(and a warning is logged the first time) rather than using ever more memory.
+
+Flushing: File.flush(), File.close(wait=True) and drain() all wait until everything handed over so far has been written.
+Anything still waiting at exit is written by an atexit handler, but callers should drain() explicitly before relying on files.
+If the background thread hits an error, it does no further work and the error is re-raised on the next call from the simulation.
+
+Tune with a "background_writer" section in the parameters::
+
+    "background_writer" : {
+        "queue_size" : 1000,    # (optional) Max chunks waiting to be written
+        "batch_size" : 65536    # (optional) Characters (or bytes) to accumulate per chunk
+    }
+"""
+
+import threading
+import queue
+import gzip
+import atexit
+import logging
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 65536
+
+g_queue_size = DEFAULT_QUEUE_SIZE
+g_batch_size = DEFAULT_BATCH_SIZE
+g_queue = None
+g_thread = None
+g_error = None          # Exception raised on the background thread, if any
+g_times_blocked = 0     # How often the simulation has had to wait for a full queue
+
+def configure(params):
+    """Call before any files are written"""
+    global g_queue_size, g_batch_size
+    p = params.get("background_writer", {})
+    g_queue_size = p.get("queue_size", DEFAULT_QUEUE_SIZE)
+    g_batch_size = p.get("batch_size", DEFAULT_BATCH_SIZE)
+    assert g_queue_size > 0 and g_batch_size > 0, "background_writer queue_size and batch_size must be positive"
+
+def worker():
+    global g_error
+    while True:
+        job = g_queue.get()
+        try:
+            if job is None:
+                return
+            if g_error is None:
+                (fn, args) = job
+                fn(*args)
+        except Exception as e:
+            logging.error("Error in background writer: "+repr(e))
+            g_error = e
+        finally:
+            g_queue.task_done()
+
+def check_error():
+    if g_error is not None:
+        raise IOError("Background writer failed") from g_error
+
+def submit(fn, *args):
+    """Call fn(*args) on the background thread, after everything already submitted. Waits if the queue is full."""
+    global g_queue, g_thread, g_times_blocked
+    check_error()
+    if g_thread is None:
+        g_queue = queue.Queue(g_queue_size)
+        g_thread = threading.Thread(target=worker, name="background_writer", daemon=True)
+        g_thread.start()
+    try:
+        g_queue.put_nowait((fn, args))
+    except queue.Full:
+        if g_times_blocked == 0:
+            logging.warning("Background writer queue is full, so simulation is waiting for the disk")
+        g_times_blocked += 1
+        g_queue.put((fn, args))
+
+def drain():
+    """Wait until everything submitted so far has been done"""
+    if g_thread is not None:
+        g_queue.join()
+    check_error()
+
+def close():
+    """Drain, and stop the background thread. Any error will already have been logged, so isn't raised again."""
+    global g_queue, g_thread
+    if g_thread is None:
+        return
+    g_queue.put(None)
+    g_thread.join()
+    g_queue = None
+    g_thread = None
+    if g_times_blocked:
+        logging.info("Simulation waited for background writer "+str(g_times_blocked)+" times")
+
+atexit.register(close)
+
+class File():
+    """A write-only file, which is opened, written and closed on the background thread.
+       <compress> writes it with gzip (so give it a .gz filename)."""
+    def __init__(self, filename, file_mode="wt", compress=False):
+        self.filename = filename
+        self.empty = b"" if "b" in file_mode else ""
+        self.batch = []
+        self.batch_len = 0
+        self.file = None
+        submit(self._open, file_mode, compress)
+
+    def _open(self, file_mode, compress):
+        if compress:
+            self.file = gzip.open(self.filename, file_mode)
+        else:
+            self.file = open(self.filename, file_mode)
+
+    def _close(self, then):
+        self.file.close()
+        if then is not None:
+            then()
+
+    def write(self, s):
+        self.batch.append(s)
+        self.batch_len += len(s)
+        if self.batch_len >= g_batch_size:
+            self.submit_batch()
+
+    def submit_batch(self):
+        if self.batch:
+            data = self.empty.join(self.batch)
+            self.batch = []
+            self.batch_len = 0
+            submit(self.file_write, data)
+
+    def file_write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        """Wait until everything written so far is in the file"""
+        self.submit_batch()
+        submit(self.file_flush)
+        drain()
+
+    def file_flush(self):
+        self.file.flush()
+
+    def close(self, then=None, wait=False):
+        """Close the file, then call <then>() (both on the background thread). If <wait> then wait for this to be done."""
+        self.submit_batch()
+        submit(self._close, then)
+        if wait:
+            drain()
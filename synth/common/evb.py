@@ -0,0 +1,200 @@
+"""evb: A compact binary alternative to the .evt event log, which is quicker to write and to read back.
+
+    Select it with "event_log_format" : "binary" in the parameters, and the event log is then written
+    to <instance>.evb rather than <instance>.evt. The file is:
+
+        b"SYNTHEVB" + version byte
+        followed by records, each a one-byte tag and then:
+
+        "N" (name)      uint32 id, uint32 length, UTF-8 name     Interns a property name, before its first use
+        "C" (comment)   uint32 length, UTF-8 text                A comment line, e.g. "*** New simulation starting..."
+        "R" (reset)     (nothing)                                Forget all interned names (written when appending to an existing file)
+        "E" (event)     uint32 length of the rest, uint16 count, then <count> properties, each:
+                            uint32 name id, one-byte type, value
+
+    Value types are:
+        "n" null, "t" true, "f" false
+        "i" int64, "d" float64
+        "s" uint32 length, UTF-8 string
+        "j" uint32 length, UTF-8 text - anything else, as JSON (copied verbatim into the .evt text format)
+
+    All integers are little-endian. Events are written in the order they happen, just as in a .evt file.
+
+    With "event_log_compress" : true it is gzipped, and named .evb.gz.
+    To read one, use evt2csv.read_evb_file(), or convert it to a .evt file with:
+        python3 -m common.evb <filename>.evb     (run from the synth/ directory)
+"""
+
+import os
+import struct
+import gzip
+import json
+import logging
+try:
+    from . import background_writer
+except ImportError:  # Imported by a standalone utility
+    import background_writer
+
+MAGIC = b"SYNTHEVB"
+VERSION = 1
+
+U32 = struct.Struct("<I")
+NAME = struct.Struct("<cII")    # tag, id, length
+COUNT = struct.Struct("<H")
+INT = struct.Struct("<q")
+FLOAT = struct.Struct("<d")
+PROP_HEADER = struct.Struct("<Ic")  # name id, type
+
+INT_MIN = -2**63
+INT_MAX = 2**63 - 1
+
+class Writer():
+    """Writes on the background writer thread (see background_writer.py). <compress> gzips the file."""
+    def __init__(self, filename, file_mode="wb", compress=False):
+        appending = "a" in file_mode and os.path.exists(filename) and os.path.getsize(filename) > 0
+        self.file = background_writer.File(filename, file_mode, compress)
+        self.names = {}     # Property name -> id
+        if not appending:
+            self.file.write(MAGIC + bytes([VERSION]))
+        else:   # Appending, so we must start interning names afresh
+            self.file.write(b"R")
+
+    def name_id(self, name, out):
+        """Return id of <name>, appending its definition to <out> if it's new"""
+        nid = self.names.get(name)
+        if nid is None:
+            nid = len(self.names)
+            self.names[name] = nid
+            b = name.encode("utf-8")
+            out += NAME.pack(b"N", nid, len(b)) + b
+        return nid
+
+    def write_comment(self, text):
+        b = text.encode("utf-8")
+        self.file.write(b"C" + U32.pack(len(b)) + b)
+
+    def write_event(self, properties):
+        names = bytearray()
+        body = bytearray(COUNT.pack(len(properties)))
+        for (k, v) in properties.items():
+            nid = self.names.get(k)
+            if nid is None:
+                nid = self.name_id(k, names)
+            typ = type(v)
+            if typ is str:
+                b = v.encode("utf-8")
+                body += PROP_HEADER.pack(nid, b"s") + U32.pack(len(b)) + b
+            elif typ is float:
+                body += PROP_HEADER.pack(nid, b"d") + FLOAT.pack(v)
+            elif typ is bool:
+                body += PROP_HEADER.pack(nid, [b"f", b"t"][v])
+            elif typ is int and INT_MIN <= v <= INT_MAX:
+                body += PROP_HEADER.pack(nid, b"i") + INT.pack(v)
+            elif v is None:
+                body += PROP_HEADER.pack(nid, b"n")
+            else:
+                try:
+                    s = json.dumps(v)
+                except:
+                    logging.error("Encoding error in evb.write_event")
+                    s = "<unicode encoding error>"  # As the .evt writer does
+                b = s.encode("utf-8")
+                body += PROP_HEADER.pack(nid, b"j") + U32.pack(len(b)) + b
+        self.file.write(bytes(names) + b"E" + U32.pack(len(body)) + body)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self, wait=False):
+        self.file.close(wait=wait)
+
+class Verbatim(str):
+    """A value from a "j" record which couldn't be parsed as JSON, so is passed through as text"""
+    pass
+
+def read_records(filename):
+    """Yield ("comment", text) or ("event", properties) for each record in the file, in order"""
+    if filename.endswith(".gz"):
+        data = gzip.open(filename, "rb").read()
+    else:
+        data = open(filename, "rb").read()
+    assert data[:len(MAGIC)] == MAGIC, filename + " is not a Synth binary event log"
+    assert data[len(MAGIC)] == VERSION, "Unsupported version of binary event log " + str(data[len(MAGIC)])
+    pos = len(MAGIC) + 1
+    names = {}
+    end = len(data)
+    while pos < end:
+        tag = data[pos:pos+1]
+        if tag == b"N":
+            (_, nid, length) = NAME.unpack_from(data, pos)
+            pos += NAME.size
+            names[nid] = data[pos:pos+length].decode("utf-8")
+            pos += length
+        elif tag == b"C":
+            (length,) = U32.unpack_from(data, pos+1)
+            pos += 1 + U32.size
+            text = data[pos:pos+length].decode("utf-8")
+            pos += length
+            yield ("comment", text)
+        elif tag == b"R":
+            names = {}
+            pos += 1
+        elif tag == b"E":
+            (length,) = U32.unpack_from(data, pos+1)
+            pos += 1 + U32.size
+            yield ("event", decode_event(data, pos, names))
+            pos += length
+        else:
+            raise ValueError("Corrupt binary event log " + filename + " at byte " + str(pos))
+
+def decode_event(data, pos, names):
+    (count,) = COUNT.unpack_from(data, pos)
+    pos += COUNT.size
+    props = {}
+    for i in range(count):
+        (nid, typ) = PROP_HEADER.unpack_from(data, pos)
+        pos += PROP_HEADER.size
+        if typ == b"s" or typ == b"j":
+            (length,) = U32.unpack_from(data, pos)
+            pos += U32.size
+            v = data[pos:pos+length].decode("utf-8")
+            pos += length
+            if typ == b"j":
+                try:
+                    v = json.loads(v)
+                except ValueError:
+                    v = Verbatim(v)
+        elif typ == b"d":
+            (v,) = FLOAT.unpack_from(data, pos)
+            pos += FLOAT.size
+        elif typ == b"i":
+            (v,) = INT.unpack_from(data, pos)
+            pos += INT.size
+        elif typ == b"t":
+            v = True
+        elif typ == b"f":
+            v = False
+        elif typ == b"n":
+            v = None
+        else:
+            raise ValueError("Unknown value type " + str(typ) + " in binary event log")
+        props[names[nid]] = v
+    return props
+
+def to_evt(evb_filename, evt_filename):
+    """Convert a binary event log to the legacy .evt text format"""
+    from . import evt2csv
+    with open(evt_filename, "wt") as f:
+        for (kind, record) in read_records(evb_filename):
+            if kind == "comment":
+                f.write(record + "\n")
+            else:
+                f.write(evt2csv.format_evt_line(record))
+
+if __name__ == "__main__":
+    import sys
+    for filename in sys.argv[1:]:
+        assert filename.endswith(".evb") or filename.endswith(".evb.gz"), "Expected a .evb file"
+        print("Converting " + filename)
+        to_evt(filename, filename[:filename.index(".evb")] + ".evt")
+    print("Done")
@@ -13,6 +13,8 @@
     Input is either read from a .evt file:
         evts = read_evt_file("filename.evt")
         convert_to_csv(evts)
+    or from a binary .evb file (see evb.py):
+        evts = read_evb_file("filename.evb")
     or input property-by-property:
         evts = {}
         insert_properties(evts,...)  # Repeatedly
@@ -27,6 +29,13 @@
 import re
 import logging
 import json
+import functools
+import gzip
+import pendulum
+try:
+    from . import evb
+except ImportError:  # Run as a standalone utility
+    import evb
 
 SEP = "!"
 TIME_FORMAT = "%016.3f" # leading zeroes allow sorted() to time-sort, milli-second precision
@@ -98,9 +107,35 @@ def convert_to_csv(the_dict):
     return out_str
 
 
+@functools.lru_cache(maxsize=128)
+def dt_string(t):
+    return pendulum.from_timestamp(t).to_datetime_string() + " "    # For some reason, this is very slow
+
+def format_evt_line(properties):
+    """Return the .evt line for an event"""
+    s = dt_string(properties["$ts"])
+
+    for k in sorted(properties.keys()):
+        s += str(k) + ","
+        v = properties[k]
+        if type(v) is evb.Verbatim:
+            s += v
+        else:
+            try:
+                s += json.dumps(v)  # Use dumps not str so we preserve type in output
+            except:
+                logging.error("Encoding error in evt2csv.format_evt_line")
+                s += "<unicode encoding error>"
+        s += ","
+    s += "\n"
+    return s
+
 def read_evt_file(filename):
-    """Load an .evt file as a event dict."""
-    contents = open(filename,"rt").read()
+    """Load an .evt file (or gzipped .evt.gz file) as a event dict."""
+    if filename.endswith(".gz"):
+        contents = gzip.open(filename,"rt").read()
+    else:
+        contents = open(filename,"rt").read()
     return read_evt_str(contents)
 
 def read_evt_str(contents):
@@ -137,10 +172,27 @@ def read_evt_str(contents):
         insert_properties(result, properties)
     return result 
 
+def read_evb_file(filename):
+    """Load a binary .evb file as an event dict (just like read_evt_file())"""
+    result = {}
+    for (kind, record) in evb.read_records(filename):
+        if kind == "comment":
+            if record.startswith("*** New simulation"):
+                if len(result) > 0:
+                    logging.warning(".evb file contains multiple simulation runs - ignoring all but the last run")
+                result = {}
+        else:
+            insert_properties(result, record)
+    return result
+
 if __name__ == "__main__":
     import sys
     for filename in sys.argv[1:] :
         print("Converting " + str(filename))
-        evt = read_evt_file(filename+".evt")
+        if filename.endswith(".evb") or filename.endswith(".evb.gz"):
+            evt = read_evb_file(filename)
+            filename = filename[:filename.index(".evb")]
+        else:
+            evt = read_evt_file(filename+".evt")
         open(filename+"_converted.csv","wt").write(convert_to_csv(evt))
     print("Done")
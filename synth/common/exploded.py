@@ -0,0 +1,45 @@
+"""Exploded
+A batch of identical messages from an "exploded" device (see explode_factor in events.py).
+Copy i has "$id" of <device_id>_i (and "label", if it has one, of <label>_i) but is otherwise identical.
+
+Consumers which can, should serialise the batch just once with render(), rather than iterating over every copy."""
+
+import logging
+
+MARKER = "__synth_explode_index__"  # Stands in for the copy number while rendering. Must pass unchanged through any serialiser.
+
+class ExplodedBatch():
+    def __init__(self, device_id, time, properties, count):
+        self.device_id = device_id
+        self.time = time
+        self.properties = properties
+        self.count = count
+        self.has_label = "label" in properties
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Yield (id, properties) for each copy. NOTE: for speed the same dict is updated and yielded every time, so copy it if you need to keep it."""
+        props = self.properties.copy()
+        base_id = str(self.device_id) + "_"
+        if self.has_label:
+            base_label = self.properties["label"] + "_"
+        for i in range(self.count):
+            eid = base_id + str(i)
+            props["$id"] = eid
+            if self.has_label:
+                props["label"] = base_label + str(i)
+            yield (eid, props)
+
+    def render(self, render_fn):
+        """Return a list of strings, one per copy, where render_fn(properties) serialises one copy. Calls render_fn just once."""
+        props = self.properties.copy()
+        props["$id"] = str(self.device_id) + "_" + MARKER
+        if self.has_label:
+            props["label"] = self.properties["label"] + "_" + MARKER
+        pieces = render_fn(props).split(MARKER)
+        if len(pieces) != 2 + self.has_label:  # Marker got mangled by the serialiser, or occurs in the data
+            logging.warning("Can't render exploded batch quickly, so rendering each copy")
+            return [render_fn(p) for (_, p) in self]
+        return [str(i).join(pieces) for i in range(self.count)]
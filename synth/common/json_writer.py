@@ -1,5 +1,6 @@
 """JSONwriter
-Writes events to JSON files, segmenting on max size"""
+Writes events to JSON files, segmenting on max size.
+Writing, and moving each finished file into place, happen on the background writer thread (see background_writer.py)."""
 
 import os, pathlib, shutil
 import logging
@@ -7,6 +8,7 @@ import time
 from datetime import datetime
 from . import json_quick
 from . import merge_test
+from . import background_writer
 
 TEMP_DIRECTORY = "/tmp/synth_json_writer/"  # We build each file in a temporary directory, then move when it's finished (so that anyone watching the destination directory doesn't ever encounter partially-written files
 DEFAULT_DIRECTORY = "../synth_logs/"
@@ -17,7 +19,7 @@ class Stream():
        If you access .files_written property then call close() first"""
     def __init__(self, filename, directory = DEFAULT_DIRECTORY, file_mode="wt",
             max_events_per_file = DEFAULT_MAX_EVENTS_PER_FILE, merge = False,
-            ts_prefix = False, messages_prefix = False):
+            ts_prefix = False, messages_prefix = False, compress = False):
         pathlib.Path(TEMP_DIRECTORY).mkdir(exist_ok=True)   # Ensure temp directory exists
 
         self.target_directory = directory
@@ -27,6 +29,7 @@ class Stream():
         self.merge = merge
         self.ts_prefix = ts_prefix
         self.messages_prefix = messages_prefix
+        self.compress = compress    # If true, files are gzipped (and named .json.gz)
 
         self.file = None
         self.filename = None
@@ -35,17 +38,22 @@ class Stream():
         self.last_event = {}    # Used to merge messages
         self.first_timestamp = None
  
-    def _write_event(self, properties):
-        self.check_next_file()
+    def _render(self, properties):
         jprops = properties.copy()
-        if self.first_timestamp is None:
-            self.first_timestamp = jprops["$ts"]
         jprops["$ts"] = int(jprops["$ts"] * 1000) # Convert timestamp to ms as that's what DP uses internally in JSON files
-        s = json_quick.dumps(jprops)
+        return json_quick.dumps(jprops)
+
+    def _write_rendered(self, s, timestamp):
+        self.check_next_file()
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
         if self.events_in_this_file > 0:
             s = ",\n" + s
         self.file.write(s)
 
+    def _write_event(self, properties):
+        self._write_rendered(self._render(properties), properties["$ts"])
+
     def write_event(self, properties):
         if not self.merge:
             self._write_event(properties)
@@ -61,14 +69,26 @@ class Stream():
             self._write_event(self.last_event)
             self.last_event = properties   
 
+    def write_exploded(self, batch):
+        """Write every event in an ExplodedBatch (see exploded.py), serialising just once"""
+        if self.merge:  # Merging needs to look at each event
+            for (_, properties) in batch:
+                self.write_event(properties.copy())
+            return
+        ts = batch.properties["$ts"]
+        for s in batch.render(self._render):
+            self._write_rendered(s, ts)
+
     def move_to_next_file(self):
         """Move to next json file"""
         if self.file is not None:
             self._close()
 
         self.filename = self.filename_root + "%05d" % self.file_count + ".json"
+        if self.compress:
+            self.filename += ".gz"
         logging.info("Starting new logfile " + self.filename)
-        self.file = open(TEMP_DIRECTORY + self.filename, self.file_mode)  # No-longer unbuffered as Python3 doesn't support that on text files
+        self.file = background_writer.File(TEMP_DIRECTORY + self.filename, self.file_mode, self.compress)
         self.file.write("[\n")
         self.events_in_this_file = 0
 
@@ -86,7 +106,6 @@ class Stream():
         if self.file is not None:
             # logging.info("Closing JSON file")
             self.file.write("\n]\n")
-            self.file.close()
             if self.ts_prefix:
                 dt = datetime.fromtimestamp(self.first_timestamp)
                 prefix = dt.strftime("%Y-%m-%dT%H-%M-%S_")
@@ -95,9 +114,12 @@ class Stream():
             if self.messages_prefix:
                 prefix += "%010d" % self.events_in_this_file + "_"
             src = TEMP_DIRECTORY + self.filename
-            shutil.copy(src, DEFAULT_DIRECTORY + prefix + self.filename) # os.rename() fails if they're on different drives
-            os.remove(src)
-            
+            dest = DEFAULT_DIRECTORY + prefix + self.filename
+            def move():
+                shutil.copy(src, dest) # os.rename() fails if they're on different drives
+                os.remove(src)
+            self.file.close(then=move)
+
             self.files_written.append(DEFAULT_DIRECTORY + self.filename)
             self.file = None
             self.filename = None
@@ -105,8 +127,10 @@ class Stream():
             self.file_count += 1
 
     def close(self):
+        """Waits until all files are written and moved into place"""
         if len(self.last_event) != 0:
             self._write_event(self.last_event)
         self._close()
+        background_writer.drain()
 
            
@@ -0,0 +1,186 @@
+"""property_store: Compact storage for device properties.
+
+A dict per device costs several hundred bytes even for a handful of properties, and with millions of devices
+these dominate memory. Devices of the same class mostly have the same property names, so instead each class
+has a Schema, which gives each property name a slot number, and each device's Properties hold just a list of
+values, one per slot.
+
+Properties is a MutableMapping, so it can be used like a dict (properties["$id"], .get(), in, .items(), .update() etc.),
+but it isn't one, so e.g. json.dumps() can't serialise it. Anything which needs a real dict (such as a message for a client)
+should take a copy with .copy() or dict(). Keys are ordered by when they were first set on any device of the class,
+rather than on this device.
+"""
+
+import sys
+from collections.abc import MutableMapping
+
+class Absent():
+    """The value of a slot whose property this device doesn't have"""
+    def __repr__(self):
+        return "ABSENT"
+
+    def __reduce__(self):
+        return "ABSENT"     # So there's only ever one, even after unpickling
+
+ABSENT = Absent()
+
+class Schema():
+    """The names of the properties of one class of device, each with a slot number"""
+    def __init__(self):
+        self.slots = {}     # Name -> slot number
+        self.names = []     # Slot number -> name
+
+    def slot(self, name):
+        s = self.slots.get(name)
+        if s is None:
+            if type(name) is str:
+                name = sys.intern(name)
+            s = len(self.names)
+            self.slots[name] = s
+            self.names.append(name)
+        return s
+
+class Properties(MutableMapping):
+    __slots__ = ("schema", "values")
+
+    def __init__(self, schema, initial=None):
+        self.schema = schema
+        self.values = [ABSENT] * len(schema.names)
+        if initial:
+            self.update(initial)
+
+    def __getitem__(self, name):
+        s = self.schema.slots.get(name)
+        if s is not None and s < len(self.values):
+            v = self.values[s]
+            if v is not ABSENT:
+                return v
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        s = self.schema.slots.get(name)
+        values = self.values
+        if s is None or s >= len(values):
+            s = self.schema.slot(name)
+            values.extend([ABSENT] * (len(self.schema.names) - len(values)))
+        values[s] = value
+
+    def __delitem__(self, name):
+        s = self.schema.slots.get(name)
+        if s is None or s >= len(self.values) or self.values[s] is ABSENT:
+            raise KeyError(name)
+        self.values[s] = ABSENT
+
+    def __contains__(self, name):
+        s = self.schema.slots.get(name)
+        return s is not None and s < len(self.values) and self.values[s] is not ABSENT
+
+    def get(self, name, default=None):
+        s = self.schema.slots.get(name)
+        if s is not None and s < len(self.values):
+            v = self.values[s]
+            if v is not ABSENT:
+                return v
+        return default
+
+    def __iter__(self):
+        for (name, v) in zip(self.schema.names, self.values):
+            if v is not ABSENT:
+                yield name
+
+    def __len__(self):
+        return len(self.values) - self.values.count(ABSENT)
+
+    def items(self):
+        return [(name, v) for (name, v) in zip(self.schema.names, self.values) if v is not ABSENT]
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, "items"):
+            other = other.items()
+        slots = self.schema.slots
+        values = self.values
+        for (name, value) in other:
+            s = slots.get(name)
+            if s is not None and s < len(values):
+                values[s] = value
+            else:
+                self[name] = value
+        for (name, value) in kwargs.items():
+            self[name] = value
+
+    def copy(self):
+        """A real dict"""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Properties):
+            other = other.copy()
+        return self.copy() == other
+
+    def __repr__(self):
+        return repr(self.copy())
+
+def selfTest():
+    """Check that Properties behave just like dicts (except for key order), including when they share a Schema"""
+    import random
+    import pickle
+    print("Testing Properties")
+    r = random.Random(1)
+    names = ["$id", "$ts", "a", "b", "c", 7, ("t", 1)]
+    values = [None, False, 0, "", "x", 1.5, [1, 2], {"k" : 1}]
+    for seed in range(100):
+        schema = Schema()
+        devices = [(Properties(schema), {}) for i in range(4)]
+        for step in range(200):
+            (p, d) = r.choice(devices)
+            name = r.choice(names)
+            op = r.randrange(7)
+            if op == 0:
+                v = r.choice(values)
+                p[name] = v
+                d[name] = v
+            elif op == 1:
+                assert (name in p) == (name in d)
+                if name in d:
+                    assert p[name] is d[name]
+                    del p[name]
+                    del d[name]
+                else:
+                    for f in [lambda: p[name], lambda: p.__delitem__(name)]:
+                        try:
+                            f()
+                            assert False, "Expected KeyError"
+                        except KeyError:
+                            pass
+            elif op == 2:
+                assert p.get(name, "default") == d.get(name, "default")
+                assert p.pop(name, "default") == d.pop(name, "default")
+            elif op == 3:
+                v = r.choice(values)
+                assert p.setdefault(name, v) == d.setdefault(name, v)
+            elif op == 4:
+                other = {r.choice(names) : r.choice(values) for i in range(3)}
+                if r.random() < 0.5:
+                    p.update(other)
+                else:
+                    p.update(other.items(), z=1)
+                    d["z"] = 1
+                d.update(other)
+            elif op == 5:
+                q = pickle.loads(pickle.dumps(p))   # As in a checkpoint
+                assert q == d
+                assert all(v is ABSENT for v in q.values if isinstance(v, Absent))
+            else:
+                p.clear()
+                d.clear()
+            for (p, d) in devices:
+                assert len(p) == len(d)
+                assert set(p) == set(d)
+                assert sorted(p.items(), key=repr) == sorted(d.items(), key=repr)
+                assert p.copy() == d and type(p.copy()) is dict
+                assert p == d
+                assert list(p) == [n for n in schema.names if n in d]  # In the order first set on any device with this schema
+    print("Test passed")
+
+if __name__ == "__main__":
+    selfTest()
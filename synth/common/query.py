@@ -65,15 +65,18 @@ where:
 TEST_FILE = "query_self_test_vectors.evt"
 
 
-def evaluate(expression, prev,curr,succ):
-    """Evaluate a JS expression, using property variables in <curr> dict. <prev> and <succ> are the same for the previous and following event, if any"""
+def evaluate(expression, prev,curr,succ, now=None):
+    """Evaluate a JS expression (source, or compiled code), using property variables in <curr> dict. <prev> and <succ> are the same for the previous and following event, if any"""
     # Some DevicePilot property names begin with $ (e.g. $ts), but this isn't legal JS
     # so we convert $ to _ in both <expression> and <var_dict>
     def ago(secs):
         # Expressions like "$ts < ago(3600)" mean that if a timestamp hasn't been received for an hour then it's a timeout.
         # So ago() actually needs to look for the NEXT timestamp, if any.
         if succ==None:
-            t = time.time() # If there is no following event, then now() really is now!
+            if now is None:
+                t = time.time() # If there is no following event, then now() really is now!
+            else:
+                t = now
         else:
             t = succ["_ts"]
         return t - secs
@@ -84,61 +87,116 @@ def evaluate(expression, prev,curr,succ):
     return result
 
 
-def do_query(params, event_dict):
-    """Run a query on an event log. We don't "understand" the key format of the event log
-       (which might be created by e.g. evt2csv), we just rely on the fact it will sort into time order"""
-    expression = params["expression"]
-    logging.info("Running query ("+expression+")")
-
-    # Rename property names like "$*" into "_*" so that evaluator can handle them as valid variable names
-    expression = re.sub(r"\$","_", expression)
-
-    # Create a dict of $ids, each of which will be a list of events
-    events_by_id = {}
-    for pairs in event_dict.values():
-        for p,v in pairs:
-            if p == "$id":
-                id = v
-                if id not in events_by_id:
-                    events_by_id[id] = []
-    
-    # Fill lists by ID
-    # (and rename $* to _*)
-    for k in sorted(event_dict.keys()):
+class StreamingQuery():
+    """Evaluate a query incrementally, as events arrive, rather than on a whole event log.
+       Each event is tested once the device's next event arrives (so that ago() can see it),
+       so only the latest two events for each device are held in memory."""
+    def __init__(self, params, on_match=print):
+        self.expression = params["expression"]
+        # Rename property names like "$*" into "_*" so that evaluator can handle them as valid variable names
+        self.compile()
+        self.on_match = on_match
+        self.windows = {}   # $id -> (prev, curr)
+        self.num_events = 0
+        self.num_matches = 0
+
+    def compile(self):
+        self.code = compile(re.sub(r"\$","_", self.expression), "<query>", "eval")
+
+    def __getstate__(self):
+        """Code objects can't be pickled (e.g. into a checkpoint), so we recompile instead"""
+        state = self.__dict__.copy()
+        del state["code"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile()
+
+    def consume(self, properties):
+        """Called with each event, in time order"""
         props = {}
-        for (p,v) in event_dict[k]:
+        for (p,v) in properties.items():
             if p.startswith("$"):
                 props["_"+p[1:]] = v
             else:
                 props[p] = v
-        events_by_id[props["_id"]].append(props)
-
-    # Evaluate expression for each event
-    for events in events_by_id.values():
-        LEN = len(events)
-        for n in range(LEN):
-            if n==0:
-                prev = None
-            else:
-                prev = events[n-1]
-            curr = events[n]
-            if n==LEN-1:
-                succ = None
-            else:
-                succ = events[n+1]
-            if evaluate(expression, prev,curr,succ):
-                print(curr)
+        id = props["_id"]
+        window = self.windows.get(id)
+        if window is None:
+            self.windows[id] = (None, props)
+        else:
+            (prev, curr) = window
+            self.test(prev, curr, props)
+            self.windows[id] = (curr, props)
+        self.num_events += 1
+
+    def test(self, prev, curr, succ):
+        if evaluate(self.code, prev, curr, succ):
+            self.num_matches += 1
+            self.on_match(curr)
+
+    def finish(self, now=None):
+        """Test the latest event of each device, which has no following event (yet), as at time <now> (default: real time).
+           If events continue to arrive afterwards, these will be tested again once their following event arrives,
+           so they aren't included in num_matches. Returns how many of them match."""
+        matches = 0
+        for (prev, curr) in self.windows.values():
+            if evaluate(self.code, prev, curr, None, now):
+                matches += 1
+                self.on_match(curr)
+        return matches
+
+def do_query(params, event_dict):
+    """Run a query on an event log. We don't "understand" the key format of the event log
+       (which might be created by e.g. evt2csv), we just rely on the fact it will sort into time order"""
+    logging.info("Running query ("+params["expression"]+")")
+    q = StreamingQuery(params)
+    for k in sorted(event_dict.keys()):
+        q.consume(dict(event_dict[k]))
+    q.finish()
+
+def selfTest():
+    import pickle
+    import evt2csv
+    print("Testing StreamingQuery")
+    evts = [dict(e) for (k, e) in sorted(evt2csv.read_evt_file(TEST_FILE).items())]
+    params = {
+        "expression" : "$ts < ago(30)"
+        }
+
+    def run(events, now, pickle_after=None):
+        """Return the $ts of each match, by $id"""
+        matches = []
+        q = StreamingQuery(params, on_match=matches.append)
+        for (i, e) in enumerate(events):
+            if i == pickle_after:   # As when checkpointing
+                q = pickle.loads(pickle.dumps(q))
+                q.on_match = matches.append
+            q.consume(e)
+        q.finish(now)
+        result = {}
+        for m in matches:
+            result.setdefault(m["_id"], []).append(m["_ts"])
+        return result
+
+    # Only the event before the gap times out (judged by the next event), then the last one if "now" is long enough after it
+    assert run(evts, now=130) == {1 : [50]}
+    assert run(evts, now=200) == {1 : [50, 120]}
+
+    # Interleaving another device's events doesn't change either device's matches, nor does pickling part way through
+    other = [dict(e, **{"$id" : 2, "$ts" : e["$ts"] * 2 + 5}) for e in evts]
+    both = sorted(evts + other, key=lambda e: e["$ts"])
+    assert run(both, now=200) == {1 : [50, 120], 2 : [105]}
+    for i in range(len(both)):
+        assert run(both, now=200, pickle_after=i) == run(both, now=200)
+    print("Test passed")
 
 if __name__ == "__main__":
     import sys
-    import evt2csv
     if len(sys.argv)<2:
         """If no args then do self-test"""
-        evts = evt2csv.read_evt_file(TEST_FILE)
-        params = {
-            "expression" : "$ts < ago(30)"
-            }
-        do_query(params, evts)
+        selfTest()
         
 ##    for filename in sys.argv[1:] :
 ##        print "Converting ",filename
@@ -0,0 +1,65 @@
+"""repeat_time: Work out where a time ends up after adding an interval to it many times over,
+without doing all the additions.
+
+Repeating events advance their time by adding <interval> once per repeat, and floating-point addition
+rounds each time, so the result is not simply t + repeats * interval. But within one binade (the range
+[2^(e-1), 2^e) which shares one exponent) each addition after the first couple adds exactly the same
+rounded step, so we can jump straight to the end of each binade. That makes the cost proportional to the
+number of binades crossed (at most a few dozen), not the number of repeats, and gives bit-identical results.
+"""
+import math
+import time
+
+def repeated_sum(x, d, n):
+    """Return the result of doing x += d, n times"""
+    if d < 0:
+        return -repeated_sum(-x, -d, n)     # Rounding is symmetric
+    while n > 0:
+        if x < 1.0 or n < 4 or not math.isfinite(x + d):    # Times are positive, so small or negative x only need a few single steps
+            x += d
+            n -= 1
+            continue
+        e = math.frexp(x + d)[1]
+        x1 = x + d
+        x2 = x1 + d     # On a tie, x1 rounds either way but x2 always rounds to even...
+        x3 = x2 + d     # ...after which every step is the same
+        if math.frexp(x3)[1] != e:  # Crossing into the next binade
+            x = x1
+            n -= 1
+            continue
+        n -= 3
+        ulp = math.ldexp(1.0, e - 53)
+        X = int(x3 / ulp)           # Exact integers, in units of the last place
+        S = int((x3 - x2) / ulp)
+        if S == 0:
+            return x3               # Interval too small to move x at all
+        k = min(n, ((1 << 53) - 1 - X) // S)    # Steps we can take while staying in this binade
+        x = math.ldexp(float(X + k * S), e - 53)
+        n -= k
+    return x
+
+def selfTest():
+    def loop(x, d, n):
+        for i in range(n):
+            x += d
+        return x
+
+    print("Testing repeated_sum")
+    cases = [(1577836800.0, 0.1, 100000), (1577836800.0, 0.7, 99999), (1.7664975504837046, 922108.4421678744, 2781),
+             (1.0, 2**-53, 1000), (1.0, 3*2**-54, 1000), (0.0, 0.1, 10000), (-5.0, 0.3, 1000), (5.0, -0.3, 1000),
+             (1e9, 2**-23, 5000), (1e9, 3*2**-24, 5000), (2**30-10, 0.001, 20000), (1577836800.0, 0.0, 10)]
+    for (x, d, n) in cases:
+        assert repeated_sum(x, d, n) == loop(x, d, n), (x, d, n)
+
+    # Must take constant time however many repeats there are
+    for n in [10**6, 10**12]:
+        t = time.time()
+        repeated_sum(1577836800.0, 0.1, n)
+        elapsed = time.time() - t
+        print(str(n)+" repeats took "+str(elapsed)+"s")
+        assert elapsed < 0.1
+
+    print("Test passed")
+
+if __name__ == "__main__":
+    selfTest()
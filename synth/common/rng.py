@@ -0,0 +1,145 @@
+"""rng: Counter-based random number streams.
+
+A Stream's n'th draw is a pure function of its key and n, so (unlike a Mersenne Twister, whose state is 2.5KB)
+its whole state is two integers, which are cheap to save, swap and restore. Keys are derived from names,
+e.g. (device $id, stream name), with a stable hash, so streams are reproducible across processes.
+
+Each draw is a SplitMix64-style mix of the key and the counter (in the spirit of Philox, but much cheaper in pure Python).
+
+Stream has all the methods of random.Random (randrange(), choice(), gauss() etc.), but isn't one, as every random.Random
+also carries a Mersenne Twister's state. So a Stream is small enough for every device to have its own. To make many draws at once,
+e.g. one for each of many devices, use uniform(keys, counters), which is vectorised with NumPy and gives exactly
+the same numbers as the corresponding Stream.random() calls.
+"""
+
+import random
+import hashlib
+import numpy
+
+MASK = 0xFFFFFFFFFFFFFFFF
+GAMMA = 0x9E3779B97F4A7C15
+M1 = 0xBF58476D1CE4E5B9
+M2 = 0x94D049BB133111EB
+TO_FLOAT = 2.0 ** -53
+
+def key_of(*names):
+    """A stable 64-bit key for a tuple of names (e.g. a device $id and a stream name)"""
+    s = "/".join([str(n) for n in names])
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+def mix(z):
+    z = ((z ^ (z >> 30)) * M1) & MASK
+    z = ((z ^ (z >> 27)) * M2) & MASK
+    return z ^ (z >> 31)
+
+def bits64(key, counter):
+    """Draw number <counter> from the stream with <key>, as 64 random bits"""
+    return mix(key ^ mix(((counter + 1) * GAMMA) & MASK))
+
+def mix_array(z):
+    z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(M1)    # uint64 arithmetic wraps, as we want
+    z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(M2)
+    return z ^ (z >> numpy.uint64(31))
+
+def uniform(keys, counters):
+    """Vectorised Stream.random(): for each i, draw number counters[i] of the stream with keys[i], as floats in [0,1)"""
+    keys = numpy.asarray(keys, dtype=numpy.uint64)
+    counters = numpy.asarray(counters, dtype=numpy.uint64)
+    z = mix_array(keys ^ mix_array((counters + numpy.uint64(1)) * numpy.uint64(GAMMA)))
+    return (z >> numpy.uint64(11)).astype(numpy.float64) * TO_FLOAT
+
+class Stream():
+    """A counter-based equivalent of random.Random. Draws don't depend on anything but the key and how many draws came before."""
+    __slots__ = ("key", "counter", "gauss_next")
+
+    def __init__(self, *names):
+        self.seed(names)
+
+    def seed(self, a=None, version=2):
+        if type(a) is tuple:
+            self.key = key_of(*a)
+        else:
+            self.key = key_of(a)
+        self.counter = 0
+        self.gauss_next = None
+
+    def random(self):
+        c = self.counter + 1
+        self.counter = c
+        z = (c * GAMMA) & MASK  # bits64(), inlined as this is the hot path
+        z = ((z ^ (z >> 30)) * M1) & MASK
+        z = ((z ^ (z >> 27)) * M2) & MASK
+        z = self.key ^ z ^ (z >> 31)
+        z = ((z ^ (z >> 30)) * M1) & MASK
+        z = ((z ^ (z >> 27)) * M2) & MASK
+        return ((z ^ (z >> 31)) >> 11) * TO_FLOAT
+
+    def getrandbits(self, k):
+        result = 0
+        bits = 0
+        while bits < k:
+            result |= bits64(self.key, self.counter) << bits
+            self.counter += 1
+            bits += 64
+        return result >> (bits - k)
+
+    def random_array(self, n):
+        """The next <n> draws of random(), as a NumPy array"""
+        a = uniform(numpy.full(n, self.key, dtype=numpy.uint64), numpy.arange(self.counter, self.counter + n, dtype=numpy.uint64))
+        self.counter += n
+        return a
+
+    def getstate(self):
+        return (self.key, self.counter, self.gauss_next)
+
+    def setstate(self, state):
+        (self.key, self.counter, self.gauss_next) = state
+
+for (name, f) in vars(random.Random).items():   # Its distributions etc. are written in terms of random() and getrandbits(), so work on a Stream too
+    if callable(f) and not name.startswith("__") and name not in vars(Stream):
+        setattr(Stream, name, f)
+
+def selfTest():
+    print("Testing rng")
+    # Draws are fixed by the key alone, in any process (so these must never change, or old scenarios will give different results)
+    s = Stream("selftest", "a")
+    assert [s.random() for i in range(3)] == [0.10493341373386911, 0.755174363495057, 0.9728892506571027]
+    assert s.randrange(1000000) == 408687
+    assert s.getrandbits(100) == 1133185586759843195058218592349
+
+    # ...and don't depend on draws from any other stream, however they're interleaved
+    def draws(interleave):
+        streams = {k : Stream("device", k) for k in range(10)}
+        others = [Stream("other", k) for k in range(10)]
+        result = {k : [] for k in streams}
+        r = random.Random(interleave)
+        for i in range(1000):
+            k = r.randrange(10)
+            result[k].append(streams[k].random())
+            r.choice(others).gauss(0, 1)
+        return {k : v[:50] for (k, v) in result.items()}
+    assert draws(1) == draws(2)
+    assert len(set(v[0] for v in draws(1).values())) == 10  # Different keys give different streams
+
+    # The n'th draw is the same however we get to it
+    s = Stream("selftest", "b")
+    first = [s.random() for i in range(100)]
+    s = Stream("selftest", "b")
+    s.setstate((s.key, 40, None))
+    assert [s.random() for i in range(60)] == first[40:]
+    assert list(uniform([s.key] * 100, range(100))) == first
+    s = Stream("selftest", "b")
+    assert list(s.random_array(30)) + [s.random() for i in range(70)] == first
+
+    # Saving and restoring state (including a half-used pair of gauss() draws) continues the stream exactly
+    s = Stream("selftest", "c")
+    s.gauss(0, 1)
+    state = s.getstate()
+    after = [s.gauss(0, 1), s.random(), s.choice(range(100))]
+    t = Stream("something else")
+    t.setstate(state)
+    assert [t.gauss(0, 1), t.random(), t.choice(range(100))] == after
+    print("Test passed")
+
+if __name__ == "__main__":
+    selfTest()
@@ -25,14 +25,29 @@ import logging
 import traceback
 import copy
 import json
+import collections
+import inspect
 import pendulum
 from common import importer
 from common import conftime
+from common import rng
 from devices.basic import Basic
+import shard
+import random_streams
 
 g_devices = []
 g_devices_dict = {}   # For quickly checking if a device already exists (g_devices[] above is probably redundant)
-g_stopped_devices = []
+g_stopped_devices = {}  # Device -> None (so an ordered set)
+g_live = []             # Devices which haven't been stopped, in no particular order (so a random one can be picked, see stop_device())
+g_live_positions = {}   # Device -> its position in g_live
+g_stop_queue = collections.deque()  # Devices in order of creation, oldest first. Stopped devices are skipped when they reach either end.
+g_parked_devices = set()    # Devices which are being simulated by another shard
+g_device_number = 0     # Every shard creates every device in the same order, so this numbers devices identically in all shards
+g_stubs = {}            # Device number -> create_device() args, for devices which are yet to be materialised
+g_positions = {}        # Device -> its position in g_devices
+g_index = {}            # Property name -> {value -> Bucket}, for properties which devices have been looked up by (see below)
+g_unhashable = {}       # Property name -> {device : None} for devices whose value of the property can't be indexed
+g_stop_random = rng.Stream("stop_device")  # Picks devices for stop_device's "random" policy, so the choice doesn't depend on any other draws
 
 g_class_cache = {}  # Creating composite classes in Python seems to get exponentially slower, so we cache
 
@@ -49,11 +64,41 @@ def compose_class(class_names):
         for class_name in class_names:
             if class_name != "basic":   # Normally this is not explicitly specified, so is implicit, but even it is explicit we want to ensure that it's the last class added
                 classes.append(importer.get_class('device', class_name))
+        if random_streams.g_enabled:
+            random_streams.adopt_classes(classes)
         classes.reverse()   # In each device class constructor, the first thing we do is to call super(). This means that (in terms of the order of execution of all the init code AFTER that call to super()), the last shall be first
         c = type("compositeDeviceClass", tuple(classes), {})
+        flatten_methods(c)
+        c.class_names = class_names     # So it can be re-composed when resuming from a checkpoint
+        c.skip_output_when_muted = all([cl.__dict__.get("transmission_independent", False) for cl in classes])  # See basic.py
         g_class_cache[s] = c
         return c
 
+# Most device classes override comms_ok(), external_event() etc. just to call the same method of their superclass,
+# which is exactly what would happen if they didn't override it. But in a composite class every such override
+# is another call on the way down the MRO, for every message. So each composite class gets its own copy of each
+# such method, taken from the first class in its MRO which adds behaviour. The device classes themselves are untouched.
+# Device classes mark their pass-throughs with @pass_through (see devices/device.py).
+
+def is_pass_through(fn, parent):
+    """Is <fn> marked as a pass-through to <parent>, and called in just the same way?"""
+    if not (getattr(fn, "pass_through", False) and inspect.isfunction(fn) and inspect.isfunction(parent)):
+        return False
+    return inspect.signature(fn) == inspect.signature(parent)  # Else callers could tell the difference
+
+def flatten_methods(c):
+    """Give composite class <c> its own copy of each method which its MRO only reaches through pass-throughs"""
+    names = set()
+    for k in c.__mro__[1:-1]:   # Not c itself, nor object
+        names.update(name for (name, fn) in vars(k).items() if getattr(fn, "pass_through", False))
+    for name in names:
+        defs = [vars(k)[name] for k in c.__mro__ if name in vars(k)]
+        i = 0
+        while i+1 < len(defs) and is_pass_through(defs[i], defs[i+1]):
+            i += 1
+        if i > 0:
+            setattr(c, name, defs[i])
+
 def sort_by_suffix_OLD(dictionary):
     # Given a dictionary whose keys may each have an optional ":N" at the end,
     # a) produce a list of keys sorted by that number
@@ -91,15 +136,73 @@ def sort_by_suffix(dictionary):
 
 
 def create_device(args):
-    global g_devices
+    """Create a device, or if "lazy" is given then just a stub for it, which becomes a device later (see materialise())"""
+    global g_device_number
+    (instance_name, client, engine, update_callback, context, params) = args
+
+    device_number = g_device_number
+    g_device_number += 1
+    if params.get("lazy", False):
+        assert not shard.is_shard(), "lazy can't be used with shards"
+        g_stubs[device_number] = args
+        engine.register_event_next(materialise, device_number)  # So it's still created at this time, and in order, just not within this action
+        return None
+    return construct_device(device_number, args)
+
+def create_devices(args):
+    """Create params["count"] identical devices in one go, composing their class once and telling the client about them all at once"""
+    global g_device_number
     (instance_name, client, engine, update_callback, context, params) = args
-    
+    count = params["count"]
+    assert int(count) == count and count >= 0, "create_devices count must be a non-negative integer"
+    if params.get("lazy", False):  # Each is just a stub for now
+        for i in range(count):
+            create_device(args)
+        return
+    C = device_class(params)
+    added = []
+    for i in range(count):
+        device_number = g_device_number
+        g_device_number += 1
+        construct_device(device_number, args, C, added)
+    if added:
+        client.add_devices(added)
+
+def materialise(device_number):
+    """Turn a stub into a device, if it hasn't been already. Each stub has an event to do this straight after the action
+       which created it, so until then lookups don't find it, and only stop_device ever materialises one sooner (see select_device_to_stop())."""
+    args = g_stubs.pop(device_number, None)
+    if args is not None:
+        construct_device(device_number, args)
+
+def device_class(params):
+    """The composite device class for a create_device action's <params>"""
     funcs = params["functions"]
     funcs.pop("comment", None)  # Ignore any comments
     sorted_class_names = sort_by_suffix(funcs)
-    C = compose_class(sorted_class_names)        # Create a composite device class from all the given class names
+    return compose_class(sorted_class_names)        # Create a composite device class from all the given class names
+
+def construct_device(device_number, args, C=None, added=None):
+    """If <added> is given then (id, time, properties) of the device is appended to it, for the caller to pass to client.add_devices()"""
+    global g_devices
+    (instance_name, client, engine, update_callback, context, params) = args
+    owned = shard.owns(device_number)
+    if not owned:
+        update_callback = shard.discard_update
+
+    if C is None:
+        C = device_class(params)
     d = C(instance_name, engine.get_now(), engine, update_callback, context, params["functions"])   # Instantiate it
-    client.add_device(d.properties["$id"], engine.get_now(), d.properties)
+    if owned:
+        shard.init_device(d, device_number)
+        random_streams.init_device(d)
+        if added is None:
+            client.add_device(d.properties["$id"], engine.get_now(), d.properties)
+        else:
+            added.append((d.properties["$id"], engine.get_now(), d.properties))
+    else:   # Another shard is simulating this device, so park it
+        engine.cancel_events_for_device(d)
+        g_parked_devices.add(d)
 
     if "stop_at" in params:
         at_time = conftime.richTime(params["stop_at"])
@@ -109,50 +212,167 @@ def create_device(args):
     if the_id in g_devices_dict:
         logging.error("FATAL: Attempt to create duplicate device "+str(d.properties["$id"]))
         exit(-1)
-    g_devices.append(d)
-    g_devices_dict[the_id] = d
+    register_device(d)
 
     return d
 
 def stop_device(params):
-    # Stop a device by removing all its pending events
-    global g_devices, g_stopped_devices
-
+    """Stop a device by removing all its pending events"""
     (engine, args) = params
-
-    # Find a device to stop
-    for device in g_devices:
-        if device not in g_stopped_devices:
-            break
-    else:
-        assert False, "stop_device called but no matching devices to stop"
+    if isinstance(args, Basic):  # A "stop_at" stops the oldest live device, as it always has, not necessarily the one it was given for
+        args = {}
+    device = select_device_to_stop(args)
+    assert device is not None, "stop_device called but no matching devices to stop"
     logging.info("Stopping device "+str(device.properties["$id"]))
     engine.remove_all_events_for_device(device)
-    g_stopped_devices.append(device)
+    mark_stopped(device)
     # devices.remove(d) # we no longer delete it (because other devices might have a reference to it, in models etc.). So it is "dead in the water" but not forgotten.
-    
+
+STOP_POLICIES = ["oldest", "newest", "random"]
+
+def select_device_to_stop(params):
+    """Choose a device which hasn't been stopped, according to the stop_device action's params (see events.py).
+       Only materialised devices are candidates, except that the oldest device may be the first stub, which is then materialised."""
+    policy = params.get("select", "oldest")
+    assert policy in STOP_POLICIES, "stop_device select must be one of "+str(STOP_POLICIES)
+    if "identity_property" in params:   # Costs O(number of matching devices)
+        candidates = [d for d in matching(params["identity_property"], params["identity_value"]) if d not in g_stopped_devices]
+        if not candidates:
+            return None
+        if policy == "oldest":
+            return candidates[0]
+        if policy == "newest":
+            return candidates[-1]
+        return candidates[g_stop_random.randrange(len(candidates))]
+    if policy == "random":
+        if not g_live:
+            return None
+        return g_live[g_stop_random.randrange(len(g_live))]
+    while g_stop_queue or (policy == "oldest" and g_stubs):     # Each device leaves the queue at most once, so this is O(1) amortised
+        if not g_stop_queue:    # Every materialised device has been stopped, so the oldest is the first stub
+            materialise(next(iter(g_stubs)))
+        if policy == "oldest":
+            d = g_stop_queue.popleft()
+        else:
+            d = g_stop_queue.pop()
+        if d not in g_stopped_devices:
+            return d
+    return None
+
+def mark_stopped(d):
+    g_stopped_devices[d] = None
+    pos = g_live_positions.pop(d)
+    last = g_live.pop()
+    if last is not d:   # Move the last live device into its place
+        g_live[pos] = last
+        g_live_positions[last] = pos
+
 def num_devices():
     global g_devices
-    n = len(g_devices)
+    n = len(g_devices) + len(g_stubs)
     return n
 
-def get_device_by_property(prop, value):
-    global g_devices
+# Property index
+# The first time devices are looked up by a property, an index of that property is built, and from then on
+# Basic.set_property() and set_properties() keep it up to date (via reindex()), so lookups don't scan every device.
+
+class Bucket():
+    """The devices which have one value of an indexed property"""
+    def __init__(self):
+        self.devices = {}       # Device -> its position in g_devices
+        self.in_order = True    # Are self.devices in order of position?
+        self.last = -1
+
+    def add(self, d):
+        pos = g_positions[d]
+        if pos < self.last:
+            self.in_order = False
+        else:
+            self.last = pos
+        self.devices[d] = pos
+
+    def remove(self, d):
+        self.devices.pop(d, None)
+
+    def in_creation_order(self):
+        if not self.in_order:
+            self.devices = dict(sorted(self.devices.items(), key=lambda x: x[1]))
+            self.in_order = True
+        return list(self.devices)
+
+def index_property(prop):
+    g_index[prop] = {}
+    g_unhashable[prop] = {}
     for d in g_devices:
         if prop in d.properties:
-            if d.properties[prop] == value:
-                return d
+            add_to_index(d, prop, d.properties[prop])
+
+def add_to_index(d, prop, value):
+    try:
+        bucket = g_index[prop].get(value)
+    except TypeError:   # Unhashable, e.g. a list
+        g_unhashable[prop][d] = None
+        return
+    if bucket is None:
+        bucket = g_index[prop][value] = Bucket()
+    bucket.add(d)
+
+def remove_from_index(d, prop, value):
+    try:
+        bucket = g_index[prop].get(value)
+    except TypeError:
+        g_unhashable[prop].pop(d, None)
+        return
+    if bucket is not None:
+        bucket.remove(d)
+        if not bucket.devices:
+            del g_index[prop][value]
+
+def reindex(d, prop, value):
+    """Called just before device <d> sets indexed property <prop> to <value>"""
+    if d not in g_positions:    # Still being created (it'll be indexed once it has been)
+        return
+    if prop in d.properties:
+        remove_from_index(d, prop, d.properties[prop])
+    add_to_index(d, prop, value)
+
+def register_device(d):
+    g_positions[d] = len(g_devices)
+    g_devices.append(d)
+    g_live_positions[d] = len(g_live)
+    g_live.append(d)
+    g_stop_queue.append(d)
+    g_devices_dict[d.properties["$id"]] = d
+    for prop in g_index:
+        if prop in d.properties:
+            add_to_index(d, prop, d.properties[prop])
+
+def matching(prop, value):
+    """Devices whose <prop> is <value>, as a dict whose keys are in order of creation"""
+    if prop not in g_index:
+        index_property(prop)
+    try:
+        bucket = g_index[prop].get(value)
+    except TypeError:   # An unhashable value can only match unhashable values
+        return {d : None for d in g_devices if d in g_unhashable[prop] and d.properties[prop] == value}
+    if bucket is None:
+        return {}
+    bucket.in_creation_order()
+    return bucket.devices
+
+def get_device_by_property(prop, value):
+    for d in matching(prop, value):
+        return d
     return None
 
 def get_devices_by_property(prop, value):
     # Same as above, but return list of all matching devices
-    global g_devices
-    devs = []
-    for d in g_devices:
-        if prop in d.properties:
-            if d.properties[prop] == value:
-                devs.append(d)
-    return devs
+    return list(matching(prop, value))
+
+def get_devices_by_properties(props):
+    """All devices which match every one of <props> (a dict of property name -> value), in order of creation"""
+    matches = sorted([matching(prop, value) for (prop, value) in props.items()], key=len)
+    return [d for d in matches[0] if all([d in m for m in matches[1:]])]
 
 def get_devices():
     return g_devices
@@ -172,19 +392,36 @@ def external_event(params):
     body = params["body"]
     try:
         logging.debug("external Event received: "+str(params))
-        for d in g_devices:
-            if d.properties["$id"] == body["deviceId"]:
-                arg = body.get("arg", None)
-                d.external_event(body["eventName"], arg)
-                return
+        d = get_device_by_property("$id", body["deviceId"])
+        if d is not None:
+            arg = body.get("arg", None)
+            d.external_event(body["eventName"], arg)
+            return
         logging.error("No such device "+str(body["deviceId"])+" for incoming event "+str(body["eventName"]))
     except Exception as e:
         logging.error("Error processing external_event: "+str(e))
         logging.error(traceback.format_exc())
 
 
+def get_checkpoint():
+    return (g_devices, g_stopped_devices, g_live, g_parked_devices, g_device_number, g_stubs, g_stop_random.getstate())
+
+def restore_checkpoint(state):
+    global g_devices, g_devices_dict, g_stopped_devices, g_live, g_live_positions, g_stop_queue, g_parked_devices, g_device_number, g_stubs, g_positions, g_index, g_unhashable
+    (g_devices, g_stopped_devices, g_live, g_parked_devices, g_device_number, g_stubs, stop_random_state) = state
+    g_stop_random.setstate(stop_random_state)
+    g_devices_dict = {d.properties["$id"] : d for d in g_devices}
+    g_positions = {d : i for (i, d) in enumerate(g_devices)}
+    g_live_positions = {d : i for (i, d) in enumerate(g_live)}
+    g_stop_queue = collections.deque([d for d in g_devices if d not in g_stopped_devices])
+    for d in g_devices:     # So devices created from now on share the restored schemas (see common/property_store.py)
+        d.__class__.property_schema = d.properties.schema
+    g_index = {}    # Rebuilt as needed
+    g_unhashable = {}
+
 def close():
     global g_devices
     """Close all devices"""
     for d in g_devices:
-        d.close()
+        if d not in g_parked_devices:
+            d.close()
@@ -19,7 +19,7 @@ Device properties created::
 import logging
 import time
 
-from .device import Device
+from .device import Device, pass_through
 
 POLL_INTERVAL_S = 60 * 15
 
@@ -31,13 +31,16 @@ class Aggregate(Device):
         self.numbers_to_aggregate = params["aggregate"].get("numbers", [])
         self.booleans_to_aggregate = params["aggregate"].get("booleans", [])
 
+    @pass_through
     def comms_ok(self):
         return super(Aggregate,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Aggregate,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Aggregate,self).close()
 
@@ -20,6 +20,11 @@ Device properties created::
         "is_demo_device" : to identify that this is a Synth-created device
         "label" : A human-readable label "Device 0", "Device 1" etc.
     }
+
+While output is muted (outside the engine's output_start..output_end window, or during a mute_for action) messages are thrown away,
+so a device needn't build them at all - as long as what it does next doesn't depend on what happened to them
+(for example, comms buffers unsent messages, so it does). A device class promises this by setting transmission_independent = True,
+and a device skips its messages while muted only if all of its classes do.
 """
 
 import random
@@ -27,18 +32,24 @@ import logging
 import isodate
 from .device import Device
 from common import importer
+from common.property_store import Schema, Properties, ABSENT
+import device_factory   # For its property index
 
 class Basic(Device):
+    transmission_independent = True
+    skip_output_when_muted = False  # Set by device_factory.compose_class()
     device_number = 0
     myRandom = random.Random()  # Use our own private random-number generator, so we will repeatably generate the same device ID's regardless of who else is asking for random numbers
     myRandom.seed(1234)
+    random = random     # Devices draw from self.random rather than the random module, so they can have their own streams (see random_streams.py)
+    rng_streams = None  # Class name -> this device's own stream in place of that class's myRandom (see random_of())
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         self.instance_name = instance_name
         self.creation_time = time
         self.engine = engine
         self.update_callback = update_callback
         if not hasattr(self, "properties"):
-            self.properties = {}
+            self.properties = self.new_properties()
         self.model = None   # May get set later if we're in a model
         label_root = "Device "
         use_label_as_id = False
@@ -51,7 +62,7 @@ class Basic(Device):
             if "clock_skew_max_advance" in params["basic"]:
                 max_advance = isodate.parse_duration(params["basic"].get("clock_skew_max_advance")).total_seconds()
                 max_retard = isodate.parse_duration(params["basic"].get("clock_skew_max_retard")).total_seconds() 
-                skew = Basic.myRandom.random() * (max_advance - max_retard)
+                skew = self.random_of(Basic).random() * (max_advance - max_retard)
                 self.clock_skew = max_retard + skew
             self.always_send_metadata = params["basic"].get("always_send_metadata", None)
             self.no_metadata = params["basic"].get("no_metadata", False)
@@ -69,16 +80,24 @@ class Basic(Device):
             self.properties["$id"] = label  # label.replace(" ","_") # Should really replace ALL illegal characters
         else:
             if not "$id" in self.properties:
-                self.properties["$id"] = "-".join([format(Basic.myRandom.randrange(0,255),'02x') for i in range(6)])  # A 6-byte MAC address 01-23-45-67-89-ab
+                self.properties["$id"] = "-".join([format(self.random_of(Basic).randrange(0,255),'02x') for i in range(6)])  # A 6-byte MAC address 01-23-45-67-89-ab
             if not self.no_metadata:
                 self.properties["label"] = label
 
         if not self.no_metadata:    # What no_metadata really means is "don't spew stuff out at boot"
-            self.do_comms(self.properties, force_comms=True) # Communicate ALL properties on boot (else device and its properties might not be created if comms is down).
+            if not "$ts" in self.properties:
+                self.properties["$ts"] = self.engine.get_now() + self.clock_skew
+            self.do_comms(self.properties.copy(), force_comms=True) # Communicate ALL properties on boot (else device and its properties might not be created if comms is down).
         logging.info("Created device " + str(Basic.device_number+1) + " : " + self.properties["$id"])
         Basic.device_number = Basic.device_number + 1
         self.in_property_group = False
         
+    def random_of(self, c):
+        """The generator to draw from in place of <c>.myRandom"""
+        if self.rng_streams is None:
+            return c.myRandom
+        return self.rng_streams[c.__name__]
+
     def external_event(self, event_name, arg):
         logging.info("Received external event "+event_name+" for device "+str(self.properties["$id"]))
 
@@ -88,10 +107,18 @@ class Basic(Device):
     def comms_ok(self):
         return True
 
+    def new_properties(self):
+        """Properties are stored compactly, in slots defined by a schema shared by all devices of the same class (see common/property_store.py)"""
+        cls = self.__class__
+        schema = cls.__dict__.get("property_schema")
+        if schema is None:
+            schema = cls.property_schema = Schema()
+        return Properties(schema)
+
     def set_id(self, new_id):
         """Set device id - call this before super() in child classes if you want to override the id that this base class will normally set """
         if not hasattr(self, "properties"):
-            self.properties = {}
+            self.properties = self.new_properties()
         self.properties.update({ "$id" : new_id })
 
     def enrich_metadata(self, properties):
@@ -125,6 +152,8 @@ class Basic(Device):
             properties["$id"] = self.properties["$id"]
         if not "$ts" in properties: # Ensure there's a timestamp
             properties["$ts"] = timestamp
+        if self.skip_output_when_muted and self.engine.muting and self.engine.output_muted(timestamp):
+            return
         # logging.info("About to self.transmit")
         self.transmit(self.properties["$id"], timestamp, properties, force_comms)
 
@@ -154,31 +183,38 @@ class Basic(Device):
                      force_send = False,
                      timestamp = None):
         """Set device property and transmit an update"""
-        if not prop_name in self.properties:
-            changed = True
-        elif self.properties[prop_name] != value:
-            changed = True
-        else:
-            changed = False
+        props = self.properties
+        old_value = props.get(prop_name, ABSENT)
+        changed = old_value is ABSENT or old_value != value
 
         if timestamp == None:
             timestamp = self.engine.get_now() + self.clock_skew
 
-        new_props = { prop_name : value, "$id" : self.properties["$id"], "$ts" : timestamp }
-        self.properties.update(new_props)
-        # logging.info("set_prop")
+        if prop_name != "$id":  # A device's $id can't be changed this way
+            if prop_name in device_factory.g_index:
+                device_factory.reindex(self, prop_name, value)
+            props[prop_name] = value
+        props["$ts"] = timestamp
+        if self.skip_output_when_muted and self.engine.muting and not self.in_property_group and self.engine.output_muted(timestamp):
+            return  # Just the state changes that sending would have made
+
         if changed or always_send:
-            # logging.info("c or as")
+            the_id = props["$id"]
             if self.in_property_group:
-                # logging.info("in group")
-                self.property_group.update(new_props)
+                group = self.property_group
+                group[prop_name] = value
+                group["$id"] = the_id
+                group["$ts"] = timestamp
             else:
-                # logging.info("not in group")
-                self.do_comms(new_props, timestamp = timestamp, force_comms = force_send)
+                self.do_comms({ prop_name : value, "$id" : the_id, "$ts" : timestamp }, timestamp = timestamp, force_comms = force_send)
 
     def set_properties(self, new_props):
         np = new_props.copy()
         np.update({ "$id" : self.properties["$id"], "$ts" : self.engine.get_now() + self.clock_skew })  # Force ID and timestamp to be correct
+        if device_factory.g_index:
+            for (k, v) in np.items():
+                if k in device_factory.g_index:
+                    device_factory.reindex(self, k, v)
         self.properties.update(np)
         self.do_comms(np)    # TODO: Suppress if unchanged
 
@@ -22,7 +22,7 @@ Device properties created::
 """
 
 
-from .device import Device
+from .device import Device, pass_through
 import random
 import isodate
 import logging
@@ -30,12 +30,13 @@ import logging
 REPORT_PERIOD = 60*60*24    # It would be more elegant to only report when battery percentage (an integer) changes, but that would mean very infrequent reporting which isn't good for demos
 
 class Battery(Device):
+    transmission_independent = True    # See basic.py
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """Set battery life with a normal distribution which won't exceed 2 standard deviations."""
         super(Battery,self).__init__(instance_name, time, engine, update_callback, context, params)
         mu = isodate.parse_duration(params["battery"].get("life_mu", "P365D")).total_seconds()
         sigma = isodate.parse_duration(params["battery"].get("life_sigma", "P90D")).total_seconds()
-        life = random.normalvariate(mu, sigma)
+        life = self.random.normalvariate(mu, sigma)
         life = min(life, mu+2*sigma)
         life = max(life, mu-2*sigma)
         if life < 24*60*60:
@@ -59,6 +60,7 @@ class Battery(Device):
             self.set_property("battery", 100)
             self.engine.register_event_in(self.battery_life/100.0, self.tick_battery_decay, self, self)
 
+    @pass_through
     def close(self):
         super(Battery,self).close()
         
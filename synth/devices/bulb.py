@@ -19,7 +19,7 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers.solar import solar
 import random
 
@@ -31,17 +31,20 @@ class Bulb(Device):
         super(Bulb,self).__init__(instance_name, time, engine, update_callback, context, params)
         self.power = params["bulb"].get("power", None)
         if type(self.power) == list:
-            self.power = random.choice(self.power)
+            self.power = self.random.choice(self.power)
         self.set_property("switched_on", False)
-        engine.register_event_in(random.randrange(MIN_INTERVAL_S, MAX_INTERVAL_S), self.tick_bulb, self, self)
+        engine.register_event_in(self.random.randrange(MIN_INTERVAL_S, MAX_INTERVAL_S), self.tick_bulb, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Bulb,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Bulb,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Bulb,self).close()
 
@@ -54,17 +57,17 @@ class Bulb(Device):
             if external_light > 0:
                 self.set_property("switched_on", False)
             else:
-                if random.random() > 0.5:   # Quite likely to turn light off during the day
+                if self.random.random() > 0.5:   # Quite likely to turn light off during the day
                     self.set_property("switched_on", False)
         else:   # Currently switched off
             if external_light < 0.2:
                 self.set_property("switched_on", True)
             else:
-                if random.random() > 0.8:   # Pretty likely to turn light on during the night
+                if self.random.random() > 0.8:   # Pretty likely to turn light on during the night
                     self.set_property("switched_on", True)
         if self.power:
             if self.get_property("switched_on"):
                 self.set_property("power", self.power, always_send=False)
             else:
                 self.set_property("power", 0, always_send=False)
-        self.engine.register_event_in(random.randrange(MIN_INTERVAL_S, MAX_INTERVAL_S), self.tick_bulb, self, self)
+        self.engine.register_event_in(self.random.randrange(MIN_INTERVAL_S, MAX_INTERVAL_S), self.tick_bulb, self, self)
@@ -18,7 +18,7 @@ Device properties created::
 """
    
 import logging
-from .device import Device
+from .device import Device, pass_through
 from common import importer
 
 class Button(Device):
@@ -29,12 +29,15 @@ class Button(Device):
         self.button_timefunction = importer.get_class("timefunction", list(tf.keys())[0])(engine, self, tf[list(tf.keys())[0]])
         engine.register_event_at(self.button_timefunction.next_change(), self.tick_button, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Button, self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Button, self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Button, self).close()
 
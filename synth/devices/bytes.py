@@ -16,7 +16,7 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 import logging
 
 BYTECOUNT_SEND_INTERVAL_S = 60 * 60
@@ -27,12 +27,15 @@ class Bytes(Device):
         super(Bytes,self).__init__(instance_name, time, engine, update_callback, context, params)
         self.engine.register_event_in(BYTECOUNT_SEND_INTERVAL_S, self.tick_sendbytes, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Bytes,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Bytes,self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Bytes,self).close()
 
@@ -10,7 +10,7 @@ Device properties created::
     }
 """
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import grid_carbon
 import logging
 
@@ -20,12 +20,15 @@ class Carbon(Device):
         self.read_intensity()
         engine.register_event_at(grid_carbon.next_tick(self.engine.get_now()), self.tick_reading, None, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Carbon,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Carbon,self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Carbon,self).close()
 
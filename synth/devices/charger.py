@@ -35,7 +35,7 @@ import datetime
 from .helpers import opening_times as opening_times
 from .helpers import ev_mfrs as ev_mfrs
 from common import utils
-from .device import Device
+from .device import Device, pass_through
 
 MINS = 60
 HOURS = MINS * 60
@@ -109,7 +109,7 @@ class Charger(Device):
     myRandom.seed(5678)
 
     def expo_random(self, min_val, max_val, av_val):
-        n = Charger.myRandom.expovariate(1/av_val)
+        n = self.random_of(Charger).expovariate(1/av_val)
         n = min(max_val, n)
         n = max(min_val, n)
         return n
@@ -130,7 +130,7 @@ class Charger(Device):
             "model" : model,
             "max_kW" : max_rate,
             "datasheet" : datasheet,
-            "monthly_value" : max_rate * POWER_TO_MONTHLY_VALUE * Charger.myRandom.random() * 2
+            "monthly_value" : max_rate * POWER_TO_MONTHLY_VALUE * self.random_of(Charger).random() * 2
         } )
 
         self.opening_time_pattern = opening_times.pick_pattern(self.loc_rand)
@@ -156,6 +156,7 @@ class Charger(Device):
         self.engine.register_event_in(HEARTBEAT_PERIOD, self.tick_heartbeat, self, self)
         self.engine.register_event_at(self.time_of_next_charge(), self.tick_start_charge, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Charger,self).comms_ok()
 
@@ -172,6 +173,7 @@ class Charger(Device):
         else:
             logging.error("Ignoring unrecognised external event "+str(event_name))
 
+    @pass_through
     def close(self):
         super(Charger,self).close()
     
@@ -203,7 +205,7 @@ class Charger(Device):
             var *= self.loc_rand    # 0..1 based on location
             mtbf = mtbf * (1-var)   # Decrease MTBF by var (i.e. make it less reliable)
             chance = sampling_interval_s / mtbf # 50% point
-            if Charger.myRandom.random() < chance * 0.5:
+            if self.random_of(Charger).random() < chance * 0.5:
                 if self.get_property("max_kW") == 50:   # 50kW chargers report different error codes (example of a real-world bizarreness)
                     fault = ALT_FAULT_CODES[fault]
                 return fault
@@ -225,7 +227,7 @@ class Charger(Device):
 
     def tick_start_charge(self, _):
         # Maybe this is an ICEing, not a charge
-        if Charger.myRandom.random() < CHANCE_OF_ICEING:
+        if self.random_of(Charger).random() < CHANCE_OF_ICEING:
             self.set_property("occupied", True)
             self.engine.register_event_at(self.time_of_next_charge(), self.tick_end_iceing, self, self) # An iceing takes as long as a charge, let's say
             return
@@ -235,7 +237,7 @@ class Charger(Device):
             self.engine.register_event_at(self.time_of_next_charge(), self.tick_start_charge, self, self)
             return
 
-        if Charger.myRandom.random() < CHANCE_OF_SILENT_FAULT:    # Start a silent fault
+        if self.random_of(Charger).random() < CHANCE_OF_SILENT_FAULT:    # Start a silent fault
             self.silent_fault = True
 
         if self.silent_fault:   # For now, silent faults never end
@@ -246,7 +248,7 @@ class Charger(Device):
         rate = self.choose_percent(CHARGE_RATES_KW_PERCENT) # What rate would car like to charge?
         rate = min(rate, self.get_property("max_kW"))       # Limit to charger capacity
         self.charging_rate_kW = rate
-        if Charger.myRandom.random() < CHANCE_OF_ZERO_ENERGY_CHARGE:
+        if self.random_of(Charger).random() < CHANCE_OF_ZERO_ENERGY_CHARGE:
             logging.info(self.get_property("$id")+": Starting zero energy charge")
             self.charging_rate_kW = 0 
         self.energy_to_transfer = self.expo_random(KWH_PER_CHARGE_MIN, KWH_PER_CHARGE_MAX, KWH_PER_CHARGE_AV)
@@ -273,7 +275,7 @@ class Charger(Device):
            "energy_delta" : 0,
            "power" : 0
            })
-        self.engine.register_event_in(Charger.myRandom.random() * FAULT_RECTIFICATION_TIME_AV * 2, self.tick_rectify_fault, self, self)
+        self.engine.register_event_in(self.random_of(Charger).random() * FAULT_RECTIFICATION_TIME_AV * 2, self.tick_rectify_fault, self, self)
 
     def tick_check_charge(self, _):
         # (faults can be externally-injected)
@@ -297,8 +299,8 @@ class Charger(Device):
                 self.engine.register_event_in(CHARGE_POLL_INTERVAL_S, self.tick_check_charge, self, self)
             else:                                                                   # FINISHED CHARGING
                 self.time_finished_charging = self.engine.get_now()
-                if Charger.myRandom.random() < CHANCE_OF_BLOCKING:
-                    self.will_block_for = Charger.myRandom.random() * self.average_blocking_time_s   # BLOCKING
+                if self.random_of(Charger).random() < CHANCE_OF_BLOCKING:
+                    self.will_block_for = self.random_of(Charger).random() * self.average_blocking_time_s   # BLOCKING
                     self.set_properties_with_metadata({
                         "pilot" : "B",
                         "energy" : int(self.energy_this_charge),
@@ -361,7 +363,7 @@ class Charger(Device):
     def should_charge_at(self, epoch):
         # Given a time, should we charge at it?
         chance = opening_times.chance_of_occupied(epoch, self.opening_time_pattern)
-        yes = chance > Charger.myRandom.random()
+        yes = chance > self.random_of(Charger).random()
         return yes
 
     def time_of_next_charge(self):
@@ -376,11 +378,11 @@ class Charger(Device):
             # interval = min(interval, nominal * 10)
             # interval *= opening_times.average_occupancy()   # Rescale interval to compensate for the average likelihood of opening_times() returning True (so on average we'll hit our target number of charges per day)
             # t0 += interval
-            t0 += Charger.myRandom.random() * MAX_INTERVAL_BETWEEN_POTENTIAL_CHARGES_S 
+            t0 += self.random_of(Charger).random() * MAX_INTERVAL_BETWEEN_POTENTIAL_CHARGES_S 
 
 
     def choose_percent(self, table):
-        percent = Charger.myRandom.randrange(0, 100)
+        percent = self.random_of(Charger).randrange(0, 100)
         choice = 0
         cum_likelihood = 0
         while True:
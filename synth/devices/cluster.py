@@ -20,7 +20,7 @@ Device properties created::
 """
 
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import opening_times as opening_times
 import random
 import isodate
@@ -48,20 +48,23 @@ class Cluster(Device):
         self.occupancy_pattern = params["cluster"].get("occupancy_pattern", DEFAULT_OCCUPANCY_PATTERN)
         self.occupancy_randomness = params["cluster"].get("occupancy_randomness", DEFAULT_OCCUPANCY_RANDOMNESS)
         time_skew_randomness = params["cluster"].get("time_skew_randomness", DEFAULT_TIME_SKEW_RANDOMNESS)
-        self.num_slots = Cluster.myRandom.randrange(min_slots, max_slots)
-        self.time_skew = time_skew_randomness / 2.0 + Cluster.myRandom.random() * time_skew_randomness / 2.0
+        self.num_slots = self.random_of(Cluster).randrange(min_slots, max_slots)
+        self.time_skew = time_skew_randomness / 2.0 + self.random_of(Cluster).random() * time_skew_randomness / 2.0
         self.available_slots = self.calc_occupancy()
         self.set_properties({"num_slots" : self.num_slots, "available_slots" : self.available_slots})
 
         engine.register_event_in(TICK_INTERVAL_S, self.tick_availability, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Cluster,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Cluster,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Cluster,self).close()
 
@@ -74,7 +77,7 @@ class Cluster(Device):
 
     def calc_occupancy(self):
         occupancy = opening_times.chance_of_occupied(self.engine.get_now() + self.time_skew, self.occupancy_pattern)
-        occupancy = occupancy - self.occupancy_randomness / 2.0 + Cluster.myRandom.random() * self.occupancy_randomness / 2.0
+        occupancy = occupancy - self.occupancy_randomness / 2.0 + self.random_of(Cluster).random() * self.occupancy_randomness / 2.0
         return occupancy
 
 
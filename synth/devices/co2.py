@@ -22,7 +22,7 @@ import random
 import logging
 import time
 
-from .device import Device
+from .device import Device, pass_through
 
 CO2_POLL_INTERVAL_S = 60 * 15
 
@@ -31,23 +31,26 @@ MAX_CO2_LEVEL_PPM = 5000
 
 COUPLING = 0.1  # The bigger this is, the quicker CO2 rises and falls
 
-def sensor_noise(n):
+def sensor_noise(n, rand):
     noise_level = MIN_CO2_LEVEL_PPM / 10.0
-    return int(n - noise_level/2 + random.random() * noise_level)
+    return int(n - noise_level/2 + rand.random() * noise_level)
 
 class Co2(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         super(Co2,self).__init__(instance_name, time, engine, update_callback, context, params)
-        self.co2_ppm = sensor_noise(MIN_CO2_LEVEL_PPM)
+        self.co2_ppm = sensor_noise(MIN_CO2_LEVEL_PPM, self.random)
         self.engine.register_event_in(CO2_POLL_INTERVAL_S, self.tick_co2, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Co2,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Co2,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Co2,self).close()
 
@@ -71,6 +74,6 @@ class Co2(Device):
 
         target = MIN_CO2_LEVEL_PPM + (MAX_CO2_LEVEL_PPM - MIN_CO2_LEVEL_PPM) * occupancy_fraction
         self.co2_ppm = (self.co2_ppm * (1-COUPLING)) + (target * COUPLING)
-        self.set_property("co2_ppm", sensor_noise(self.co2_ppm))
+        self.set_property("co2_ppm", sensor_noise(self.co2_ppm, self.random))
         self.engine.register_event_in(CO2_POLL_INTERVAL_S, self.tick_co2, self, self)
 
@@ -28,7 +28,7 @@ Device properties created::
 """
 
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import timewave
 import random
 import isodate
@@ -46,7 +46,7 @@ class Comms(Device):
         self.comms_reliability = params["comms"].get("reliability", 1.0)    # 0..1 or the word "rssi"
         if self.comms_reliability == "rssi":
             rssi_span = BEST_RSSI-WORST_RSSI
-            self.rssi_mean = WORST_RSSI + rssi_span*0.2 + random.random() * rssi_span*0.8   # Mean value for RSSI of any particular device lies between a fifth and four fifths of the range
+            self.rssi_mean = WORST_RSSI + rssi_span*0.2 + self.random.random() * rssi_span*0.8   # Mean value for RSSI of any particular device lies between a fifth and four fifths of the range
             self.rssi_sigma = rssi_span/12 
             self.set_rssi()
         self.comms_up_down_period = isodate.parse_duration(params["comms"].get("period", "P1D")).total_seconds()
@@ -90,6 +90,7 @@ class Comms(Device):
             else:
                 pass # Discard data
                  
+    @pass_through
     def external_event(self, event_name, arg):
         super(Comms, self).external_event(event_name, arg)
 
@@ -104,7 +105,7 @@ class Comms(Device):
     # Private methods
 
     def set_rssi(self):
-        self.rssi = random.normalvariate(self.rssi_mean, self.rssi_sigma)
+        self.rssi = self.random.normalvariate(self.rssi_mean, self.rssi_sigma)
         self.rssi = min(self.rssi, BEST_RSSI)
         self.rssi = max(self.rssi, WORST_RSSI)
         self.rssi = int(self.rssi)
@@ -112,13 +113,13 @@ class Comms(Device):
 
     def is_rssi_good_enough(self):
         if self.rssi > self.rssi_knee:
-            result = random.random() < self.chance_above_knee
+            result = self.random.random() < self.chance_above_knee
             # print "self.rssi = ",self.rssi,"which is above knee, so result is",result
             return result
         else:
             chance = float(self.rssi - WORST_RSSI)/(self.rssi_knee-WORST_RSSI)   # normalise our position on line from worst to knee
             chance = self.chance_at_worst + chance * (self.chance_above_knee - self.chance_at_worst) 
-            result = random.random() < chance
+            result = self.random.random() < chance
             # print "self.rssi = ",self.rssi,"which is below knee, so result is",result
             return result
 
@@ -147,7 +148,7 @@ class Comms(Device):
 
     def tick_comms_up_down(self, _):
         if isinstance(self.comms_reliability, (int,float)):   # Simple probability
-            self.change_comms(self.comms_reliability > random.random())
+            self.change_comms(self.comms_reliability > self.random.random())
         elif self.comms_reliability=="rssi":
             self.set_rssi()
             self.change_comms(self.is_rssi_good_enough())
@@ -157,7 +158,7 @@ class Comms(Device):
         if self.comms_metronomic_period:
             delta_time = self.comms_up_down_period
         else:
-            delta_time = random.expovariate(1.0 / self.comms_up_down_period)
+            delta_time = self.random.expovariate(1.0 / self.comms_up_down_period)
             delta_time = max(delta_time, 60.0) # never more than once a minute
             delta_time = min(delta_time, self.comms_up_down_period * 10.0) # Limit long tail
         self.engine.register_event_in(delta_time, self.tick_comms_up_down, self, self)
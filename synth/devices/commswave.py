@@ -20,7 +20,7 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 from common import importer
 import logging
 import inspect
@@ -69,6 +69,7 @@ class Commswave(Device):
         # logging.info("commswave.transmit("+str(properties)+") called from "+str(inspect.stack()[1]))
         super(Commswave, self).transmit(the_id, ts, properties, force_comms)
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Commswave, self).external_event(event_name, arg)
 
@@ -1,6 +1,12 @@
 # abc for a device
 from abc import ABCMeta, abstractmethod
 
+def pass_through(method):
+    """Mark a method whose body is just "[return] super(Cls, self).<same name>(<same args>)".
+       A composite device class then calls the next real implementation directly (see device_factory.flatten_methods())"""
+    method.pass_through = True
+    return method
+
 class Device(object):
     __metaclass__ = ABCMeta
 
@@ -61,7 +61,7 @@ import time
 import isodate
 from math import sin, pi
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import opening_times
 from .helpers.solar import solar
 import device_factory
@@ -96,9 +96,9 @@ Sun = [0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0
 
 normal_office_hours = [Mon, Tue, Wed, Thu, Fri, Sat, Sun]
 
-def weighted_choice(choices):
+def weighted_choice(choices, rand):
     total = sum(w for c, w in choices)
-    r = random.uniform(0, total)
+    r = rand.uniform(0, total)
     upto = 0
     for c, w in choices:
         if upto + w >= r:
@@ -106,9 +106,9 @@ def weighted_choice(choices):
         upto += w
     assert False, "Shouldn't get here"
 
-def half_tail(min, sigma):
+def half_tail(min, sigma, rand):
     while True:
-        r = random.gauss(min, sigma)
+        r = rand.gauss(min, sigma)
         if (r >= min) and (r < min * 10.0): # Select only positive half of gaussian distribution (and remove outliers beyond 10x the mean)
             return r
 
@@ -130,7 +130,7 @@ class Disruptive(Device):
                 self.sensor_type = "temperature"
             else:
                 self.sensor_type = "proximity"
-            # self.sensor_type = weighted_choice([("ccon",5), ("temperature",38), ("proximity",33), ("touch",2)])
+            # self.sensor_type = weighted_choice([("ccon",5), ("temperature",38), ("proximity",33), ("touch",2)], self.random)
         self.set_property("sensorType", self.sensor_type)           # DT's official property for sensor type
         self.set_property("device_type", "DT_"+self.sensor_type)    # In DP demos we tend to use this property
 
@@ -143,7 +143,7 @@ class Disruptive(Device):
         if(self.sensor_type == "temperature"):
             self.nominal_temperature = params["disruptive"].get("nominal_temp", DEFAULT_NOMINAL_TEMP_C)
             if isinstance(self.nominal_temperature, list):
-                choice = random.randint(0,len(self.nominal_temperature)-1)
+                choice = self.random.randint(0,len(self.nominal_temperature)-1)
                 self.nominal_temperature = self.nominal_temperature[choice]
             if "nominal_temp" in params["disruptive"]:
                 self.set_property("nominal_temp", self.nominal_temperature)
@@ -169,13 +169,16 @@ class Disruptive(Device):
         if not Disruptive.odd_site:
             Disruptive.site_count += 1
 
+    @pass_through
     def comms_ok(self):
         return super(Disruptive,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Disruptive,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Disruptive,self).close()
 
@@ -200,12 +203,12 @@ class Disruptive(Device):
         if self.cooling_mtbf is not None:
             if not self.having_cooling_failure:
                 chance_of_cooling_failure = float(TEMPERATURE_INTERVAL) / self.cooling_mtbf
-                if random.random() < chance_of_cooling_failure:
+                if self.random.random() < chance_of_cooling_failure:
                     logging.info("Cooling failure on device "+str(self.get_property("$id")))
                     self.having_cooling_failure = True
             else:
                 chance_of_failure_ending = TEMPERATURE_INTERVAL / self.cooling_ttf
-                if random.random() < chance_of_failure_ending:
+                if self.random.random() < chance_of_failure_ending:
                     logging.info("Cooling failure fixed on device "+str(self.get_property("$id")))
                     self.having_cooling_failure = False
 
@@ -250,15 +253,15 @@ class Disruptive(Device):
                     weekday = (weekday + 1) % 7
                 # logging.info("tick_presence considering weekday="+str(weekday)+" hour="+str(hour))
                 chance_of_opening = normal_office_hours[weekday][int(hour)]/9.0  # Rescale 0..9 to 0..1
-                if random.random() <= chance_of_opening:
+                if self.random.random() <= chance_of_opening:
                     break
             self.engine.register_event_in(delta_hours*60*60, self.tick_presence, self, self)
         else:   # Door just opened, so consider when it should next close
-            if random.random() < 1.0/CHANCE_OF_DOOR_LEFT_OPEN:
-                delay = half_tail(1 * HOURS, 24 * HOURS)
+            if self.random.random() < 1.0/CHANCE_OF_DOOR_LEFT_OPEN:
+                delay = half_tail(1 * HOURS, 24 * HOURS, self.random)
                 logging.info("Door will be left open for "+str(int(delay/60))+"m on "+str(self.get_property("$id")))
             else:
-                delay = half_tail(AV_DOOR_OPEN_MIN_TIME_S, AV_DOOR_OPEN_SIGMA_S)
+                delay = half_tail(AV_DOOR_OPEN_MIN_TIME_S, AV_DOOR_OPEN_SIGMA_S, self.random)
             self.engine.register_event_in(delay, self.tick_presence, self, self)
 
     def get_peers(self):
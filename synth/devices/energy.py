@@ -28,7 +28,7 @@ import logging
 import time
 import isodate
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import opening_times as opening_times
 
 DEFAULT_ENERGY_READING_INTERVAL = "PT30M"
@@ -65,26 +65,29 @@ class Energy(Device):
         if self.test_mode is not None:
             kWh = 0
         else:
-            kWh = int(random.random() * 100000)
+            kWh = int(self.random.random() * 100000)
         self.set_properties({"kW" : 0, "kWh" : kWh})    # First kW reading is zero, so that integrating kW over time gives us kWh correctly
         self.occupied_bodge = params["energy"].get("occupied_bodge", False)
         if self.occupied_bodge:
             self.set_property("occupied", False)    # !!!!!!!!!!! TEMP BODGE TO OVERCOME CLUSTERING PROBLEM
         if not self.no_metadata:
-            if random.random() > 0.5:
+            if self.random.random() > 0.5:
                 self.set_properties({"meter_type" : "electricity", "icon" : "bolt"})
             else:
                 self.set_properties({"meter_type" : "gas",  "icon" : "flame"})
         self.energy_reading_interval_s = isodate.parse_duration(params["energy"].get("reading_interval", DEFAULT_ENERGY_READING_INTERVAL)).total_seconds()
         self.engine.register_event_in(self.energy_reading_interval_s, self.tick_reading, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Energy,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Energy,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Energy,self).close()
 
@@ -98,7 +101,7 @@ class Energy(Device):
         else:
             open_chance = opening_times.chance_of_occupied(self.engine.get_now(), self.opening_times)
             kW = self.baseload_power_kW + open_chance * (self.max_power_kW - self.baseload_power_kW - self.power_variation_kW/2.0)
-            kW += random.random() * self.power_variation_kW
+            kW += self.random.random() * self.power_variation_kW
 
         kWh = self.get_property("kWh")
         kWh += kW * self.energy_reading_interval_s / (60 * 60.0)
@@ -108,12 +111,12 @@ class Energy(Device):
             kWh = int(100 * kWh) / 100.0
 
         reading_fault_chance = READING_FAULT_DAILY_CHANCE / ((60 * 60 * 24.0) / self.energy_reading_interval_s)
-        if (self.test_mode is None) and (random.random() < reading_fault_chance):
-            if random.random() > 0.5:
+        if (self.test_mode is None) and (self.random.random() < reading_fault_chance):
+            if self.random.random() > 0.5:
                 delta = 1
             else:
                 delta = -1
-            delta *= random.randrange(1000,10000)    # Jump by at least 1000 (kWh, so if 30min readings that implies insane 2MW load!)
+            delta *= self.random.randrange(1000,10000)    # Jump by at least 1000 (kWh, so if 30min readings that implies insane 2MW load!)
             logging.info("Energy meter reading fault on "+str(self.get_property("$id"))+" jumping by "+str(delta))
             kWh += delta
 
@@ -28,7 +28,7 @@ Device properties created::
 """
 
 
-from .device import Device
+from .device import Device, pass_through
 import random
 import isodate
 import logging
@@ -36,6 +36,7 @@ import logging
 DEFAULT_SIGMA_RATIO = 0.1   # If no sigma specified, it defaults to this fraction of the period
 
 class Enumerated(Device):
+    transmission_independent = True    # See basic.py
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """Create a property with enumerated events"""
         super(Enumerated, self).__init__(instance_name, time, engine, update_callback, context, params)
@@ -66,7 +67,7 @@ class Enumerated(Device):
         # Find most likely current state
         recip_periods = [1.0/x for x in self.enumerated_periods]    # The shorter the period, the more likely it is to be the current state]
         total_periods = sum(recip_periods)
-        choice = random.random() * total_periods
+        choice = self.random.random() * total_periods
         so_far = 0
         for i in range(len(self.enumerated_periods)):
             so_far += recip_periods[i]
@@ -78,12 +79,15 @@ class Enumerated(Device):
         for i in range(len(self.enumerated_values)):
             self.schedule_next_event(i)
 
+    @pass_through
     def comms_ok(self):
         return super(Enumerated, self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Enumerated, self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Enumerated,self).close()
 
@@ -112,7 +116,7 @@ class Enumerated(Device):
             sigma = period * DEFAULT_SIGMA_RATIO
         # logging.info("period = " + str(period) + " sigma = " + str(sigma))
 
-        dt = random.normalvariate(period, sigma)
+        dt = self.random.normalvariate(period, sigma)
         dt = min(dt, period + 2*sigma)
         dt = max(dt, period - 2*sigma)
         dt = max(dt, 1.0)   # Ensure we never create negative durations
@@ -26,7 +26,7 @@ Device properties created::
 import logging, datetime
 import pendulum, isodate
 import requests, json
-from .device import Device
+from .device import Device, pass_through
 from common import importer
 from common import plotting
 
@@ -69,6 +69,7 @@ class Expect(Device):
         else:
             self.engine.register_event_at(t_next, self.tick_window_start, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Expect,self).comms_ok()
 
@@ -17,16 +17,17 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 import random
 import logging
 
 class Firmware(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         super(Firmware,self).__init__(instance_name, time, engine, update_callback, context, params)
-        fw = random.choice(["0.51","0.52","0.6","0.6","0.6","0.7","0.7","0.7","0.7"])
+        fw = self.random.choice(["0.51","0.52","0.6","0.6","0.6","0.7","0.7","0.7","0.7"])
         self.set_properties({'factoryFirmware' : fw, 'firmware' : fw } )
 
+    @pass_through
     def comms_ok(self):
         return super(Firmware,self).comms_ok()
 
@@ -39,6 +40,7 @@ class Firmware(Device):
             logging.info("Factory-resetting firmware on device "+self.properties["$id"])
             self.set_property("firmware", self.get_property("factoryFirmware"))
 
+    @pass_through
     def close(self):
         super(Firmware,self).close()
 
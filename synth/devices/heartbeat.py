@@ -17,24 +17,28 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 import random
 import isodate
 import logging
 
 class Heartbeat(Device):
+    transmission_independent = True    # See basic.py
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """Simple metronomic heartbeat transmission so that server knows we're still here"""
         super(Heartbeat,self).__init__(instance_name, time, engine, update_callback, context, params)
         self.heartbeat_interval = isodate.parse_duration(params["heartbeat"].get("interval", "PT10M")).total_seconds()
         self.engine.register_event_in(self.heartbeat_interval, self.tick_heartbeat, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Heartbeat,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Heartbeat,self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Heartbeat, self).close()
 
@@ -33,7 +33,7 @@ import time
 from .helpers.solar import solar
 from .helpers import opening_times as opening_times
 
-from .device import Device
+from .device import Device, pass_through
 
 MINS = 60
 HOURS = MINS * 60
@@ -72,19 +72,22 @@ class Hvac(Device):
         self.set_property("device_type", "HVAC")
         self.set_property("mode", "fan")
         self.set_property("pump_run", False)
-        self.set_property("boiler_selection_mode", random.randrange(1,3))   # A number 0..3 expressing which of two boilers is supposed to be running
+        self.set_property("boiler_selection_mode", self.random.randrange(1,3))   # A number 0..3 expressing which of two boilers is supposed to be running
         self.pump_run_on_start_time = self.engine.get_now()
         self.temperature = 20
         self.hvac_functional = True # If false then we won't respond to demand
         self.engine.register_event_in(POLL_INTERVAL_S, self.tick_temperature, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Hvac,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Hvac,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Hvac,self).close()
 
@@ -131,7 +134,7 @@ class Hvac(Device):
         return INDOOR_OUTDOOR_COUPLING
 
     def tick_temperature(self, _):
-        self.hvac_functional = random.random() <= self.hvac_reliability
+        self.hvac_functional = self.random.random() <= self.hvac_reliability
         old_mode = self.get_property("mode")
         # Drive internal temperature according to weather
         external_temp, insolation = self.external_temp_and_insolation()
@@ -189,11 +192,11 @@ class Hvac(Device):
             self.set_property("pump_run", pump_run)
 
         p = {
-                "boiler1_run" : (mode=="heat") and (((self.get_property("boiler_selection_mode") & 1) != 0) or random.random() < 0.05),  # Small chance of boilers running when the Mode says they shouldn't
-                "boiler2_run" : (mode=="heat") and (((self.get_property("boiler_selection_mode") & 2) != 0) or random.random() < 0.05)
+                "boiler1_run" : (mode=="heat") and (((self.get_property("boiler_selection_mode") & 1) != 0) or self.random.random() < 0.05),  # Small chance of boilers running when the Mode says they shouldn't
+                "boiler2_run" : (mode=="heat") and (((self.get_property("boiler_selection_mode") & 2) != 0) or self.random.random() < 0.05)
         }
-        if(random.random() < 0.01):
-            p.update({"boiler_selection_mode" : random.randrange(1,3)})    # Always have SOME boiler on
+        if(self.random.random() < 0.01):
+            p.update({"boiler_selection_mode" : self.random.randrange(1,3)})    # Always have SOME boiler on
         self.set_properties(p)
 
         self.engine.register_event_in(POLL_INTERVAL_S, self.tick_temperature, self, self)
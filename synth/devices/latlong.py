@@ -29,7 +29,7 @@ Device properties created::
     }
 """
 
-from .device import Device
+from .device import Device, pass_through
 from common.geo import geo, google_maps
 import random
 import logging
@@ -37,6 +37,7 @@ import logging
 DEFAULT_MANDATORY_ADDRESS_FIELDS = set(["address_administrative_area_level_1", "address_administrative_area_level_2"])  # Never pick points which don't have at least these fields
 
 class Latlong(Device):
+    transmission_independent = True    # See basic.py
     address_index = 0
     prev_address_props = None
     further_devices_at_this_address = 0
@@ -82,7 +83,7 @@ class Latlong(Device):
                 if (len(dpa) == 1) or (dpa[0] == dpa[1]):
                     Latlong.further_devices_at_this_address = dpa[0]
                 else:
-                    Latlong.further_devices_at_this_address = random.randrange(dpa[0], dpa[1])
+                    Latlong.further_devices_at_this_address = self.random.randrange(dpa[0], dpa[1])
                 address_props = get_new_address()
             Latlong.further_devices_at_this_address -= 1
                 
@@ -91,12 +92,15 @@ class Latlong(Device):
         Latlong.prev_address_props = address_props
 
 
+    @pass_through
     def comms_ok(self):
         return super(Latlong,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Latlong,self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Latlong,self).close()
 
@@ -19,7 +19,7 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers.solar import solar
 import math, random
 
@@ -34,18 +34,21 @@ class Light(Device):
         self.generate = params["light"].get("generate", False)
         if self.generate:
             scalar = float(params["light"].get("generate_scalar", DEFAULT_GEN_SCALAR))
-            r = random.normalvariate(scalar, scalar/10.0)
+            r = self.random.normalvariate(scalar, scalar/10.0)
             self.gen_light_to_power_ratio = max(scalar * 0.7, min(scalar * 1.3, r))
             self.set_property("energy", 0.0)
         engine.register_event_in(0, self.tick_light, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Light,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Light,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Light,self).close()
 
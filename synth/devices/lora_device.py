@@ -18,7 +18,7 @@ import random
 import logging
 import time
 
-from .device import Device
+from .device import Device, pass_through
 import device_factory
 
 MINUTES = 60
@@ -46,13 +46,16 @@ class Lora_device(Device):
                 } )
         self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
     
+    @pass_through
     def comms_ok(self):
         return super(Lora_device, self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Lora_device,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Lora_device,self).close()
 
@@ -18,7 +18,7 @@ import random
 import logging
 import time
 
-from .device import Device
+from .device import Device, pass_through
 import device_factory
 
 MINUTES = 60
@@ -29,19 +29,22 @@ NETWORK_INTERVAL = 15 * MINUTES
 
 class Lora_gateway(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
-        self.set_id("eui-" +  "".join(random.choice("0123456789abcdef") for i in range(16)))
+        self.set_id("eui-" +  "".join(self.random.choice("0123456789abcdef") for i in range(16)))
         super(Lora_gateway,self).__init__(instance_name, time, engine, update_callback, context, params)
         # self.sensor_type = params["disruptive"].get("sensor_type", None)
         self.set_property("metadata.type", "gateway")
         self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
     
+    @pass_through
     def comms_ok(self):
         return super(Lora_gateway, self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Lora_gateway,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Lora_gateway,self).close()
 
@@ -24,7 +24,7 @@ Device properties created::
     }
 """
 
-from .device import Device
+from .device import Device, pass_through
 from common.geo import google_maps, geo
 import random, math
 import isodate
@@ -158,7 +158,7 @@ class Mobile(Device):
         self.stuck_in_transit_mtbf = params["mobile"].get("stuck_in_transit_mtbf", DEFAULT_STUCK_IN_TRANSIT_MTBF)
         self.stuck_in_transit_recovery_duration = params["mobile"].get("stuck_in_transit_recovery_duration", DEFAULT_STUCK_IN_TRANSIT_RECOVERY_DURATION)
         self.stuck_in_transit = False
-        self.tire_deflation_rate = min(1.0, 1.0 - random.gauss(0.001, 0.0001))
+        self.tire_deflation_rate = min(1.0, 1.0 - self.random.gauss(0.001, 0.0001))
         first_location_at_centre = params["mobile"].get("first_location_at_centre", False)
 
         the_key = str(self.area_centre) + "." + str(self.area_radius)  # Needs to be unique-enough between location groups 
@@ -171,7 +171,7 @@ class Mobile(Device):
         self.points.append(self.loc_group.base_location)   # All devices start at the base location
         for P in range(self.points_to_visit-1):
             while True:
-                loc = random.randrange(0, len(self.loc_group.locations))
+                loc = self.random.randrange(0, len(self.loc_group.locations))
                 if loc not in self.points:
                     break   # Ensure no repeats (which means we'll hang if we try to choose more points than locations!)
             self.points.append(loc)
@@ -183,12 +183,15 @@ class Mobile(Device):
 
         self.engine.register_event_in(self.update_period, self.tick_update_position, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Mobile,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Mobile,self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Mobile,self).close()
 
@@ -236,11 +239,11 @@ class Mobile(Device):
         else:                       # In transit (should be moving)
             if not self.stuck_in_transit:
                 if self.stuck_in_transit_mtbf is not None:
-                    if random.random() < float(self.update_period) / self.stuck_in_transit_mtbf:
+                    if self.random.random() < float(self.update_period) / self.stuck_in_transit_mtbf:
                         logging.info(self.get_property("$id")+" is now stuck in transit")
                         self.stuck_in_transit = True
             else:   # IS stuck in transit
-                if random.random() < float(self.update_period) / self.stuck_in_transit_recovery_duration:
+                if self.random.random() < float(self.update_period) / self.stuck_in_transit_recovery_duration:
                     logging.info(self.get_property("$id")+" is now unstuck and resuming transit")
                     self.stuck_in_transit = False
 
@@ -282,7 +285,7 @@ class Mobile(Device):
                             " with total journey time " + str(self.route_follower.total_journey_time()))
         else:
             miles = self.miles_between(lon_from, lat_from, lon_to, lat_to)
-            mph = random.randrange(MPH_MIN, MPH_MAX)
+            mph = self.random.randrange(MPH_MIN, MPH_MAX)
             ticks_of_travel = (miles / mph) / (self.update_period / 3600.0) # If we try to move from a point to itself, this will be zero
             # therefore what fraction of entire distance to travel in each tick
             if ticks_of_travel == 0:
@@ -290,8 +293,8 @@ class Mobile(Device):
             else:
                 self.travel_rate = 1.0 / ticks_of_travel
 
-        self.dwell_count = random.randrange(self.dwell_h_min / (self.update_period / 3600.0), self.dwell_h_max / (self.update_period / 3600.0)) # Wait here for a while before commencing
+        self.dwell_count = self.random.randrange(self.dwell_h_min / (self.update_period / 3600.0), self.dwell_h_max / (self.update_period / 3600.0)) # Wait here for a while before commencing
         self.update_everything()
 
     def pump_up_tires(self):
-        self.set_property("tire_pressure_psi", random.gauss(35,5))
+        self.set_property("tire_pressure_psi", self.random.gauss(35,5))
@@ -17,22 +17,26 @@ Device properties created::
     
 """
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import people_names
 
 class Names(Device):
+    transmission_independent = True    # See basic.py
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         super(Names,self).__init__(instance_name, time, engine, update_callback, context, params)
         self.set_properties(
             { 'first_name' : people_names.first_name(self.properties["$id"]),
               'last_name' :  people_names.last_name(self.properties["$id"]) } )
 
+    @pass_through
     def comms_ok(self):
         return super(Names,self).comms_ok()
     
+    @pass_through
     def external_event(self, event_name, arg):
         super(Names,self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Names,self).close()
 
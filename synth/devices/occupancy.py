@@ -21,7 +21,7 @@ import random
 import logging
 import time
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import opening_times as opening_times
 
 OCCUPANCY_POLL_INTERVAL_S = 60 * 15
@@ -37,19 +37,22 @@ class Occupancy(Device):
         self.set_property("occupied", False)
         self.engine.register_event_in(OCCUPANCY_POLL_INTERVAL_S, self.tick_occupancy, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Occupancy,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Occupancy,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Occupancy,self).close()
 
     # Private methods
     def tick_occupancy(self, _):
-        occupied = random.random() < opening_times.chance_of_occupied(self.engine.get_now(), self.opening_times) * self.peak_occupancy
+        occupied = self.random.random() < opening_times.chance_of_occupied(self.engine.get_now(), self.opening_times) * self.peak_occupancy
         self.set_property("occupied", occupied, always_send=False)
         self.engine.register_event_in(OCCUPANCY_POLL_INTERVAL_S, self.tick_occupancy, self, self)
 
@@ -19,7 +19,7 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 import random
 
 CHECK_INTERVAL_S = 60*60
@@ -35,15 +35,18 @@ class Pump(Device):
         engine.register_event_in(0, self.tick_pump, self, self)
         self.set_property("sump_level_mm", 0)
         self.set_property("sump_limit_mm",
-                int(MIN_SUMP_LIMIT + random.random() * (MAX_SUMP_LIMIT-MIN_SUMP_LIMIT)))
+                int(MIN_SUMP_LIMIT + self.random.random() * (MAX_SUMP_LIMIT-MIN_SUMP_LIMIT)))
 
+    @pass_through
     def comms_ok(self):
         return super(Pump,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Pump,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Pump,self).close()
 
@@ -20,7 +20,7 @@ import logging
 import time
 import isodate
 
-from .device import Device
+from .device import Device, pass_through
 
 class Repeater(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
@@ -29,13 +29,16 @@ class Repeater(Device):
         self.repeater_properties = params["repeater"]["properties"]
         self.engine.register_event_in(self.repeater_period, self.tick_emit, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Repeater,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Repeater,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Repeater,self).close()
 
@@ -30,7 +30,7 @@ import time
 import isodate
 from math import sin, pi
 
-from .device import Device
+from .device import Device, pass_through
 from common import opening_times
 
 DEFAULT_PERIOD = "PT15M"
@@ -79,7 +79,7 @@ class Tracker(Device):
         self.min_value = args.get("min_value", 0)
         mx = args.get("max_value", 100)
         mxs = args.get("max_value_twosigma", 0)
-        self.max_value = random.gauss(mx, mxs/2)
+        self.max_value = self.random.gauss(mx, mxs/2)
         self.max_value = min(self.max_value, mx+mxs)
         self.max_value = max(self.max_value, mx-mxs)
         self.noise_level = args.get("noise", 0)
@@ -92,13 +92,16 @@ class Tracker(Device):
         self.set_property(self.output_property, self.current_value())
         self.engine.register_event_in(self.polling_interval, self.tick_update, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Tracker,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Tracker,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Tracker,self).close()
 
@@ -35,24 +35,30 @@ Device properties created::
    
 import logging
 import random
-from .device import Device
+from .device import Device, pass_through
 from common import importer
 from common import randstruct
+from common import rng
+import random_streams
 
 class Variable(Device):
+    transmission_independent = True    # See basic.py
     device_indices = {}  # For every series-type variable we see, this maintains an index into the series
     dev_count = 0
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """A property whose value is static or driven by some time function."""
         def create_var(params):
-            self.my_random = random.Random() # We use our own random-number generator, one per variable per device
+            var_name = params["name"]
             rp = params.get("randomness_property", None)
-            if rp is None:
-                self.my_random.seed(self.get_property("$id"))   # Seed each device uniquely
+            if random_streams.g_enabled:
+                seed = self.get_property("$id") if rp is None else self.get_property(rp)
+                self.my_random = rng.Stream(seed, var_name)
             else:
-                self.my_random.seed(hash(self.get_property(rp)))
-
-            var_name = params["name"]
+                self.my_random = random.Random() # We use our own random-number generator, one per variable per device
+                if rp is None:
+                    self.my_random.seed(self.get_property("$id"))   # Seed each device uniquely
+                else:
+                    self.my_random.seed(hash(self.get_property(rp)))
 
             pick_seq = params.get("pick_sequentially", False)
 
@@ -108,12 +114,15 @@ class Variable(Device):
 
         self.set_properties(variables)
 
+    @pass_through
     def comms_ok(self):
         return super(Variable, self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Variable, self).external_event(event_name, arg)
 
+    @pass_through
     def close(self):
         super(Variable, self).close()
 
@@ -22,7 +22,7 @@ Device properties created::
 # NOTE: Here we represent cash in CENTS (or whatever, not dollars) to avoid the many perils of floating-point
 # Machines have "positions" (a "tray" in vending-machine parlance is a whole row of positions but we don't use that concept here)
 
-from .device import Device
+from .device import Device, pass_through
 import random
 import isodate
 import logging
@@ -91,7 +91,7 @@ class Vending_machine(Device):
 
         # Define machine
         machine_types = params["vending_machine"].get("machine_types", default_machine_types)
-        t = Vending_machine.myRandom.randrange(len(machine_types))
+        t = self.random_of(Vending_machine).randrange(len(machine_types))
         # self.set_property("manufacturer", machine_types[t]["manufacturer"])
         self.machine_rows = machine_types[t]["rows"]
         self.machine_columns = machine_types[t]["columns"]
@@ -120,9 +120,9 @@ class Vending_machine(Device):
         self.product_number_in_position = create_2d_array(self.machine_rows, self.machine_columns)  # Indexes into product_catalogue[]
         for r in range(self.machine_rows):
             for c in range(self.machine_columns):
-                product_number = Vending_machine.myRandom.randrange(len(self.product_catalogue))
+                product_number = self.random_of(Vending_machine).randrange(len(self.product_catalogue))
                 self.product_number_in_position[r][c] = product_number
-                self.stock_level[r][c] = Vending_machine.myRandom.randrange(0, MAX_STOCK_PER_POSITION/2)   # Only ever half-stock to begin with
+                self.stock_level[r][c] = self.random_of(Vending_machine).randrange(0, MAX_STOCK_PER_POSITION/2)   # Only ever half-stock to begin with
                 self.restock_time[r][c] = self.engine.get_now()
                 self.send_stock_level_message(r,c)
         self.update_available_positions()
@@ -136,18 +136,20 @@ class Vending_machine(Device):
 
         self.tick_vending_machine_check_expiry(self)
 
-        engine.register_event_in(Vending_machine.myRandom.random()*MAX_VENDING_INTERVAL_S, self.tick_vending_machine_vend, self, self)
-        engine.register_event_in(MIN_REPLENISH_INTERVAL_S + Vending_machine.myRandom.random()*(MAX_REPLENISH_INTERVAL_S-MIN_REPLENISH_INTERVAL_S), self.tick_vending_machine_replenish, self, self)
+        engine.register_event_in(self.random_of(Vending_machine).random()*MAX_VENDING_INTERVAL_S, self.tick_vending_machine_vend, self, self)
+        engine.register_event_in(MIN_REPLENISH_INTERVAL_S + self.random_of(Vending_machine).random()*(MAX_REPLENISH_INTERVAL_S-MIN_REPLENISH_INTERVAL_S), self.tick_vending_machine_replenish, self, self)
         engine.register_event_in(ALERT_CHECK_INTERVAL, self.tick_alert_check, self, self)
         engine.register_event_in(HEARTBEAT_INTERVAL, self.tick_heartbeat, self, self)
 
     def comms_ok(self):
         return super(Vending_machine,self).comms_ok() and self.allowed_to_communicate()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Vending_machine,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Vending_machine,self).close()
 
@@ -260,8 +262,8 @@ class Vending_machine(Device):
         return self.catalogue_item(r,c)["price"]
 
     def tick_vending_machine_vend(self, _):
-        r = Vending_machine.myRandom.randrange(0,self.machine_rows)
-        c = Vending_machine.myRandom.randrange(0,self.machine_columns)
+        r = self.random_of(Vending_machine).randrange(0,self.machine_rows)
+        c = self.random_of(Vending_machine).randrange(0,self.machine_columns)
         level = self.get_level(r,c)
         if level < 1:
             pass # self.set_property("event_log", "Attempt to vend from empty " + self.position_name(r,c), always_send=True)
@@ -281,11 +283,11 @@ class Vending_machine(Device):
             # self.end_property_group()   # <--
             self.send_vending_detail_message(r,c)
             self.send_vending_summary_message(r,c,payment_type)
-        self.engine.register_event_in(Vending_machine.myRandom.random()*MAX_VENDING_INTERVAL_S, self.tick_vending_machine_vend, self, self)
+        self.engine.register_event_in(self.random_of(Vending_machine).random()*MAX_VENDING_INTERVAL_S, self.tick_vending_machine_vend, self, self)
 
     def tick_vending_machine_replenish(self, _):
         self.replenish()
-        self.engine.register_event_in(MIN_REPLENISH_INTERVAL_S + Vending_machine.myRandom.random()*(MAX_REPLENISH_INTERVAL_S-MIN_REPLENISH_INTERVAL_S), self.tick_vending_machine_replenish, self, self)
+        self.engine.register_event_in(MIN_REPLENISH_INTERVAL_S + self.random_of(Vending_machine).random()*(MAX_REPLENISH_INTERVAL_S-MIN_REPLENISH_INTERVAL_S), self.tick_vending_machine_replenish, self, self)
 
     def tick_vending_machine_check_expiry(self, _):
         self.check_expirys()
@@ -303,11 +305,11 @@ class Vending_machine(Device):
         for a in alert_types:
             if a not in self.current_alerts:    # Alert not active
                 chance = float(ALERT_CHECK_INTERVAL)/alert_types[a]["mtbf"]
-                if random.random() < chance:
+                if self.random.random() < chance:
                     self.current_alerts[a] = True
             else:                               # Alert active
                 chance = float(ALERT_CHECK_INTERVAL)/alert_types[a]["average_length"]
-                if random.random() < chance:
+                if self.random.random() < chance:
                     del self.current_alerts[a]
 
         props = self.alert_changes(old_current_alerts)
@@ -359,7 +361,7 @@ class Vending_machine(Device):
                 if self.past_sellby_date(r,c):
                     # self.set_property("event_log", "Disposed of expired food in "+self.position_name(r,c), always_send=True)
                     self.set_level(r,c, 0)
-                if Vending_machine.myRandom.random() < 0.9:    # Chance of restocking any individual position 
+                if self.random_of(Vending_machine).random() < 0.9:    # Chance of restocking any individual position 
                     if self.get_level(r,c) < MAX_STOCK_PER_POSITION:
                         # self.set_property("event_log", "Restocking "+self.position_name(r,c), always_send=True)
                         self.set_level(r,c, MAX_STOCK_PER_POSITION)
@@ -405,20 +407,20 @@ class Vending_machine(Device):
 
     def accept_payment(self, price):
         # Work out what coins were provided to pay for the goods
-        if Vending_machine.myRandom.random() < self.cashless_to_cash_ratio:  # Smartcard payment
+        if self.random_of(Vending_machine).random() < self.cashless_to_cash_ratio:  # Smartcard payment
             # self.set_property("vend_event_cashless", price, always_send=True)
             return "cashless"
         else:
             for biggest in range(len(CASH_DENOMINATIONS)):   # Find index of denomination that's big-enough to pay outright
                 if CASH_DENOMINATIONS[biggest] >= price:
                     break
-            if Vending_machine.myRandom.random() > 0.5:       # they just pay with a single unit of currency
+            if self.random_of(Vending_machine).random() > 0.5:       # they just pay with a single unit of currency
                 payment = { CASH_DENOMINATIONS[biggest] : 1 }
             else:                           # they make up the payment with coins
                 payment = {}
                 for i in range(biggest-1, -1, -1):
                     num = int((price-bag_value(payment)) / CASH_DENOMINATIONS[i])
-                    if Vending_machine.myRandom.random() > 0.25:  # A chance that we don't have any smaller change, so we overpay with this denom
+                    if self.random_of(Vending_machine).random() > 0.25:  # A chance that we don't have any smaller change, so we overpay with this denom
                         num += 1    # 
                     add_to_bag(payment, CASH_DENOMINATIONS[i], num)
                     if bag_value(payment) >= price:
@@ -17,7 +17,7 @@ Device properties created::
 
 """
 
-from .device import Device
+from .device import Device, pass_through
 from .helpers import dark_sky
 import logging
 
@@ -33,13 +33,16 @@ class Weather(Device):
             self.set_property("occupied", False)    # !!!!!! TEMP BODGE TO OVERCOME CLUSTERING PROBLEM
         engine.register_event_in(0, self.tick_weather, self, self)
 
+    @pass_through
     def comms_ok(self):
         return super(Weather,self).comms_ok()
 
+    @pass_through
     def external_event(self, event_name, arg):
         super(Weather,self).external_event(event_name, arg)
         pass
 
+    @pass_through
     def close(self):
         super(Weather,self).close()
 
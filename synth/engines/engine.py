@@ -5,6 +5,12 @@ from abc import ABCMeta, abstractmethod
 class Engine(object):
     __metaclass__ = ABCMeta
 
+    muting = False  # True if output_muted() might ever return True
+
+    def output_muted(self, t):
+        """True if a message timestamped <t> would not be output"""
+        return False
+
     @abstractmethod
     def __init__(self, params, cb, event_count_callback):
         """If defined, <cb> callback will be called when (if) simulator moves from historical to real-time.
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+#
+# SCHEDULER
+# Pluggable event-queue backends for the Sim engine
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Every scheduler holds event entries (ints, see sim.py), each pushed along with its epochTime,
+# and must pop them in exactly the order that sorted() would put them in,
+# so that all schedulers produce identical simulation output.
+
+import heapq
+import logging
+import isodate
+
+DEFAULT_CALENDAR_BUCKET = "PT1M"
+
+class Heap():
+    """A binary heap. O(log n) insert and pop, good all-rounder."""
+    def __init__(self, params):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(self.heap)
+
+    def push(self, t, entry):
+        heapq.heappush(self.heap, entry)
+
+    def peek(self):
+        """Return earliest entry without removing it (or None if empty)"""
+        if self.heap:
+            return self.heap[0]
+        return None
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def remove_if(self, predicate):
+        """Remove all entries for which predicate(entry) is true. Returns number removed."""
+        old_len = len(self.heap)
+        self.heap = [e for e in self.heap if not predicate(e)]
+        heapq.heapify(self.heap)
+        return old_len - len(self.heap)
+
+
+class Calendar():
+    """A calendar queue: events are dropped into fixed-width time buckets.
+       Inserting into a future bucket is an O(1) append, and each bucket is sorted just once, when the simulation reaches it.
+       Inserts into the bucket we're currently consuming (e.g. ticks shorter than a bucket) go onto a small heap alongside it.
+       This suits large fleets of devices ticking periodically, where most inserts land well in the future.
+       Only the set of non-empty bucket numbers is kept in a heap, and that is much smaller than the number of events."""
+    def __init__(self, params):
+        self.bucket_width = isodate.parse_duration(params.get("calendar_bucket", DEFAULT_CALENDAR_BUCKET)).total_seconds()
+        assert self.bucket_width > 0, "calendar_bucket must be a positive duration"
+        self.buckets = {}           # Bucket number -> unsorted list of entries
+        self.bucket_numbers = []    # Heap of the keys of self.buckets
+        self.current = []           # Sorted entries of the bucket we're currently consuming...
+        self.head = 0               # ...of which those before this index have already been popped
+        self.overflow = []          # Heap of entries pushed into the current bucket after it was sorted
+        self.current_number = None  # Bucket number of self.current (anything at or before this goes into self.current)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        yield from self.current[self.head:]
+        yield from self.overflow
+        for b in self.buckets.values():
+            yield from b
+
+    def push(self, t, entry):
+        self.count += 1
+        n = int(t // self.bucket_width)
+        if self.current_number is not None and n <= self.current_number:
+            heapq.heappush(self.overflow, entry)
+            return
+        b = self.buckets.get(n)
+        if b is None:
+            self.buckets[n] = [entry]
+            heapq.heappush(self.bucket_numbers, n)
+        else:
+            b.append(entry)
+
+    def _advance(self):
+        """Ensure self.current or self.overflow holds the earliest entry, if there is one"""
+        while self.head >= len(self.current) and not self.overflow:
+            if not self.bucket_numbers:
+                self.current = []
+                self.head = 0
+                return False
+            self.current_number = heapq.heappop(self.bucket_numbers)
+            self.current = self.buckets.pop(self.current_number)
+            self.current.sort()
+            self.head = 0
+        return True
+
+    def peek(self):
+        if not self._advance():
+            return None
+        if self.head < len(self.current):
+            e = self.current[self.head]
+            if self.overflow and self.overflow[0] < e:
+                return self.overflow[0]
+            return e
+        return self.overflow[0]
+
+    def pop(self):
+        if not self._advance():
+            raise IndexError("pop from empty calendar")
+        self.count -= 1
+        if self.head < len(self.current):
+            e = self.current[self.head]
+            if self.overflow and self.overflow[0] < e:
+                return heapq.heappop(self.overflow)
+            self.current[self.head] = None  # Don't hold on to references
+            self.head += 1
+            return e
+        return heapq.heappop(self.overflow)
+
+    def remove_if(self, predicate):
+        old_count = self.count
+        self.current = [e for e in self.current[self.head:] if not predicate(e)]
+        self.head = 0
+        self.overflow = [e for e in self.overflow if not predicate(e)]
+        heapq.heapify(self.overflow)
+        for n in list(self.buckets.keys()):
+            b = [e for e in self.buckets[n] if not predicate(e)]
+            if b:
+                self.buckets[n] = b
+            else:
+                del self.buckets[n]
+        self.bucket_numbers = list(self.buckets.keys())
+        heapq.heapify(self.bucket_numbers)
+        self.count = len(self.current) + len(self.overflow) + sum([len(b) for b in self.buckets.values()])
+        return old_count - self.count
+
+
+SCHEDULERS = {
+    "heap" : Heap,
+    "calendar" : Calendar
+}
+
+def get_scheduler(params):
+    name = params.get("scheduler", "heap")
+    assert name in SCHEDULERS, "Unknown scheduler '"+str(name)+"', must be one of "+str(list(SCHEDULERS.keys()))
+    logging.info("Using "+name+" scheduler")
+    return SCHEDULERS[name](params)
+
+def selfTest():
+    """Check that every scheduler pops the same entries in the same order as sorted() would, including
+       pushes into the bucket being consumed, same-time entries, and remove_if()"""
+    import random
+    print("Testing schedulers")
+    r = random.Random(1)
+    for seed in range(50):
+        schedulers = [cls({"calendar_bucket" : "PT10S"}) for cls in SCHEDULERS.values()]
+        model = []
+        now = 0
+        seq = 0
+        for step in range(2000):
+            op = r.random()
+            if op < 0.55:
+                t = now + r.choice([0, 0, r.random() * 5, r.random() * 100, r.randint(0, 1000)])
+                entry = (int(t * 1000) << 32) + seq    # Entries sort by time, then by order of pushing, like sim.py's
+                seq += 1
+                model.append(entry)
+                for s in schedulers:
+                    s.push(t, entry)
+            elif op < 0.57:
+                parity = r.randint(0, 1)
+                model = [e for e in model if e % 2 != parity]
+                for s in schedulers:
+                    s.remove_if(lambda e: e % 2 == parity)
+            elif model:
+                model.sort()
+                expected = model.pop(0)
+                now = (expected >> 32) / 1000
+                for s in schedulers:
+                    assert s.peek() == expected
+                    assert s.pop() == expected
+            for s in schedulers:
+                assert len(s) == len(model)
+                assert sorted(s) == sorted(model)
+    print("Test passed")
+
+if __name__ == "__main__":
+    selfTest()
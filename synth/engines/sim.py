@@ -25,56 +25,148 @@
 
 import time
 import logging
+import isodate
 import threading
 import queue
+import collections
+import struct
+from types import MethodType
 from common import ISO8601
 from common.conftime import richTime
 
 from engines.engine import Engine
+from engines import scheduler
 
 WARN_IF_BEHIND_REALTIME_BY_MORE_THAN_S = 10
+DEFAULT_HISTORICAL_HORIZON = "PT1M"
+COMPACT_WHEN_CANCELLED_FRACTION = 0.5   # Purge cancelled events from the queue once they make up this fraction of it...
+COMPACT_MIN_CANCELLED = 1000            # ...and there are at least this many of them
+
+# Each queue entry is a single int, made up of these fields (from most to least significant):
+#   time        64 bits, the bits of the event's (float) time, adjusted so that they sort in the same order as the time
+#   sortkey     40 bits, sortkeycount, unique to the event, so no two entries are ever equal
+#   device      30 bits, index of the event's device in Sim.devices (0 if it has none)
+#   callback    14 bits, index of the event's interned device method in Sim.callbacks (0 if it's not one)
+#   arg          2 bits, what the event's arg is (ARG_...)
+# Entries therefore sort in the same order as (time, sortkeycount), and at 150 bits each takes just 44 bytes.
+ARG_NONE, ARG_DEVICE, ARG_STORED = 0, 1, 2  # Arg is None, the event's device, or is in Sim.stored (which also holds the function, if it isn't interned)
+ARG_MASK = 3
+CALLBACK_SHIFT, CALLBACK_MASK = 2, (1 << 14) - 1
+DEVICE_SHIFT, DEVICE_MASK = 16, (1 << 30) - 1
+SKC_SHIFT, SKC_MASK = 46, (1 << 40) - 1
+LOW_MASK = (1 << SKC_SHIFT) - 1     # The fields below sortkey, which fit in a small int
+TIME_SHIFT = 86
+TIME_SIGN = 1 << 63
+TIME_MASK = (1 << 64) - 1
+float_bits = struct.Struct("<d")
+int_bits = struct.Struct("<Q")
+
+def time_key(t):
+    """An int which sorts in the same order as float <t>"""
+    b = int_bits.unpack(float_bits.pack(t + 0.0))[0]  # + 0.0 turns -0.0 into 0.0, so they're the same time, as they would be if compared
+    if b < TIME_SIGN:   # Positive, so just needs to sort after all negative times
+        return b ^ TIME_SIGN
+    return b ^ TIME_MASK    # Negative, so the larger the magnitude the earlier
+
+def key_time(k):
+    """The inverse of time_key()"""
+    if k >= TIME_SIGN:
+        return float_bits.unpack(int_bits.pack(k ^ TIME_SIGN))[0]
+    return float_bits.unpack(int_bits.pack(k ^ TIME_MASK))[0]
 
 class Sim(Engine):
     """Capable of both historical and real-time simulation,
-       and of moving smoothly between the two"""
+       and of moving smoothly between the two.
+
+       The event queue is owned by the thread which created the engine, so needs no locking.
+       Events registered from any other thread are posted to a thread-safe inbox, which is drained between events.
+       The queue's implementation is chosen by the "scheduler" parameter (see engines/scheduler.py).
+
+       Queue entries are kept compact, because there may be tens of millions of them pending. Each is a single int
+       (see the fields above), rather than a tuple of objects. Most events are a device calling one of its own methods
+       with itself (or None) as the arg, so the entry just holds small integers identifying the device and the method's
+       (shared) function, and the method is re-bound to the device only when the event is run. Anything else about an
+       event (any other arg, or a function which isn't a device method) is held on the side, in self.stored.
+
+       Cancelling a device's events (e.g. when it's stopped) leaves them in the queue, to be skipped when reached.
+       All that's recorded is a watermark per cancelled device (its events with a lower sortkeycount are cancelled)
+       and a count of such events, so cancellation adds nothing to the size of each pending entry. A device's index
+       is reused once it has no events in the queue, cancelled or not.
+
+       A simulation which starts in the past runs in a "historical phase" until simulation time comes within
+       <historical_horizon> of real time. During it the engine doesn't read the wall clock for each event: real time
+       only moves forwards, so once we've seen that an event is more than the horizon behind real time, so is every
+       event before it. The clock is read again only when the simulation passes that point.
+
+       Messages are only output if they are timestamped from <output_start> until (but not including) <output_end>,
+       and not during any mute_for action. Devices consult output_muted() to skip building messages which would be thrown away."""
 
     def __init__(self, params, cb = None, event_count_callback = None):
-        self.sim_lock = threading.Lock() # Protects sim_time to make sim thread-safe, as event-injection can happen asynchronously
+        self.params = params
+        self.sim_thread = threading.get_ident() # Only this thread may touch the event queue. Events registered from any other thread (e.g. ZeroMQ rx) go via the inbox
+        self.inbox = queue.SimpleQueue()    # Thread-safe, drained into the event queue between events
         self.sim_time = 0   # Has to have some value initially, as whenever we set it we test that it hasn't gone backwards
         self.set_start_time_str(params.get("start_time", "now"))
         self.set_end_time_str(params.get("end_time", None))
         self.end_after_events = params.get("end_after_events", None)
+        self.batch = params.get("batch", False)    # If true, next_event() executes all events due at the same sim time in one go
+        self.exclusive_end_time = params.get("exclusive_end_time", False)   # Historically the first event at end_time still gets executed. If true then it doesn't.
+        self.event_wrapper = None   # If set, events are run by calling this with (function, arg, device) rather than function(arg). Hooks can chain, see profiler.py
         self.caught_up_callback = cb
         self.caught_up = False
         self.event_count_callback = event_count_callback
-        # self.events = []      # A sorted list of simulation callbacks: [(epochTime,sortkeycount,function,arg,device), ...]
-        self.events = queue.PriorityQueue()
+        self.events = scheduler.get_scheduler(params)   # A priority queue of simulation callbacks, each a single int (see above)
         self.sort_key_count = 0 # A secondary key which ensures that events with identical event times are sorted in order of their insertion
+        self.callbacks = [None] # Interned functions of device methods (0 means not interned)
+        self.callback_ids = {}  # Function -> index into self.callbacks
+        self.clear_side_tables()
+        self.next_events = collections.deque()  # (function, arg) of events to run straight after the current one (see register_event_next())
         self.next_event_time = None
+        self.historical_horizon = isodate.parse_duration(params.get("historical_horizon", DEFAULT_HISTORICAL_HORIZON)).total_seconds()
+        assert self.historical_horizon >= 1.0, "historical_horizon must be at least PT1S" # Catching-up with real time allows 1s of slack
+        self.historical = True  # Until we get within historical_horizon of real time
+        self.historical_until = time.time() - self.historical_horizon  # Any time before this is certainly in the historical phase
         self.in_nku_warning_condition = False
         self.last_nku_warning = 0
+        self.output_start = float("-inf")   # Messages are only output between these times (see output_muted())
+        self.output_end = float("inf")
+        if params.get("output_start", None) is not None:
+            self.output_start = richTime(params["output_start"])
+        if params.get("output_end", None) is not None:
+            self.output_end = richTime(params["output_end"])
+        self.output_from = self.output_start    # Later of output_start and any mute_output_until()
+        self.muting = self.output_start > float("-inf") or self.output_end < float("inf")
+
+    def clear_side_tables(self):
+        """Forget everything which queue entries refer to (other than callbacks)"""
+        self.devices = [None]   # Device index -> device (0 means no device)
+        self.device_index = {}  # Device -> its index in self.devices, for devices with events in the queue
+        self.free_indices = []  # Indices in self.devices which are free for reuse
+        self.pending = [0]      # Device index -> number of its events in the queue (excluding cancelled ones)
+        self.stored = {}        # sortkeycount -> the arg of an event with ARG_STORED (or (function, arg) if its callback isn't interned)
+        self.cancelled_before = {}  # Device index -> sortkeycount. Events of the device with a lower sortkeycount have been cancelled but are still in the queue ("tombstones"), to be skipped when reached
+        self.num_cancelled = 0
+        self.last_time_key = None   # Caches of the last conversions between times and time keys
+        self.last_time = None
+        self.push_time = None
+        self.push_time_key = None
 
     def set_now(self, epochSecs):
-        self.sim_lock.acquire()
         # logging.info("sim:set_now() setting sim_time to " + str(epochSecs))
         if epochSecs < self.sim_time:
             logging.error("Attempt to make time go backwards. sim_time is "+str(self.sim_time)+" and asked to set to " + str(epochSecs))
             assert False
         self.sim_time = epochSecs
-        self.sim_lock.release()
 
     def set_now_str(self,timeString):
         assert(False)
         self.set_time(richTime(timeString)) # ??? doesn't seem to exist, is this function ever called?
 
     def get_now(self):
-        self.sim_lock.acquire()
-        t = self.sim_time
-        self.sim_lock.release()
-        # logging.info("sim:get_now() returning t="+str(t))
-        return t
+        # sim_time is only ever written by the sim thread, and reading a single attribute is atomic, so no lock is needed
+        return self.sim_time
 
-    def get_now_no_lock(self):  # Unreliable, for logging
+    def get_now_no_lock(self):  # Kept for callers (e.g. logging) which historically needed to avoid the lock
         return self.sim_time
 
     def get_now_1000(self):
@@ -84,9 +176,7 @@ class Sim(Engine):
         return str(ISO8601.epoch_seconds_to_ISO8601(self.get_now()))
 
     def advance_now(self, dt):
-        self.sim_lock.acquire()
         self.sim_time += dt
-        self.sim_lock.release()
 
     def set_start_time_str(self, timeString):
         t = richTime(timeString)
@@ -112,6 +202,20 @@ class Sim(Engine):
     def get_end_time(self):
         return self.end_time
     
+    def in_historical_phase(self, t):
+        """True if time <t> is more than historical_horizon behind real time, in which case the real-time checks can't yet matter"""
+        if t < self.historical_until:   # The common case, needing no syscall
+            return True
+        if not self.historical:
+            return False
+        self.historical_until = time.time() - self.historical_horizon
+        if t < self.historical_until:
+            return True
+        logging.info("Within "+str(self.historical_horizon)+"s of real time, so leaving historical phase")
+        self.historical = False
+        self.historical_until = float("-inf")
+        return False
+
     def events_to_come(self):
         """Return False if simulation has definitely ended"""
         def caught_up():
@@ -125,71 +229,81 @@ class Sim(Engine):
             if self.event_count_callback() >= self.end_after_events:
                 logging.info("Reached target of "+str(self.end_after_events)+" events")
                 return False
-            
-        try:
-            self.sim_lock.acquire()       # <--
-            
-            if self.sim_time >= time.time() - 1.0:   # Allow a bit of slack because otherwise we might never quite catch-up, because we always wait to ensure we don't
-                caught_up()
 
-            if self.end_time == None:
-                return True
+        self.drain_inbox()
 
-            if self.end_time == "when_done":
-                keep_going = not self.events.empty()
-                if not keep_going:
-                    logging.info("No further events")
-                return keep_going
-                           
-            if self.end_time=="now":    # Terminate when we've caught-up with real-time
-                if self.sim_time >= (time.time()-1.0):   # Allow some slack
-                    caught_up()
-                    logging.info("Caught up with real time")
-                    return False
-                return True
+        historical = self.in_historical_phase(self.sim_time)    # If so then we can't be anywhere near real time, so needn't look at the clock
 
-            if self.sim_time >= self.end_time:
-                logging.info("Reached simulation end time with "+str(self.events.qsize())+" events still in future")
-                return False
+        if not historical and self.sim_time >= time.time() - 1.0:   # Allow a bit of slack because otherwise we might never quite catch-up, because we always wait to ensure we don't
+            caught_up()
 
-            if self.caught_up:
-                if self.sim_time < time.time() - WARN_IF_BEHIND_REALTIME_BY_MORE_THAN_S:    # We are supposed to be keeping-up with real-time, but are not for some reason
-                    self.in_nku_warning_condition = True
-                    self.warn_not_keeping_up()
-                else: 
-                    if self.in_nku_warning_condition:
-                        self.in_nku_warning_condition = False
-                        logging.info("Now caught up to within "+str(WARN_IF_BEHIND_REALTIME_BY_MORE_THAN_S)+"s of realtime")
+        if self.end_time == None:
+            return True
 
+        if self.end_time == "when_done":
+            keep_going = self.num_pending() > 0
+            if not keep_going:
+                logging.info("No further events")
+            return keep_going
 
+        if self.end_time=="now":    # Terminate when we've caught-up with real-time
+            if not historical and self.sim_time >= (time.time()-1.0):   # Allow some slack
+                caught_up()
+                logging.info("Caught up with real time")
+                return False
             return True
-        finally:
-            self.sim_lock.release()   # -->
-            
+
+        if self.sim_time >= self.end_time:
+            logging.info("Reached simulation end time with "+str(self.num_pending())+" events still in future")
+            return False
+
+        if self.caught_up:
+            if self.sim_time < time.time() - WARN_IF_BEHIND_REALTIME_BY_MORE_THAN_S:    # We are supposed to be keeping-up with real-time, but are not for some reason
+                self.in_nku_warning_condition = True
+                self.warn_not_keeping_up()
+            else:
+                if self.in_nku_warning_condition:
+                    self.in_nku_warning_condition = False
+                    logging.info("Now caught up to within "+str(WARN_IF_BEHIND_REALTIME_BY_MORE_THAN_S)+"s of realtime")
+
+        return True
+
     def next_event(self):
-        """Execute next event
+        """Execute next event (or, in batch mode, all events due at the next event time)
 
            If we have to wait for real time to catch up, then
            new external events can appear asychronously whilst we wait.
            So we wait only a short period and then release so can reassess from scratch again soon (and so any other heartbeats can happen)."""
-        self.sim_lock.acquire()           # <---
-        if self.events.qsize() < 1:
+        self.drain_inbox()
+        if self.next_events:    # Registered outside any event
+            self._run_next_events()
+            return
+        e = self._peek()
+        if e is None:
             logging.info("No events pending")
             wait = 1.0
             t = None
         else:
-            (t,skc,fn,arg,dev) = self.events.get_nowait()   # Get earliest event. Raises exception if queue empty.
-            # logging.info("next_event got from queue "+str(t))
-            wait = t - time.time()
+            tk = e >> TIME_SHIFT
+            if tk != self.last_time_key:    # Consecutive events are often at the same time
+                self.last_time_key = tk
+                self.last_time = key_time(tk)
+            t = self.last_time   # Earliest event
+            if self.in_historical_phase(t):
+                wait = 0
+            else:
+                wait = t - time.time()
             if wait <= 0:
-                self.sim_lock.release()   # --->
+                if self.exclusive_end_time and type(self.end_time) in [int, float] and t >= self.end_time:
+                    self.set_now(t)     # So that events_to_come() will now end the simulation
+                    return
+                e = self._pop()
                 self.set_now(t)
-                # logging.debug(str(fn.__name__)+"("+str(arg)+")")
-                fn(arg)             # Note that this is likely to itself inject more events, so we must have released lock
+                self._run(e)     # Note that this is likely to itself inject more events
+                self._run_next_events()
+                if self.batch:
+                    self.next_events_at(t)
                 return
-            # logging.info("next_event putting back in queue "+str(t))
-            self.events.put_nowait((t,skc,fn,arg,dev))  # Push unused event back on the queue
-        self.sim_lock.release()           # --->
         if t != self.next_event_time:
             if wait >= 1.0:
                 logging.info("Waiting {:.2f}s for real time".format(wait))
@@ -198,72 +312,278 @@ class Sim(Engine):
         time.sleep(advance)
         self.advance_now(advance)    # So that any events injected asynchronously will correctly get stamped with current time
 
-    def _add_event(self, time, func, arg, dev):
+    def next_events_at(self, t):
+        """Execute all remaining events due at time <t>, in insertion order (including any which those events themselves add at <t>)"""
+        if type(self.end_time) in [int, float] and t >= self.end_time:   # End time is non-inclusive, so don't extend a batch beyond it
+            return
+        tk = time_key(t)
+        while True:
+            e = self._peek()
+            if e is None or e >> TIME_SHIFT != tk:
+                return
+            if self.end_after_events:   # Stay precise even part-way through a batch
+                if self.event_count_callback() >= self.end_after_events:
+                    return
+            self._run(self._pop())
+            self._run_next_events()
+
+    def _run(self, e):
+        low = e & LOW_MASK
+        cb = (low >> CALLBACK_SHIFT) & CALLBACK_MASK
+        kind = low & ARG_MASK
+        di = low >> DEVICE_SHIFT
+        if di:
+            dev = self.devices[di]
+            n = self.pending[di] - 1
+            self.pending[di] = n
+        else:
+            dev = None
+        if kind == ARG_DEVICE:
+            arg = dev
+        elif kind == ARG_NONE:
+            arg = None
+        else:
+            arg = self.stored.pop((e >> SKC_SHIFT) & SKC_MASK)
+        if cb:  # An interned method of dev
+            if self.event_wrapper is None:
+                self.callbacks[cb](dev, arg)
+            else:
+                self.event_wrapper(MethodType(self.callbacks[cb], dev), arg, dev)
+        else:
+            (func, arg) = arg
+            if self.event_wrapper is None:
+                func(arg)
+            else:
+                self.event_wrapper(func, arg, dev)
+        if di and n == 0:   # Only now, as the event has probably registered the device's next event, so it can keep its index
+            self._release_if_idle(di, dev)
+
+    def _run_next_events(self):
+        while self.next_events:
+            (func, arg) = self.next_events.popleft()
+            if self.event_wrapper is None:
+                func(arg)
+            else:
+                self.event_wrapper(func, arg, None)
+
+    def _is_cancelled(self, e):
+        di = (e >> DEVICE_SHIFT) & DEVICE_MASK
+        return di != 0 and (e >> SKC_SHIFT) & SKC_MASK < self.cancelled_before.get(di, 0)
+
+    def _discard(self, e):
+        """Forget anything stored on the side for entry <e>, which is being removed from the queue without being run"""
+        if e & ARG_MASK == ARG_STORED:
+            del self.stored[(e >> SKC_SHIFT) & SKC_MASK]
+
+    def _peek(self):
+        """Return the earliest live event (or None), discarding any cancelled events ahead of it"""
+        events = self.events
+        while events:
+            e = events.peek()
+            if not self.cancelled_before or not self._is_cancelled(e):
+                return e
+            events.pop()
+            self._discard(e)
+            self.num_cancelled -= 1
+            if self.num_cancelled == 0:
+                self._forget_cancelled()    # So we're back on the fast path
+        return None
+
+    def _pop(self):
+        """Pop the earliest event. Only call after _peek() has returned it, and then _run() it."""
+        return self.events.pop()
+
+    def _device_index(self, dev):
+        """The index of <dev> in self.devices, giving it one if it hasn't got one"""
+        di = self.device_index.get(dev)
+        if di is None:
+            if self.free_indices:
+                di = self.free_indices.pop()
+                self.devices[di] = dev
+            else:
+                di = len(self.devices)
+                assert di <= DEVICE_MASK, "Too many devices with pending events"
+                self.devices.append(dev)
+                self.pending.append(0)
+            self.device_index[dev] = di
+        return di
+
+    def _unpend(self, di):
+        """One fewer of device <di>'s events is pending"""
+        n = self.pending[di] - 1
+        self.pending[di] = n
+        if n == 0:
+            self._release_if_idle(di, self.devices[di])
+
+    def _release_if_idle(self, di, dev):
+        """Once device <dev> has no events in the queue (not even cancelled ones), its index <di> can be reused"""
+        if self.pending[di] == 0 and di not in self.cancelled_before and self.devices[di] is dev:
+            self._release(di)
+
+    def _release(self, di):
+        del self.device_index[self.devices[di]]
+        self.devices[di] = None
+        self.free_indices.append(di)
+
+    def _forget_cancelled(self):
+        """Call once no cancelled events remain in the queue"""
+        for di in self.cancelled_before:
+            if self.pending[di] == 0:
+                self._release(di)
+        self.cancelled_before = {}
+        self.num_cancelled = 0
+
+    def _push(self, t, func, arg, dev, skc=None):
+        if skc is None:
+            skc = self.sort_key_count
+            self.sort_key_count += 1
+            assert skc <= SKC_MASK, "Sort key count overflow"
+        if dev is None:
+            di = 0
+        else:
+            di = self._device_index(dev)
+            self.pending[di] += 1
+            if type(func) is MethodType and func.__self__ is dev:  # Intern it, rather than hold a bound-method object for as long as the event is pending
+                f = func.__func__
+                func = self.callback_ids.get(f)
+                if func is None:
+                    func = len(self.callbacks)
+                    assert func <= CALLBACK_MASK, "Too many different device callbacks"
+                    self.callbacks.append(f)
+                    self.callback_ids[f] = func
+        if type(func) is int:
+            cb = func
+            if arg is None:
+                kind = ARG_NONE
+            elif arg is dev:
+                kind = ARG_DEVICE
+            else:
+                kind = ARG_STORED
+                self.stored[skc] = arg
+        else:   # Anything else is stored on the side, with its arg
+            cb = 0
+            kind = ARG_STORED
+            self.stored[skc] = (func, arg)
+        if t != self.push_time:     # Events are often pushed in runs at the same time
+            self.push_time = t
+            self.push_time_key = time_key(t) << TIME_SHIFT
+        self.events.push(t, self.push_time_key | (skc << SKC_SHIFT) | (di << DEVICE_SHIFT) | (cb << CALLBACK_SHIFT) | kind)
+
+    def _unpack(self, e):
+        """The event of entry <e>, as (epochTime,sortkeycount,function,arg,device), leaving the entry in place"""
+        cb = (e >> CALLBACK_SHIFT) & CALLBACK_MASK
+        kind = e & ARG_MASK
+        skc = (e >> SKC_SHIFT) & SKC_MASK
+        di = (e >> DEVICE_SHIFT) & DEVICE_MASK
+        dev = self.devices[di] if di else None
+        if kind == ARG_STORED:
+            arg = self.stored[skc]
+        elif kind == ARG_DEVICE:
+            arg = dev
+        else:
+            arg = None
+        if cb:
+            func = cb
+        else:
+            (func, arg) = arg
+        return (key_time(e >> TIME_SHIFT), skc, func, arg, dev)
+
+    def num_pending(self):
+        """Number of events still to be executed"""
+        return len(self.events) - self.num_cancelled + len(self.next_events)
+
+    def _add_event(self, time, func, arg, dev, sort_key=None):
         """If multiple events are inserted at the same time, we guarantee they'll get executed in insertion order.
-        We do this by ensuring that the second item in the tuple is a monotonically rising number"""
+        We do this by ensuring that each event's key includes a monotonically rising number"""
         if time == None:
             return  # It's legal to request an event at time "None" - the event is just thrown away. This is how e.g. timefunctions indicate that there are no more events
         if time == 0:
             logging.warning("Setting event at epoch=0 (not illegal, but often a sign of a mistake)")
-        elif time < self.get_now():
+        elif time < self.sim_time:
             logging.warning("Setting event in the past (not illegal, but often a sign of a mistake)")
 
-        self.sim_lock.acquire() # Not strictly needed, as our priority queue has its own thread lock
-        # logging.info("add_event putting into queue "+str(time))
-        self.events.put_nowait((time, self.sort_key_count, func, arg, dev))
-        self.sort_key_count += 1
-        self.sim_lock.release()
+        if threading.get_ident() != self.sim_thread:  # Asynchronous injection, so hand over to the sim thread rather than touch the queue
+            self.inbox.put((time, func, arg, dev, sort_key))
+            return
+
+        self._push(time, func, arg, dev, sort_key)
 
         # self.dump_queue()
 
-##        try:
-##            self.sim_lock.acquire()   # <---
-##            if len(self.events) > 0:    # Avoid sorting whole list if we're just adding to end. But this never happens!
-##                if self.events[-1] < L[0]:
-##                    self.events.extend(L)
-##                    return
-##            self.events = sorted(self.events + L)   # TODO: Might be more efficient to append and then sort in place?
-##        finally:
-##            self.sim_Lock.release()   # --->
+    def drain_inbox(self):
+        """Move any events registered asynchronously (from other threads) into the event queue"""
+        while not self.inbox.empty():
+            (t, func, arg, dev, sort_key) = self.inbox.get_nowait()
+            self._push(t, func, arg, dev, sort_key)
 
     def dump_queue(self):
-        logging.info("Event queue contains "+str(self.events.qsize())+" items")
-        q = []
-        while not self.events.qsize() < 1:
-            e = self.events.get_nowait()
-            logging.info("    " + str(e))
-            q.append(e)
-        for e in q:
-            self.events.put_nowait(e)
+        logging.info("Event queue contains "+str(self.num_pending())+" items")
+        for e in sorted(self.events):
+            if not self._is_cancelled(e):
+                logging.info("    " + str(self._unpack(e)))
+
+    def compact(self):
+        """Physically remove cancelled events from the queue"""
+        def cancelled(e):
+            if self._is_cancelled(e):
+                self._discard(e)
+                return True
+            return False
+        if self.cancelled_before:
+            self.events.remove_if(cancelled)
+        self._forget_cancelled()
+
+    def cancel_events_for_device(self, dev):
+        """Cancel all of a device's pending events, returning how many there were. Cost is proportional to the number of the device's own events, not the size of the queue."""
+        di = self.device_index.get(dev)
+        if di is None:
+            return 0
+        n = self.pending[di]
+        if n:
+            self.pending[di] = 0
+            self.cancelled_before[di] = self.sort_key_count    # i.e. all its events so far
+            self.num_cancelled += n
+            if self.num_cancelled >= COMPACT_MIN_CANCELLED:
+                if self.num_cancelled >= len(self.events) * COMPACT_WHEN_CANCELLED_FRACTION:
+                    self.compact()
+        return n
 
     def remove_all_events_for_device(self, dev):
-        self.sim_lock.acquire()
-        old_len = self.events.qsize()
-        newQ = queue.PriorityQueue()
-        while not self.events.empty():
-            e = self.events.get()
-            if e[4] != dev:
-                newQ.put(e)
-        self.events = newQ
-        new_len = self.events.qsize()
-        self.sim_lock.release()
-        logging.info("Removed all events for device "+str(dev.properties["$id"])+ " (" + str(old_len-new_len)+" events removed)")
+        removed = self.cancel_events_for_device(dev)
+        logging.info("Removed all events for device "+str(dev.properties["$id"])+ " (" + str(removed)+" events removed)")
 
     def remove_all_events_before(self, epoch):
-        self.sim_lock.acquire()
-        old_len = self.events.qsize()
-        newQ = queue.PriorityQueue()
-        while not self.events.empty():
-            e = self.events.get()
-            if e[0] >= epoch:
-                newQ.put(e)
-        self.events = newQ
-        new_len = self.events.qsize()
-        self.sim_lock.release()
-        logging.info("Removed all pending events before " + str(epoch) + " (" + str(old_len-new_len)+" events removed)")
+        self.compact()
+        ek = time_key(epoch)
+        def remove(e):
+            if e >> TIME_SHIFT >= ek:
+                return False
+            self._discard(e)
+            di = (e >> DEVICE_SHIFT) & DEVICE_MASK
+            if di:
+                self._unpend(di)
+            return True
+        removed = self.events.remove_if(remove)
+        logging.info("Removed all pending events before " + str(epoch) + " (" + str(removed)+" events removed)")
           
-    def register_event_at(self, time, func, arg, device):
-        self._add_event(time, func, arg, device)
+    def register_event_at(self, time, func, arg, device, sort_key=None):
+        """<sort_key>, if given, must come from reserve_sort_keys()"""
+        assert sort_key is None or device is None, "Device events can't use reserved sort keys"  # As they'd confuse cancel_events_for_device()
+        self._add_event(time, func, arg, device, sort_key)
+
+    def register_event_next(self, func, arg):
+        """Run func(arg) straight after the current event, before any other event (even one at the same time).
+           Such events run in the order they're registered."""
+        assert threading.get_ident() == self.sim_thread, "register_event_next() must be called from the simulation thread"
+        self.next_events.append((func, arg))
+
+    def reserve_sort_keys(self, n):
+        """Reserve <n> consecutive sort keys, returning the first. Registering an event later with one of these
+           as its <sort_key> makes it run, among events at the same time, as if it had been registered now."""
+        skc = self.sort_key_count
+        self.sort_key_count += n
+        assert self.sort_key_count <= SKC_MASK + 1, "Sort key count overflow"
+        return skc
         
     def register_event_in(self, deltaTime, func, arg, device):
         assert deltaTime >= 0
@@ -271,6 +591,42 @@ class Sim(Engine):
             logging.warning("Delay of more than 10y passed to register_event_in() - you probably meant to use register_event_at()")
         self._add_event(self.get_now() + deltaTime, func, arg, device)
 
+    def get_checkpoint(self):
+        """Return the state of the event queue (see checkpoint.py)"""
+        self.drain_inbox()
+        live = [self._unpack(e) for e in self.events if not self._is_cancelled(e)]
+        return {
+            "sim_time" : self.sim_time,
+            "sort_key_count" : self.sort_key_count,
+            "callbacks" : self.callbacks,
+            "events" : live,
+            "next_events" : list(self.next_events),
+            "output_from" : self.output_from,
+            "muting" : self.muting }
+
+    def restore_checkpoint(self, state):
+        """Replace the event queue (and so any events already scheduled) with one from get_checkpoint()"""
+        self.events = scheduler.get_scheduler(self.params)
+        self.clear_side_tables()
+        self.callbacks = state["callbacks"]
+        self.callback_ids = {f : i for (i, f) in enumerate(self.callbacks) if f is not None}
+        for (t, skc, func, arg, dev) in state["events"]:
+            self._push(t, func, arg, dev, skc)
+        self.next_events = collections.deque(state["next_events"])
+        self.sort_key_count = state["sort_key_count"]
+        self.sim_time = state["sim_time"]
+        self.start_time = self.sim_time
+        self.output_from = max(self.output_from, state["output_from"])
+        self.muting = self.muting or state["muting"]
+
+    def mute_output_until(self, t):
+        self.output_from = max(self.output_start, t)
+        self.muting = True
+
+    def output_muted(self, t):
+        """True if a message timestamped <t> would not be output. Only call if self.muting is True (else nothing is muted)."""
+        return t < self.output_from or t >= self.output_end
+
     def warn_not_keeping_up(self):
         if self.last_nku_warning < time.time() - 60:    # Warn every minute if we're not keeping up
             behind = int(time.time() - self.sim_time)
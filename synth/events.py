@@ -46,11 +46,44 @@ Actions
 Create a device::
 
     "create_device" : {
+        "functions" : {
+                ...
+        },
+        "lazy" : true   # (optional) See below
+    }
+
+Creating a device runs all of its start-up code and sends its initial properties. With "lazy", the action itself
+just records a stub for the device (a note of its parameters), and the device is materialised by an event of its own,
+which runs straight after the action and before any other event. So each device is still created at its scheduled time
+and in the same order, and the output is the same as without "lazy", but a large create_devices action no longer
+constructs its whole fleet within a single event. Lookups (e.g. by a change_property action) only find devices which
+have been materialised. The only thing which materialises a stub sooner is a stop_device which selects the oldest device,
+when that is the stub, and then just that device is materialised.
+
+A device can also be given "stop_at" : "time_specification". At that time the oldest device which hasn't yet been stopped
+is stopped (which is the device itself only if every older device has already been stopped).
+
+Create many identical devices at once::
+
+    "create_devices" : {
+        "count" : 100000,
         "functions" : {
                 ...
         }
     }
 
+This creates the same devices as a create_device action with "repeats" : 100000 (and no interval), but works out
+their device class just once, and tells the client about them in a single add_devices() call. It takes the
+same other parameters as create_device.
+
+Stop a device (removing all its pending events, so it sends nothing more)::
+
+    "stop_device" : {
+        "select" : "oldest",                        # (optional) Which device to stop: "oldest" (the default), "newest" or "random"
+        "identity_property" : "name_of_property",   # (optional) Only choose from devices with this value of this property
+        "identity_value" : value_of_property
+    }
+
 Change arbitrary device properties with arbitrary timestamps::
 
     "change_property" : {
@@ -68,13 +101,14 @@ Execute an action on whichever Synth client is in use (e.g. aws, devicepilot, fi
         <whatever parameters it expects>
     }
 
-Get Synth to run a query on the historical data it has just generated [TODO: code not yet complete!]::
+Get Synth to run a query on the data it generates (see common/query.py). The query is evaluated on each event as it happens,
+logging matches as it goes, and at the time of the action it reports its results so far (including each device's latest event)::
 
     "query" : {
         "expression" : "$ts < ago(30)"
     }
 
-Install an anomaly-analyser::
+Install an anomaly-analyser (as a stage in the message pipeline - see pipeline.py)::
 
     "install_analyser" {
     }
@@ -100,30 +134,37 @@ Install an anomaly-analyser::
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
-# TODO: Started writing a "sharding" mechanism, to split a Synth run across multiple instances. But not finished as
-#       for now it's good-enough to create large loads by just "exploding" device IDs 
-#       (so an explode factor of 100 will generate 100 output devices for every 1 simulated device, and they'll be identical (apart from id))
-# 
+# To create large loads you can either "explode" device IDs
+# (so an explode factor of 100 will generate 100 output devices for every 1 simulated device, and they'll be identical (apart from id))
+# or split the run across several processes with "shards" (see shard.py), which gives genuinely different devices.
+#
 import os, errno
 import sys
 import time
 from datetime import datetime
 import logging
 import json
-import pendulum, isodate
+import isodate
 import device_factory
 import model
+import pipeline
 from common import query
 from common import evt2csv
 from common import ISO8601
 from common import conftime
+from common import exploded
+from common import evb
+from common import repeat_time
+from common import background_writer
 from analysis import analyse
-import functools
 
 LOG_DIRECTORY = "../synth_logs/"
 
 METADATA_DIRECTORY = "/tmp/synth_metadata/"
 
+def log_query_match(properties):
+    logging.info("Query match "+str(properties))
+
 def mkdir_p(path):
     try:
         os.makedirs(path)
@@ -138,30 +179,49 @@ class Events():
     def __init__(self, client, engine, instance_name, context, eventList):
         """<params> is a list of events. Note that our .event_count property is read from outside."""
         def update_callback(device_id, time, properties):
-            if self.mute_until > time:
+            if engine.muting and engine.output_muted(time):
                 return
 
-            for c in self.update_callbacks:
-                properties.update(c(properties))  # We MERGE the results of the callback with the original message
+            if self.pipeline.stages:
+                self.pipeline.process(properties)
+                send(device_id, time, properties)
+                if self.pipeline.pending:
+                    self.pipeline.send_pending()
+            else:
+                send(device_id, time, properties)
+
+        def send_pipeline_result(message, result):
+            """Send the result of a batched or worker pipeline stage as a message of its own"""
+            props = result.copy()
+            props["$id"] = message["$id"]
+            props["$ts"] = message["$ts"]
+            send(props["$id"], props["$ts"], props)
 
+        def send(device_id, time, properties):
             if self.explode_factor is None:
                 if self.do_write_log:
                     write_event_log(properties)
+                for q in self.queries:
+                    q.consume(properties)
                 client.update_device(device_id, time, properties)
-            else:
-                new_props = properties.copy()
-                for i in range(self.explode_factor):
-                    eid = str(device_id) + "_" + str(i)    # Each exploded device is identical, except for trailing "-N" ID (and label, if exists)
-                    new_props["$id"] = eid
-                    if "label" in new_props:
-                        new_props["label"] = properties["label"] + "_" + str(i) 
-                    if self.do_write_log:
-                        write_event_log(new_props)
-                    client.update_device(eid, time, new_props)
-
-        def query_action(params):
-            events = evt2csv.read_evt_str("".join(self.logtext))
-            query.do_query(params, events)
+            else:   # Each exploded device is identical, except for trailing "_N" ID (and label, if exists), so we pass them around as one batch
+                batch = exploded.ExplodedBatch(device_id, time, properties, self.explode_factor)
+                if self.do_write_log:
+                    if self.binary_log:
+                        for (_, props) in batch:
+                            self.logfile.write_event(props)
+                    else:
+                        self.logfile.write("".join(batch.render(evt2csv.format_evt_line)))
+                    self.event_count += len(batch)
+                for q in self.queries:
+                    for (_, props) in batch:
+                        q.consume(props)
+                client.update_device_exploded(batch)
+
+        def query_action(q):
+            logging.info("Running query ("+q.expression+") on "+str(q.num_events)+" events from "+str(len(q.windows))+" devices")
+            latest = q.finish(engine.get_now())
+            logging.info("Query has found "+str(q.num_matches)+" matches so far, plus "+str(latest)+" among the latest events")
             
         def change_property_action(params):
             def set_it(d):
@@ -172,10 +232,10 @@ class Events():
                     d.set_property(params["property_name"], params["property_value"], timestamp=ts)
                     logging.info("Set property "+str(params["property_name"])+" on device "+d.get_property("$id")+" to "+str(params["property_value"]))
 
-            d = device_factory.get_devices_by_property( params["identity_property"], params["identity_value"])
+            identity = { params["identity_property"] : params["identity_value"] }
             if "identity_property2" in params:
-                d2 = device_factory.get_devices_by_property( params["identity_property2"], params["identity_value2"])
-                d = list(set(d) & set(d2))
+                identity[params["identity_property2"]] = params["identity_value2"]
+            d = device_factory.get_devices_by_properties(identity)
             logging.info("change property acting on "+str(len(d))+" matching devices")
 
             if "$ts" in params:
@@ -214,60 +274,119 @@ class Events():
             else:
                 logging.error("Ignoring action '"+str(name)+"' as client "+str(client.__class__.__name__)+" does not support it")
 
-        @functools.lru_cache(maxsize=128)
-        def dt_string(t):
-            return pendulum.from_timestamp(t).to_datetime_string() + " "    # For some reason, this is very slow
-
         def write_event_log(properties):
-            """Write .evt entry"""
-            s = dt_string(properties["$ts"])
-
-            for k in sorted(properties.keys()):
-                s += str(k) + ","
-                try:
-                    s += json.dumps(properties[k])  # Use dumps not str so we preserve type in output
-                    # s += properties[k].encode('ascii', 'ignore') # Python 2.x barfs if you try to write unicode into an ascii file
-                except:
-                    logging.error("Encoding error in events.py::write_event_log")
-                    s += "<unicode encoding error>"
-                s += ","
-            s += "\n"
-            self.logfile.write(s)
-
+            """Write .evt (or .evb) entry"""
+            if self.binary_log:
+                self.logfile.write_event(properties)
+            else:
+                self.logfile.write(evt2csv.format_evt_line(properties))
             self.event_count += 1
 
         def mute_for(params):
             assert "delta" in params, "Need to specify mute_for 'delta'"
             dt = isodate.parse_duration(params["delta"]).total_seconds()
             logging.info("Muting output for " + str(params["delta"]))
-            self.mute_until = engine.get_now() + dt
+            engine.mute_output_until(engine.get_now() + dt)
  
         restart_log = context.get("restart_log", True)
         self.do_write_log = context.get("write_log", True)
-        shard_size = context.get("shard_size", None)
-        shard_start = context.get("shard_start", 0) # If not specified, we are shard 0, so get to create the other shards
+        compress_log = context.get("event_log_compress", False)   # gzip the event log (adding .gz to its name)
+        log_format = context.get("event_log_format", "evt")
+        assert log_format in ["evt", "binary"], "event_log_format must be 'evt' or 'binary'"
+        self.binary_log = log_format == "binary"
         self.explode_factor = context.get("explode_factor", None)
         if self.explode_factor is not None:
             logging.info("Running with explode_factor="+str(self.explode_factor))
 
         self.event_count = 0
-        self.update_callbacks = []
-        device_count = 0   # Used to shard device creation
-
-        self.mute_until = 0
+        self.pipeline = pipeline.Pipeline(context.get("pipeline", []), send_pipeline_result)   # See pipeline.py
+        self.queries = []   # Each query is evaluated as events happen, so it needs to see them all from the start
 
         if self.do_write_log:
             mkdir_p(LOG_DIRECTORY)
             self.file_mode = "at"
             if restart_log:
                 self.file_mode = "wt"
-            self.logfile = open(LOG_DIRECTORY+instance_name+".evt", self.file_mode)    # This was unbuffered, but Python3 now doesn't allow text files to be unbuffered
-            self.logfile.write("*** New simulation starting at real time "+datetime.now().ctime()+" (local)\n")
+            header = "*** New simulation starting at real time "+datetime.now().ctime()+" (local)"
+            suffix = ".gz" if compress_log else ""
+            if self.binary_log:
+                self.logfile = evb.Writer(LOG_DIRECTORY+instance_name+".evb"+suffix, self.file_mode.replace("t", "b"), compress_log)
+                self.logfile.write_comment(header)
+            else:   # Written on a background thread (see background_writer.py)
+                self.logfile = background_writer.File(LOG_DIRECTORY+instance_name+".evt"+suffix, self.file_mode, compress_log)
+                self.logfile.write(header+"\n")
         else:
             self.logfile = None
             logging.info("Not writing an event log")
 
-        self.logtext = []   # TODO: Probably a Bad Idea to store this in memory. Instead when we want this we should probably close the logfile, read it and then re-open it. We store as an array because appending to a large string gets very slow
+        def query_action_for(params):
+            the_query = query.StreamingQuery(params, on_match=log_query_match)
+            self.queries.append(the_query)
+            return (query_action, the_query)
+
+        def install_analyser(params):
+            logging.info("Installing analyser")
+            self.analyser = analyse.Analyser()
+            self.pipeline.add("install_analyser", self.analyser)
+            return None     # Nothing to schedule
+
+        # Built-in actions, in order of precedence: name -> function which takes the action's parameters and returns the (callback, arg) to schedule
+        # TODO: Make these plug-in too?
+        builtin_actions = {
+            "create_device" : lambda p: (device_factory.create_device, (instance_name, client, engine, update_callback, context, p)),
+            "create_devices" : lambda p: (device_factory.create_devices, (instance_name, client, engine, update_callback, context, p)),
+            "stop_device" : lambda p: (device_factory.stop_device, (engine, p)),
+            "mute_for" : lambda p: (mute_for, p),
+            "use_model" : lambda p: (model.use_model, (instance_name, client, engine, update_callback, context, p)),
+            "query" : query_action_for,
+            "change_property" : lambda p: (change_property_action, p),
+            "install_analyser" : install_analyser,
+            "periodic_metadata" : lambda p: (dump_periodic_metadata, p)
+        }
+
+        def compile_action(action):
+            """Return the (callback, arg) to schedule for <action>, or None"""
+            if action is None:
+                return None
+            for name in builtin_actions:
+                if name in action:
+                    return builtin_actions[name](action[name])
+            name = list(action.keys())[0]   # Plug-in actions
+            if not name.startswith("client."):
+                logging.error("Unrecognised action " + name)
+                assert(False)
+            return (client_action, (name[7:], action[name]))
+
+        def schedule_repeats(t, callback, arg, repeats, interval):
+            """Schedule <callback>(<arg>) at <t>, repeating <repeats> times in all, every <interval>.
+               Each repeat is only registered when the previous one runs, so startup time and memory don't depend on <repeats>."""
+            if repeats <= 0:
+                return
+            if repeats == 1:
+                engine.register_event_at(t, callback, arg, None)
+                return
+            first_key = engine.reserve_sort_keys(repeats)   # So each repeat runs in the same order, relative to other events at the same time, as if registered now
+            engine.register_event_at(t, repeat, (callback, arg, interval, repeats, 0, t, first_key), None, first_key)
+
+        def repeat(state):
+            (callback, arg, interval, repeats, n, t, first_key) = state
+            n += 1
+            if n < repeats:
+                t += interval
+                engine.register_event_at(t, repeat, (callback, arg, interval, repeats, n, t, first_key), None, first_key + n)
+            callback(arg)
+
+        # Functions defined above which may be held by devices or pending events, so are referred to by name in a checkpoint (see checkpoint.py)
+        self.callables = {
+            "update_callback" : update_callback,
+            "send_pipeline_result" : send_pipeline_result,
+            "query_action" : query_action,
+            "change_property_action" : change_property_action,
+            "dump_periodic_metadata" : dump_periodic_metadata,
+            "client_action" : client_action,
+            "mute_for" : mute_for,
+            "repeat" : repeat
+        }
 
         at_time = engine.get_now()
         for event in eventList:
@@ -287,85 +406,35 @@ class Events():
             else:
                 at_time = ISO8601.to_epoch_seconds(timespec)
 
-            action = event.get("action", None)
             repeats = event.get("repeats", 1)    # MAY also specify a repeat and interval
-            interval = event.get("interval","PT0S")
+            interval = isodate.parse_duration(event.get("interval","PT0S")).total_seconds()
             time_advance = event.get("time_advance", True)
 
-            insert_time = at_time
-            while repeats > 0:
-                # Built-in actions. TODO: Make these plug-in too?
-                if action is None:
-                    pass
-                elif "create_device" in action:
-                    do_create = True                 # Is this device in our shard?
-                    if shard_size is not None:
-                        if device_count < shard_start:
-                            do_create = False
-                        if device_count >= shard_start + shard_size:
-                            do_create = False
-
-                        if shard_start == 0:    # We're the first shard
-                            if device_count > 0:
-                                if (device_count % shard_size) == 0:
-                                    logging.info("CREATE NEW SHARD for devices starting at "+str(device_count))
-                                    args = sys.argv.copy()
-                                    args = ["python3"] + args + ["{ shard_start : " + str(device_count) + " } "]
-                                    logging.info(str(args))
-
-                    if do_create:
-                        engine.register_event_at(insert_time, device_factory.create_device,
-                                             (instance_name, client, engine, update_callback, context, action["create_device"]),
-                                             None)
-
-                    device_count += 1
-                elif "stop_device" in action:
-                    engine.register_event_at(insert_time, device_factory.stop_device, (engine, action["stop_device"]), None)
-                elif "mute_for" in action:
-                    engine.register_event_at(insert_time, mute_for, action["mute_for"], None)
-                elif "use_model" in action:
-                    engine.register_event_at(insert_time,
-                            model.use_model,
-                            (instance_name, client, engine, update_callback, context, action["use_model"]), None)
-                elif "query" in action:
-                    engine.register_event_at(insert_time,
-                                             query_action,
-                                             action["query"],
-                                             None)
-                elif "change_property" in action:
-                    engine.register_event_at(insert_time,
-                                             change_property_action,
-                                             action["change_property"],
-                                             None)
-                elif "install_analyser" in action:
-                    logging.info("Installing analyser")
-                    self.analyser = analyse.Analyser()
-                    self.update_callbacks.append(self.analyser.process)
-                elif "periodic_metadata" in action:
-                    engine.register_event_at(insert_time, dump_periodic_metadata, action["periodic_metadata"], None)
-                else:   # Plug-in actions
-                    name = list(action.keys())[0]
-                    if not name.startswith("client."):
-                        logging.error("Unrecognised action " + name)
-                        assert(False)
-                    else:
-                        engine.register_event_at(insert_time,
-                                                 client_action,
-                                                 (name[7:], action[name]),
-                                                 None)
-##                    
-##                elif "delete_demo_devices" in action:
-##                    if "deleteDemoDevices" in dir(client):
-##                        client.deleteDemoDevices()
-##                else:
-##                    logging.warning("Ignoring unknown event action type "+str(event["action"]))
-
-                insert_time += isodate.parse_duration(interval).total_seconds()
-                repeats -= 1
+            to_schedule = compile_action(event.get("action", None))
+            if to_schedule is not None:
+                (callback, arg) = to_schedule
+                schedule_repeats(at_time, callback, arg, repeats, interval)
+
             if time_advance:
-                at_time = insert_time
+                at_time = repeat_time.repeated_sum(at_time, interval, repeats)  # Rounds exactly as adding one interval at a time, as repeat() does
+
+    def get_checkpoint(self):
+        return {
+            "event_count" : self.event_count,
+            "queries" : self.queries,
+            "pipeline" : self.pipeline,
+            "analyser" : getattr(self, "analyser", None) }
+
+    def restore_checkpoint(self, state):
+        self.event_count = state["event_count"]
+        self.queries = state["queries"]
+        self.pipeline = state["pipeline"]
+        if state["analyser"] is not None:
+            self.analyser = state["analyser"]
 
     def flush(self):
-        """Call at exit to clean up."""
+        """Call at exit to clean up. Waits until the event log is completely written."""
+        self.pipeline.close()
         if self.logfile is not None:
-            self.logfile.flush()
+            self.logfile.close(wait=True)
+            self.logfile = None
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+Pipeline
+========
+A pipeline of stages which every message passes through on its way from a device to the client (e.g. anomaly analysis).
+Declare stages in the parameters, in the order they should run::
+
+    "pipeline" : [
+        {
+            "class" : "analysis.analyse.Analyser",  # module.Class, with a process(message) method (see below)
+            "params" : {},                  # (optional) If given, passed to the class's constructor
+            "batch_size" : 1,               # (optional) Give the stage messages in batches of this many
+            "worker" : false,               # (optional) Run the stage in its own process
+            "max_batches_in_flight" : 4     # (optional) For a worker stage, how many batches may be outstanding before the simulation waits for it
+        }
+    ]
+
+A stage's process(message) returns a dict of properties (possibly empty). A stage may also have a process_batch(messages)
+method, which returns a list of such dicts, one per message.
+
+By default a stage runs in-line, and its results are merged into the message before it's sent (so the stage adds latency to every message).
+A batched or worker stage instead sees each message after it's been sent, and its results (if not empty) are sent later as separate
+messages, with the same $id and $ts as the message they came from. So heavy stages can run alongside the simulation rather than hold it up.
+Any outstanding batches are completed when the simulation ends.
+
+The "install_analyser" event action adds an in-line anomaly-analysis stage.
+At the end of the simulation, each stage's message count, throughput and latency are logged.
+"""
+#
+# Copyright (c) 2019 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import logging
+import importlib
+import multiprocessing
+import queue
+
+DEFAULT_MAX_BATCHES_IN_FLIGHT = 4
+WORKER_POLL_S = 1   # When waiting for a worker, how often to check it's still alive
+
+def load_class(path):
+    (module_name, class_name) = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+def make_stage(spec):
+    cls = load_class(spec["class"])
+    if "params" in spec:
+        return cls(spec["params"])
+    return cls()
+
+def run_batch(stage, messages):
+    if hasattr(stage, "process_batch"):
+        return stage.process_batch(messages)
+    return [stage.process(m) for m in messages]
+
+def worker_loop(spec, requests, results):
+    """Runs in the worker process"""
+    stage = make_stage(spec)
+    while True:
+        batch = requests.get()
+        if batch is None:
+            return
+        t = time.perf_counter()
+        out = run_batch(stage, batch)
+        results.put((out, time.perf_counter() - t))
+
+class Stage():
+    """Runs in-line. If batch_size is 1 its results are merged into each message, otherwise they're emitted later."""
+    def __init__(self, name, stage, batch_size=1):
+        self.name = name
+        self.stage = stage
+        self.batch_size = batch_size
+        self.in_line = batch_size == 1
+        self.batch = []
+        self.messages = 0
+        self.batches = 0
+        self.busy = 0.0     # Seconds spent in the stage
+        self.latency = 0.0  # Total seconds from each message arriving to its result being available
+
+    def process(self, properties, emit):
+        if self.in_line:
+            t = time.perf_counter()
+            result = self.stage.process(properties)
+            dt = time.perf_counter() - t
+            self.messages += 1
+            self.batches += 1
+            self.busy += dt
+            self.latency += dt
+            return result
+        self.batch.append((properties.copy(), time.perf_counter()))
+        if len(self.batch) >= self.batch_size:
+            self.flush(emit)
+        return None
+
+    def flush(self, emit):
+        if not self.batch:
+            return
+        batch = self.batch
+        self.batch = []
+        t = time.perf_counter()
+        out = run_batch(self.stage, [m for (m, _) in batch])
+        now = time.perf_counter()
+        self.busy += now - t
+        self.record(batch, out, now, emit)
+
+    def record(self, batch, out, now, emit):
+        self.messages += len(batch)
+        self.batches += 1
+        for ((message, t_in), result) in zip(batch, out):
+            self.latency += now - t_in
+            if result:
+                emit(message, result)
+
+    def close(self, emit):
+        self.flush(emit)
+
+    def report(self):
+        if self.messages == 0:
+            return "  " + self.name + ": no messages"
+        return "  {}: {} messages in {} batches, {:.0f} messages/s while busy, mean latency {:.1f}us".format(
+            self.name, self.messages, self.batches, self.messages / max(self.busy, 1e-9), 1e6 * self.latency / self.messages)
+
+class WorkerStage(Stage):
+    """Runs in its own process, so in parallel with the simulation"""
+    def __init__(self, name, spec, batch_size, max_in_flight):
+        super().__init__(name, None, batch_size)
+        self.in_line = False
+        self.max_in_flight = max_in_flight
+        self.in_flight = []     # Batches sent to the worker, oldest first (results come back in the same order)
+        self.times_blocked = 0
+        ctx = multiprocessing.get_context("spawn")  # Not fork, as this process has other threads running
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process_handle = ctx.Process(target=worker_loop, args=(spec, self.requests, self.results), name="pipeline "+name, daemon=True)
+        self.process_handle.start()
+
+    def flush(self, emit):
+        if not self.batch:
+            return
+        self.collect(emit, block=False)
+        if len(self.in_flight) >= self.max_in_flight:
+            self.times_blocked += 1
+            self.collect(emit, block=True, until=self.max_in_flight - 1)
+        self.requests.put([m for (m, _) in self.batch])
+        self.in_flight.append(self.batch)
+        self.batch = []
+
+    def collect(self, emit, block, until=0):
+        """Emit results of any finished batches. If <block> then wait until no more than <until> batches are outstanding."""
+        while self.in_flight:
+            if block and len(self.in_flight) > until:
+                try:
+                    (out, busy) = self.results.get(timeout=WORKER_POLL_S)
+                except queue.Empty:
+                    assert self.process_handle.is_alive(), "Pipeline worker "+self.name+" died"
+                    continue
+            else:
+                try:
+                    (out, busy) = self.results.get_nowait()
+                except queue.Empty:
+                    return
+            self.busy += busy
+            self.record(self.in_flight.pop(0), out, time.perf_counter(), emit)
+
+    def close(self, emit):
+        self.flush(emit)
+        self.collect(emit, block=True)
+        self.requests.put(None)
+        self.process_handle.join()
+
+    def report(self):
+        s = super().report()
+        if self.times_blocked:
+            s += ", simulation waited for it " + str(self.times_blocked) + " times"
+        return s
+
+class Pipeline():
+    def __init__(self, specs, send):
+        """<send>(message, result) is called to send the result of a batched or worker stage"""
+        self.send = send
+        self.stages = []
+        self.pending = []   # (message, result) from batched and worker stages, waiting to be sent
+        for spec in specs:
+            name = spec["class"]
+            batch_size = spec.get("batch_size", 1)
+            assert int(batch_size) == batch_size and batch_size >= 1, "Pipeline stage batch_size must be a positive integer"
+            if spec.get("worker", False):
+                max_in_flight = spec.get("max_batches_in_flight", DEFAULT_MAX_BATCHES_IN_FLIGHT)
+                assert max_in_flight >= 1, "Pipeline stage max_batches_in_flight must be at least 1"
+                self.stages.append(WorkerStage(name, spec, batch_size, max_in_flight))
+            else:
+                self.stages.append(Stage(name, make_stage(spec), batch_size))
+            logging.info("Pipeline stage "+name+" installed")
+
+    def add(self, name, stage):
+        """Add an in-line stage"""
+        self.stages.append(Stage(name, stage))
+
+    def emit(self, message, result):
+        self.pending.append((message, result))
+
+    def process(self, properties):
+        """Pass a message through each stage, merging the results of in-line stages into it.
+           Afterwards, once the message has been sent, call send_pending()."""
+        for s in self.stages:
+            result = s.process(properties, self.emit)
+            if result:
+                properties.update(result)  # We MERGE the results of the stage with the original message
+
+    def send_pending(self):
+        pending = self.pending
+        self.pending = []
+        for (message, result) in pending:
+            self.send(message, result)
+
+    def close(self):
+        """Finish any outstanding batches, and report"""
+        if not self.stages:
+            return
+        for s in self.stages:
+            s.close(self.emit)
+        self.send_pending()
+        logging.info("Pipeline stages:\n" + "\n".join([s.report() for s in self.stages]))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+Profiler
+========
+A low-overhead profiler which can be left running in a simulation. Enable it with a "profile" section in the parameters::
+
+    "profile" : {
+        "sample_interval" : "PT0.01S",  # (optional) How often to sample the simulation thread's stack
+        "summary_interval" : "PT1M",    # (optional) How often (in real time) to log a summary
+        "top" : 10                      # (optional) How many entries to include in each part of the summary
+    }
+
+It measures:
+
+    . A statistical sample of the simulation thread's call stack, written at exit to ../synth_logs/<instance>.folded
+      in the "folded stacks" format which flamegraph.pl and speedscope read
+    . For each event callback (e.g. "Heartbeat.tick_heartbeat"), how many times it ran and how long it took
+    . The latency of the client's update_device() (and update_device_exploded(), if explode_factor is set)
+
+Sending SIGUSR2 to a running Synth turns profiling on (with the above defaults, if there's no "profile" section),
+or if it's already on, logs a summary, writes the .folded file and turns it off.
+"""
+#
+# Copyright (c) 2019 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os, sys
+import time
+import logging
+import threading
+import isodate
+from directories import *
+
+DEFAULT_SAMPLE_INTERVAL = "PT0.01S"
+DEFAULT_SUMMARY_INTERVAL = "PT1M"
+DEFAULT_TOP = 10
+
+g_params = {}
+g_instance_name = None
+g_engine = None
+g_client = None
+g_running = False
+g_sim_thread = None     # Thread ident of the thread whose stack we sample
+g_stop = None           # threading.Event which stops the sampler thread
+g_sampler = None
+g_samples = {}          # Folded stack "a;b;c" -> count
+g_callbacks = {}        # Callback name -> [count, total seconds]
+CLIENT_METHODS = ["update_device", "update_device_exploded"]
+g_client_stats = {}     # Client method name -> [calls, total seconds, max seconds]
+g_start = None
+g_prev_wrapper = None
+g_prev_client_methods = {}  # Any of CLIENT_METHODS which the client instance already had in its __dict__ (else we revert to the class's method)
+
+def init(instance_name, params, engine, client):
+    """Called once the engine and client exist. Starts profiling if parameters ask for it."""
+    global g_instance_name, g_params, g_engine, g_client
+    g_instance_name = instance_name
+    g_params = params.get("profile", {})
+    g_engine = engine
+    g_client = client
+    if "profile" in params:
+        start()
+
+def callback_name(fn):
+    name = getattr(fn, "__qualname__", None)
+    if name is None:
+        return repr(fn)
+    if getattr(fn, "__self__", None) is None:   # Not a method, so qualify with its module
+        name = str(getattr(fn, "__module__", "")) + "." + name
+    return name
+
+def profiled_event(fn, arg, device):
+    """Engine hook: time each event, by callback"""
+    t = time.perf_counter()
+    if g_prev_wrapper:
+        g_prev_wrapper(fn, arg, device)
+    else:
+        fn(arg)
+    dt = time.perf_counter() - t
+    name = callback_name(fn)
+    c = g_callbacks.get(name)
+    if c is None:
+        g_callbacks[name] = [1, dt]
+    else:
+        c[0] += 1
+        c[1] += dt
+
+def profiled_client_method(method, stats):
+    def profiled(*args):
+        t0 = time.perf_counter()
+        result = method(*args)
+        dt = time.perf_counter() - t0
+        stats[0] += 1
+        stats[1] += dt
+        if dt > stats[2]:
+            stats[2] = dt
+        return result
+    return profiled
+
+def sample_loop(sample_interval, summary_interval):
+    next_summary = time.time() + summary_interval
+    while not g_stop.wait(sample_interval):
+        frame = sys._current_frames().get(g_sim_thread)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(os.path.basename(code.co_filename) + ":" + code.co_name)
+            frame = frame.f_back
+        key = ";".join(reversed(stack))
+        g_samples[key] = g_samples.get(key, 0) + 1
+        if time.time() >= next_summary:
+            log_summary()
+            next_summary = time.time() + summary_interval
+
+def start():
+    global g_running, g_sim_thread, g_stop, g_sampler, g_start, g_prev_wrapper
+    if g_running:
+        return
+    sample_interval = isodate.parse_duration(g_params.get("sample_interval", DEFAULT_SAMPLE_INTERVAL)).total_seconds()
+    summary_interval = isodate.parse_duration(g_params.get("summary_interval", DEFAULT_SUMMARY_INTERVAL)).total_seconds()
+    assert sample_interval > 0 and summary_interval > 0, "profile intervals must be positive durations"
+    logging.info("Profiling, sampling every "+str(sample_interval)+"s")
+    g_samples.clear()
+    g_callbacks.clear()
+    g_client_stats.clear()
+    g_start = time.time()
+
+    g_prev_wrapper = g_engine.event_wrapper
+    g_engine.event_wrapper = profiled_event
+    for name in CLIENT_METHODS:
+        g_prev_client_methods[name] = g_client.__dict__.get(name, None)
+        g_client_stats[name] = [0, 0.0, 0.0]
+        setattr(g_client, name, profiled_client_method(getattr(g_client, name), g_client_stats[name]))   # Instance attribute, so hides the method
+
+    g_sim_thread = threading.get_ident()
+    g_stop = threading.Event()
+    g_sampler = threading.Thread(target=sample_loop, args=(sample_interval, summary_interval), name="profiler", daemon=True)
+    g_sampler.start()
+    g_running = True
+
+def stop():
+    """Stop profiling, logging a final summary and writing the flamegraph file"""
+    global g_running
+    if not g_running:
+        return
+    g_stop.set()
+    g_sampler.join()
+    g_engine.event_wrapper = g_prev_wrapper
+    for name in CLIENT_METHODS:
+        if g_prev_client_methods[name] is None:
+            delattr(g_client, name)     # Revert to the method
+        else:
+            setattr(g_client, name, g_prev_client_methods[name])
+    g_running = False
+    log_summary()
+    write_flamegraph()
+
+def toggle():
+    """Called by the main loop, between events, after a SIGUSR2"""
+    if g_engine is None:
+        logging.warning("Simulation not yet started, so can't profile")
+    elif g_running:
+        stop()
+    else:
+        start()
+
+def log_summary():
+    top = g_params.get("top", DEFAULT_TOP)
+    elapsed = max(time.time() - g_start, 1e-9)
+    lines = ["Profile after "+str(int(elapsed))+"s:"]
+
+    lines.append("  Callbacks (events, events/s, total s, mean us):")
+    for (name, (count, total)) in sorted(list(g_callbacks.items()), key=lambda x: x[1][1], reverse=True)[:top]:
+        lines.append("    {:<60} {:>10} {:>10.0f} {:>9.2f} {:>9.1f}".format(name, count, count/elapsed, total, 1e6*total/count))
+
+    for name in CLIENT_METHODS:
+        (count, total, longest) = g_client_stats[name]
+        if count:
+            lines.append("  Client {}: {} calls, mean {:.1f}us, max {:.1f}us".format(name, count, 1e6*total/count, 1e6*longest))
+
+    self_samples = {}   # Leaf function -> samples
+    num_samples = 0
+    for (stack, n) in list(g_samples.items()):
+        leaf = stack.rsplit(";", 1)[-1]
+        self_samples[leaf] = self_samples.get(leaf, 0) + n
+        num_samples += n
+    if num_samples:
+        lines.append("  Hottest functions (% of "+str(num_samples)+" samples):")
+        for (leaf, n) in sorted(self_samples.items(), key=lambda x: x[1], reverse=True)[:top]:
+            lines.append("    {:<60} {:>5.1f}%".format(leaf, 100.0*n/num_samples))
+
+    logging.info("\n".join(lines))
+
+def write_flamegraph():
+    filename = LOG_DIR + g_instance_name + ".folded"
+    with open(filename, "wt") as f:
+        for (stack, n) in sorted(g_samples.items()):
+            f.write(stack + " " + str(n) + "\n")
+    logging.info("Wrote "+str(len(g_samples))+" sampled stacks to "+filename+" (view with e.g. flamegraph.pl or speedscope)")
+
+def close():
+    """Call at exit"""
+    stop()
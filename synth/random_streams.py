@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Random streams
+==============
+By default, devices share random number generators: the global one (i.e. the random module) and class generators
+such as Basic.myRandom, Charger.myRandom, Cluster.myRandom and Vending_machine.myRandom. So the numbers a device
+draws depend on what every other device drew before it, and changing the order in which events run (e.g. by adding
+a device) changes the behaviour of every other device too.
+
+Set "random_streams" : "counter" at the top level of the parameters and instead:
+
+    . Each device has its own counter-based stream (see common/rng.py) in place of each of those generators, keyed by
+      (the device's $id, the generator's name), so what it draws depends only on its own history. Devices draw from
+      self.random rather than the random module, and from self.random_of(C) rather than C.myRandom, which are these streams.
+    . Until a device has been created (so while choosing its $id, for example) it draws from the scenario's stream of
+      each generator instead. Every shard creates every device in the same order, so these are the same in every shard.
+    . Each variable of a Variable device has its own stream, keyed by ($id (or its randomness_property), variable name)
+
+The random module itself is left alone, so anything else which uses it is unaffected.
+
+Shards give each device its own streams in the same way, keyed by device number instead (see shard.py).
+
+A stream is just two integers, so every device can afford its own. It gives different (but equally random) results from the default, which is why it isn't the default.
+"""
+#
+# Copyright (c) 2019 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import random
+import logging
+from common import rng
+
+MODES = ["shared", "counter"]
+
+g_enabled = False
+g_global = None         # The scenario's stream in place of the random module
+g_names = {}            # Composite device class -> names of the classes whose myRandom its devices use
+
+def init(params):
+    """Call before any random numbers are drawn"""
+    global g_enabled, g_global
+    mode = params.get("random_streams", "shared")
+    assert mode in MODES, "random_streams must be one of "+str(MODES)
+    if mode != "counter":
+        return
+    logging.info("Using per-device counter-based random streams")
+    g_enabled = True
+    g_global = rng.Stream("global")
+
+def adopt_classes(classes):
+    """Replace the generators of <classes> (as used by devices which don't yet have their own) with the scenario's streams"""
+    for c in classes:
+        if "myRandom" in c.__dict__ and not isinstance(c.__dict__["myRandom"], rng.Stream):
+            c.myRandom = rng.Stream(c.__name__)
+        if c.__dict__.get("random") is random:
+            c.random = g_global
+
+def names_for(c):
+    if c not in g_names:
+        g_names[c] = [k.__name__ for k in c.__mro__ if "myRandom" in k.__dict__]
+    return g_names[c]
+
+def give_streams(device, *key):
+    """Give <device> its own stream in place of each shared generator, keyed by (<key>, the generator's name)"""
+    device.random = rng.Stream(*key, "global")
+    device.rng_streams = {name : rng.Stream(*key, name) for name in names_for(device.__class__)}
+
+def init_device(device):
+    """Give a newly-created device its own streams"""
+    if g_enabled:
+        give_streams(device, device.properties["$id"])
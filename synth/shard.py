@@ -0,0 +1,330 @@
+"""SHARD
+=====
+   Split one simulation run across several processes (one per CPU core).
+
+   Set "shards" : N at the top level of the scenario/account parameters. The Synth process you start
+   then becomes a coordinator: it pins the simulation start and end times, runs N copies of itself
+   (the shards, each with its own Sim engine and client) and, when they've all finished, merges their
+   outputs into a single time-ordered .evt file (and, for the filesystem client, JSON and CSV files).
+
+   How the work is split:
+
+    . Every shard executes every scenario event, and so creates every device, in exactly the same order.
+      So device IDs, labels, and anything else randomly chosen at creation time are identical in all shards.
+    . Device number n (in order of creation) belongs to shard n % N. In all other shards the device is
+      created but then "parked": its events are cancelled and its output is discarded.
+      Since creation is cheap compared to a device's lifetime of ticks, this divides most of the work by N.
+    . Once created, each device draws from its own counter-based stream in place of each shared random-number
+      generator (the global one, and any myRandom class generators such as Basic.myRandom or Charger.myRandom),
+      keyed by its device number (see random_streams.py). So a device's behaviour doesn't depend on
+      which other devices share its process, and results are identical regardless of shard count.
+      (With "random_streams" : "counter", devices already have their own streams, keyed by $id instead.)
+
+   Devices which read other devices' properties (e.g. aggregate, co2, hvac, disruptive) need to see devices
+   simulated by other shards. Set "shard_window" : "PT15M" (for example) and the shards then run in lock-step
+   windows of that length of simulated time, in the style of conservative parallel discrete-event simulation.
+   At each window boundary every shard publishes the properties which have changed on the devices it simulates,
+   waits for all the other shards to do the same, and copies their changes into its parked copies of those devices.
+   So a device sees a device in another shard as it was at most one window ago. By default only devices which
+   are part of a model are exchanged; set "shard_sync" : "all" to exchange every device.
+
+   Limitations:
+
+    . Without a shard_window, devices which read other devices' properties only see a parked device
+      as it was when created.
+    . With a shard_window, such devices see remote devices up to one window late, so results depend on
+      the window and on how devices are divided between shards.
+    . Randomness consumed by non-device events (e.g. external events arriving via ZeroMQ) is not per-device.
+    . "now"-relative event times are evaluated separately by each shard, so use absolute or relative-to-start times.
+    . end_after_events can't be used, because event counts are per-shard.
+    . The binary event log format can't be used, because shards are merged via their .evt files.
+   """
+#
+# Copyright (c) 2019 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os, sys, re, glob, shutil
+import json
+import time
+import logging
+import subprocess
+import isodate
+from datetime import datetime
+import device_factory
+import random_streams
+from common import ISO8601
+from common import conftime
+from common import evt2csv
+from common import json_writer
+from directories import *
+
+CHILD_HASH_SEED = "0"   # Some devices seed from hash(str), which otherwise differs per process
+SYNC_DIRECTORY = "/tmp/synth_shards/"   # Shards exchange property snapshots through files in here
+SYNC_POLL_S = 0.01
+SYNC_TIMEOUT_S = 600    # If another shard hasn't reached a window boundary in this long (real time), assume it has died
+POLL_CHILDREN_S = 1
+
+g_shard_count = None    # None if we're not sharding
+g_shard_index = None    # None if we're the coordinator (or not sharding)
+g_window = None         # Length of a synchronisation window in seconds, or None if shards don't synchronise
+g_sync_all = False      # Exchange all devices (else just those in a model)
+g_sync_dir = None
+g_last_sent = {}        # Device number -> properties as last published to the other shards
+
+def init(params):
+    global g_shard_count, g_shard_index, g_window, g_sync_all, g_sync_dir
+    g_shard_count = params.get("shards", None)
+    g_shard_index = params.get("shard_index", None)
+    if g_shard_count is not None:
+        assert int(g_shard_count) == g_shard_count and g_shard_count >= 1, "shards must be a positive integer"
+        assert params.get("engine", {}).get("end_after_events", None) is None, "Can't use end_after_events with shards"
+        assert params.get("event_log_format", "evt") == "evt", "Shards are merged via their .evt files, so can't use a binary event log"
+        assert not params.get("event_log_compress", False) and not params.get("client", {}).get("compress", False), "Shards are merged via their output files, so can't compress them"
+        if "shard_window" in params:
+            g_window = isodate.parse_duration(params["shard_window"]).total_seconds()
+            assert g_window > 0, "shard_window must be a positive duration"
+        sync = params.get("shard_sync", "model")
+        assert sync in ["model", "all"], "shard_sync must be 'model' or 'all'"
+        g_sync_all = sync == "all"
+        g_sync_dir = params.get("shard_sync_dir", None)
+        if g_shard_index is not None:
+            logging.info("Running as shard "+str(g_shard_index)+" of "+str(g_shard_count))
+
+def is_coordinator():
+    return g_shard_count is not None and g_shard_index is None
+
+def is_shard():
+    return g_shard_index is not None
+
+def instance_name(root, index=None):
+    """The instance name (and therefore log filenames) for a shard"""
+    if index is None:
+        index = g_shard_index
+    if index is None:
+        return root
+    return root + "_shard" + str(index)
+
+def owns(device_number):
+    """Does this process simulate device number <device_number>?"""
+    if g_shard_index is None:
+        return True
+    return (device_number % g_shard_count) == g_shard_index
+
+def discard_update(device_id, time, properties):
+    """Update callback for parked devices"""
+    pass
+
+# Per-device random streams
+
+def init_device(device, device_number):
+    """Give a newly-created device its own stream of each shared random generator"""
+    if g_shard_count is None or random_streams.g_enabled:  # random_streams already gives each device its own streams
+        return
+    random_streams.give_streams(device, "shard_rng", device_number)
+
+def install(engine):
+    if is_shard():
+        if g_window is not None and g_shard_count > 1:
+            logging.info("Synchronising shards every "+str(g_window)+"s of simulated time")
+            engine.register_event_at(engine.get_start_time() + g_window, sync_window, (engine, 1), None)
+
+# Window synchronisation
+
+def sync_filename(window, index):
+    return g_sync_dir + "window" + str(window) + "_shard" + str(index) + ".json"
+
+def collect_changes():
+    """Properties which have changed on the devices we simulate since we last published them, keyed by device number"""
+    changes = {}
+    for n, d in enumerate(device_factory.get_devices()):  # Every shard creates every device in the same order, so n is the device number
+        if d in device_factory.g_parked_devices:
+            continue
+        if not g_sync_all and d.model is None:
+            continue
+        props = d.get_properties()
+        last = g_last_sent.get(n, {})
+        diff = {}
+        for k, v in props.items():
+            if k not in last or last[k] != v:
+                diff[k] = v
+        if diff:
+            changes[n] = diff
+            g_last_sent[n] = props.copy()
+    return changes
+
+def apply_changes(changes):
+    devices = device_factory.get_devices()
+    for n, diff in changes.items():
+        d = devices[int(n)]
+        for (k, v) in diff.items():
+            if k in device_factory.g_index:
+                device_factory.reindex(d, k, v)
+        d.properties.update(diff)   # Parked copy, so just update it (don't transmit)
+
+def sync_window(args):
+    """Barrier at the end of each window: publish our changes, then wait for and apply everyone else's"""
+    (engine, window) = args
+    filename = sync_filename(window, g_shard_index)
+    open(filename + ".tmp", "wt").write(json.dumps(collect_changes()))
+    os.rename(filename + ".tmp", filename)  # So change is atomic (others mustn't read a partially-written file)
+
+    for i in range(g_shard_count):
+        if i == g_shard_index:
+            continue
+        other = sync_filename(window, i)
+        deadline = time.time() + SYNC_TIMEOUT_S
+        while not os.path.exists(other):
+            assert time.time() < deadline, "Timed-out waiting for shard "+str(i)+" to reach window "+str(window)
+            time.sleep(SYNC_POLL_S)
+        apply_changes(json.loads(open(other, "rt").read()))
+
+    if window > 1:  # Everyone has now read our previous window's file (they couldn't have written this window's file until they had)
+        os.remove(sync_filename(window-1, g_shard_index))
+    engine.register_event_at(engine.get_start_time() + (window+1) * g_window, sync_window, (engine, window+1), None)
+
+# Coordinator
+
+def pin_times(engine_params):
+    """Resolve relative start/end times once, so all shards simulate exactly the same period"""
+    result = {}
+    start = engine_params.get("start_time", "now")
+    result["start_time"] = ISO8601.epoch_seconds_to_ISO8601(int(conftime.richTime(start)))
+    end = engine_params.get("end_time", None)
+    assert end is not None, "Sharded simulations must have an end_time"
+    if end == "when_done":
+        result["end_time"] = end
+    elif end == "now":
+        result["end_time"] = ISO8601.epoch_seconds_to_ISO8601(int(time.time()))
+    else:
+        result["end_time"] = ISO8601.epoch_seconds_to_ISO8601(int(conftime.richTime(end)))
+    return result
+
+def evt_sort_key(line, line_number):
+    """Sort .evt lines by time, then device, then original order (which is consistent for any one device, whichever shard ran it)"""
+    ts = re.search(r"\$ts,([^,]*),", line)
+    the_id = re.search(r"\$id,(\"(?:[^\"\\]|\\.)*\"|[^,]*),", line)
+    ts = float(ts.group(1)) if ts else 0.0
+    the_id = str(json.loads(the_id.group(1))) if the_id else ""
+    return (ts, the_id, line_number)
+
+def merge_evt(instance, children):
+    lines = []
+    for child in children:
+        filename = LOG_DIR + child + ".evt"
+        if not os.path.exists(filename):
+            logging.warning("Missing shard event log "+filename)
+            continue
+        for n, line in enumerate(open(filename, "rt")):
+            if line.startswith("***") or line.strip() == "":
+                continue
+            lines.append((evt_sort_key(line, n), line))
+        os.remove(filename)
+    lines.sort(key=lambda x: x[0])
+    filename = LOG_DIR + instance + ".evt"
+    with open(filename, "wt") as f:
+        f.write("*** New simulation starting at real time "+datetime.now().ctime()+" (local) merged from "+str(len(children))+" shards\n")
+        for (_, line) in lines:
+            f.write(line)
+    logging.info("Merged "+str(len(lines))+" events into "+filename)
+    return filename
+
+def merge_json(instance, children, client_params):
+    events = []
+    for child in children:
+        files = sorted(glob.glob(LOG_DIR + "*" + child + "[0-9][0-9][0-9][0-9][0-9].json"), key=lambda f: f[-10:])    # Sort by file count, ignoring any prefix
+        for f in files:
+            for e in json.loads(open(f, "rt").read()):
+                events.append((e["$ts"], str(e["$id"]), len(events), e))
+            os.remove(f)
+    events.sort(key=lambda x: x[0:3])
+    stream = json_writer.Stream(instance,
+                ts_prefix = client_params.get("timestamp_prefix", False),
+                messages_prefix = client_params.get("messages_prefix", False),
+                max_events_per_file = client_params.get("max_events_per_file", json_writer.DEFAULT_MAX_EVENTS_PER_FILE))
+    for e in events:
+        props = e[3]
+        props["$ts"] = props["$ts"] / 1000.0    # Stream converts back to ms
+        stream.write_event(props)
+    stream.close()
+    logging.info("Merged "+str(len(events))+" JSON events")
+
+def coordinate(instance, params):
+    """Run all the shards and merge their results. Returns True if all succeeded."""
+    n = g_shard_count
+    overrides = { "engine" : pin_times(params.get("engine", {})) }
+    overrides["engine"]["exclusive_end_time"] = True    # Otherwise each shard would execute one event at the end time
+    if g_window is not None:
+        assert overrides["engine"]["end_time"] != "when_done", "Shards synchronising with a shard_window need a definite end_time"
+        overrides["shard_sync_dir"] = SYNC_DIRECTORY + instance + "/"
+        shutil.rmtree(overrides["shard_sync_dir"], ignore_errors=True)
+        os.makedirs(overrides["shard_sync_dir"])
+    client_params = params.get("client", {})
+    is_filesystem = client_params.get("type", None) == "filesystem"
+    if is_filesystem:
+        overrides["client"] = { "write_csv" : False }   # We'll write a CSV from the merged results instead
+    logging.info("Coordinating "+str(n)+" shards from "+overrides["engine"]["start_time"]+" to "+overrides["engine"]["end_time"])
+
+    env = os.environ.copy()
+    env["PYTHONHASHSEED"] = CHILD_HASH_SEED
+    children = []
+    processes = []
+    for i in range(n):
+        children.append(instance_name(instance, i))
+        o = dict(overrides, shard_index = i)
+        args = [sys.executable] + sys.argv + [json.dumps(o)]
+        logging.info("Starting shard "+str(i)+": "+" ".join(args))
+        processes.append(subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+    ok = True
+    running = set(range(n))
+    while running:
+        time.sleep(POLL_CHILDREN_S)
+        for i in sorted(running):
+            code = processes[i].poll()
+            if code is None:
+                continue
+            running.remove(i)
+            if code != 0:
+                logging.error("Shard "+str(i)+" failed with exit code "+str(code)+", see "+LOG_DIR+children[i]+".out")
+                if ok and running:
+                    logging.error("Stopping all other shards")  # They may be waiting for the failed one at a window boundary
+                    for j in running:
+                        processes[j].terminate()
+                ok = False
+            else:
+                logging.info("Shard "+str(i)+" finished")
+    if g_window is not None:
+        shutil.rmtree(overrides["shard_sync_dir"], ignore_errors=True)
+
+    if params.get("write_log", True):
+        evt_file = merge_evt(instance, children)
+    else:
+        evt_file = None
+    if is_filesystem:
+        merge_json(instance, children, client_params)
+        if client_params.get("write_csv", True):
+            if evt_file is None:
+                logging.warning("Can't write merged CSV file without an event log (write_log is false)")
+            else:
+                csv = evt2csv.convert_to_csv(evt2csv.read_evt_file(evt_file))
+                filename = LOG_DIR + client_params["filename"] + ".csv"
+                open(filename, "wt").write(csv)
+                logging.info("A total of "+str(csv.count("\n"))+" rows (including a header row) were written to "+filename)
+    return ok
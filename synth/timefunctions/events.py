@@ -19,6 +19,7 @@ import random
 class Events(Timefunction):
     def __init__(self, engine, device, params):
         self.engine = engine
+        self.device = device
         self.value = params.get("value", "event")
         self.interval = float(isodate.parse_duration(params.get("interval", "PT1D")).total_seconds())
         self.first_time_through = True
@@ -35,11 +36,11 @@ class Events(Timefunction):
         if t is None:
             t = self.engine.get_now()
 
-        delta = random.expovariate(1.0 / self.interval) # expovariate delivers long-tailed distribution between 0 and infinity, centred on given value
+        delta = self.device.random.expovariate(1.0 / self.interval) # expovariate delivers long-tailed distribution between 0 and infinity, centred on given value
         return t + delta
 
     def period(self):
-        delta = random.expovariate(1.0 / self.interval) # expovariate delivers long-tailed distribution between 0 and infinity, centred on given value
+        delta = self.device.random.expovariate(1.0 / self.interval) # expovariate delivers long-tailed distribution between 0 and infinity, centred on given value
         return delta
 
 